@@ -0,0 +1,200 @@
+"""
+Admission control: bound the requests served at once and shed the rest.
+
+Each route class has its own in-flight limit and bounded FIFO wait queue,
+and all classes share a global limit. When a slot frees up, waiters of
+higher-priority classes are admitted first, so cheap local reads are
+never starved by upstream-bound searches. Requests that find the queue
+full, or wait longer than the queueing deadline, are answered at once
+with 503 and Retry-After instead of timing out later.
+"""
+import asyncio
+import math
+import os
+from collections import deque
+from typing import Callable, Deque, Dict, List, Optional
+
+from fastapi.responses import JSONResponse
+
+from observability.metrics import Counter
+
+ADMISSION_MAX_IN_FLIGHT = int(os.environ.get('ADMISSION_MAX_IN_FLIGHT', '256'))
+ADMISSION_READ_LIMIT = int(os.environ.get('ADMISSION_READ_LIMIT', '256'))
+ADMISSION_SEARCH_LIMIT = int(os.environ.get('ADMISSION_SEARCH_LIMIT', '64'))
+ADMISSION_MAX_QUEUE = int(os.environ.get('ADMISSION_MAX_QUEUE', '128'))
+ADMISSION_QUEUE_TIMEOUT = float(os.environ.get('ADMISSION_QUEUE_TIMEOUT', '1'))
+ADMISSION_RETRY_AFTER = float(os.environ.get('ADMISSION_RETRY_AFTER', '1'))
+
+ADMISSION_REJECTED = Counter(
+    'admission_rejected_total',
+    'Requests shed by admission control, by route class and reason.',
+    ('route_class', 'reason'),
+)
+
+
+class Overloaded(Exception):
+
+    def __init__(self, reason: str, retry_after: float):
+        super().__init__(f"Over capacity ({reason})")
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class RouteClass:
+    """
+    Requests sharing an in-flight limit and a wait queue. Lower
+    ``priority`` values are admitted first.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        limit: int,
+        priority: int = 0,
+        max_queue: int = ADMISSION_MAX_QUEUE,
+        queue_timeout: float = ADMISSION_QUEUE_TIMEOUT,
+    ):
+        self.name = name
+        self.limit = limit
+        self.priority = priority
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.in_flight = 0
+        self._waiters: Deque[asyncio.Future] = deque()
+        # Metrics
+        self.admitted = 0
+        self.rejected = 0
+
+    @property
+    def queued(self) -> int:
+        # Waiters leave the queue when admitted, timed out or cancelled
+        return len(self._waiters)
+
+
+class AdmissionController:
+
+    def __init__(
+        self,
+        classes: List[RouteClass],
+        max_in_flight: int = ADMISSION_MAX_IN_FLIGHT,
+        retry_after: float = ADMISSION_RETRY_AFTER,
+    ):
+        self.classes: Dict[str, RouteClass] = {route_class.name: route_class for route_class in classes}
+        self._by_priority = sorted(classes, key=lambda route_class: route_class.priority)
+        self.max_in_flight = max_in_flight
+        self.retry_after = retry_after
+        self.in_flight = 0
+
+    def _has_room(self, route_class: RouteClass) -> bool:
+        return route_class.in_flight < route_class.limit and self.in_flight < self.max_in_flight
+
+    def _admit(self, route_class: RouteClass) -> None:
+        route_class.in_flight += 1
+        route_class.admitted += 1
+        self.in_flight += 1
+
+    def _reject(self, route_class: RouteClass, reason: str) -> Overloaded:
+        route_class.rejected += 1
+        ADMISSION_REJECTED.labels(route_class.name, reason).inc()
+        return Overloaded(reason, self.retry_after)
+
+    async def acquire(self, name: str) -> None:
+        """
+        Wait for a slot in route class ``name``.
+
+        Raises Overloaded if the wait queue is full or no slot frees up
+        within the class's queue timeout.
+        """
+        route_class = self.classes[name]
+        # Queued requests of the class go first, so admission stays FIFO
+        if self._has_room(route_class) and not route_class.queued:
+            self._admit(route_class)
+            return
+        if route_class.queued >= route_class.max_queue:
+            raise self._reject(route_class, 'queue_full')
+
+        waiter = asyncio.get_running_loop().create_future()
+        route_class._waiters.append(waiter)
+        try:
+            await asyncio.wait_for(waiter, route_class.queue_timeout)
+        except BaseException as exc:
+            if waiter.done() and not waiter.cancelled():
+                # Admitted just as the wait ended; give the slot back
+                self.release(name)
+            else:
+                waiter.cancel()
+                try:
+                    route_class._waiters.remove(waiter)
+                except ValueError:
+                    pass
+            if isinstance(exc, asyncio.TimeoutError):
+                raise self._reject(route_class, 'timeout') from None
+            raise
+
+    def release(self, name: str) -> None:
+        route_class = self.classes[name]
+        route_class.in_flight -= 1
+        self.in_flight -= 1
+        self._dispatch()
+
+    def _dispatch(self) -> None:
+        for route_class in self._by_priority:
+            waiters = route_class._waiters
+            while waiters and self._has_room(route_class):
+                waiter = waiters.popleft()
+                # Cancelled by a timeout whose waiting request has not resumed yet
+                if waiter.done():
+                    continue
+                self._admit(route_class)
+                waiter.set_result(None)
+            if self.in_flight >= self.max_in_flight:
+                return
+
+    def stats(self) -> Dict[str, dict]:
+        return {
+            name: {
+                'in_flight': route_class.in_flight,
+                'queued': route_class.queued,
+                'admitted': route_class.admitted,
+                'rejected': route_class.rejected,
+            }
+            for name, route_class in self.classes.items()
+        }
+
+
+class AdmissionMiddleware:
+    """
+    ASGI middleware holding a slot of the route class picked by
+    ``classify(method, path)`` for the whole request, streamed body
+    included. Requests classified as None are not controlled.
+    """
+
+    def __init__(
+        self,
+        app,
+        controller: AdmissionController,
+        classify: Callable[[str, str], Optional[str]],
+    ):
+        self.app = app
+        self.controller = controller
+        self.classify = classify
+
+    async def __call__(self, scope, receive, send):
+        name = self.classify(scope['method'], scope['path']) if scope['type'] == 'http' else None
+        if name is None:
+            await self.app(scope, receive, send)
+            return
+        try:
+            await self.controller.acquire(name)
+        except Overloaded as exc:
+            response = JSONResponse(
+                {"detail": "Server is over capacity, retry later"},
+                status_code=503,
+                headers={"Retry-After": str(math.ceil(exc.retry_after))},
+            )
+            await response(scope, receive, send)
+            return
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.controller.release(name)
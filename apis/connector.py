@@ -1,19 +1,347 @@
+import asyncio
+import logging
+import os
+import time
 from abc import ABC, abstractmethod
-from typing import Dict, List
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from typing import (
+    Any, AsyncIterator, Awaitable, Callable, Dict, FrozenSet, Iterable, Iterator, List, NamedTuple,
+    Optional, Pattern,
+)
+
+import aiohttp
+
+from apis.disk_cache import MISSING, NOT_FOUND, DiskCache
+from apis.exceptions import ConnectorFails, ConnectorTimeout, ConnectorUnavailable
+from apis.health import HealthController
+from apis.quota import BACKGROUND, current_priority
+from apis.http_session import HttpSessionRegistry, http_sessions
+from apis.retry import RetryPolicy, default_retry_policy, parse_retry_after
+from apis.streaming_json import ArrayStreamDecoder, TruncatedDocument
 from data.repository import Repository  # Assuming Repository is imported from the correct module
 from domain.models import Book  # Replace with your actual module name
+from observability.metrics import Histogram
+from observability.tracing import CLIENT, span
+
+logger = logging.getLogger(__name__)
+
+# Upper bound on books collected from one upstream search, across pages
+SEARCH_MAX_RESULTS = int(os.environ.get('SEARCH_MAX_RESULTS', '40'))
+STREAM_CHUNK_SIZE = 16 * 1024
+
+UPSTREAM_ATTEMPT_SECONDS = Histogram(
+    'upstream_attempt_duration_seconds',
+    'Time of a single upstream HTTP attempt, by origin and outcome.',
+    ('origin', 'status'),
+)
+UPSTREAM_REQUEST_SECONDS = Histogram(
+    'upstream_request_duration_seconds',
+    'Time of an upstream call including retries, by origin, outcome and attempts made.',
+    ('origin', 'status', 'attempts'),
+)
+
+
+# When the response to the latest upstream call made in this context was
+# fetched: now for a live call, the original fetch for a disk cache hit
+response_fetched_at: ContextVar[Optional[datetime]] = ContextVar('response_fetched_at', default=None)
+
+
+def utcnow() -> datetime:
+    # Naive UTC, which is what Mongo hands back for stored datetimes
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def outcome(exc: Optional[BaseException]) -> str:
+    """
+    Label an upstream call by its HTTP status, or by how it failed without one.
+    """
+    if exc is None:
+        return '200'
+    if isinstance(exc, ConnectorUnavailable):
+        return 'unavailable'
+    if isinstance(exc, ConnectorTimeout):
+        return 'timeout'
+    if isinstance(exc, ConnectorFails):
+        return str(exc.status) if exc.status else 'error'
+    if isinstance(exc, asyncio.CancelledError):
+        return 'cancelled'
+    return 'error'
+
+
+class Page(NamedTuple):
+    meta: Dict[str, Any]  # top-level members other than the item array
+    books: List[Book]
+    count: int  # items returned by the API, including those that were skipped
+
+
+def _encode_page(page: Page) -> dict:
+    return {
+        'meta': page.meta,
+        'books': [book.model_dump(mode='json') for book in page.books],
+        'count': page.count,
+    }
+
+
+def _decode_page(value: dict) -> Page:
+    return Page(value['meta'], [Book.model_validate(book) for book in value['books']], value['count'])
+
+
+class Capabilities(NamedTuple):
+    search_fields: FrozenSet[str] = frozenset()  # search params the API can filter on
+    id_pattern: Optional[Pattern] = None  # shape of the ids the API issues
+    cost: float = 1.0  # relative quota/billing weight of one search
+    latency: float = 1.0  # typical seconds for one search
 
 
 class RestConnector(ABC):
     repository: Repository  # Type hint for the repository attribute
     origin: str
+    capabilities: Capabilities = Capabilities()
+
+    def __init__(
+        self,
+        sessions: HttpSessionRegistry = http_sessions,
+        retry_policy: RetryPolicy = default_retry_policy,
+        health: Optional[HealthController] = None,
+        disk_cache: Optional[DiskCache] = None,
+    ):
+        self.sessions = sessions
+        self.retry_policy = retry_policy
+        # Each connector tracks the health of its own upstream
+        self.health = health or HealthController()
+        self.disk_cache = disk_cache
+
+    async def _make_request(self, url: str, params: dict, headers: dict) -> dict:
+        return await self._cached(
+            url, params, lambda: self._call(url, params, headers, lambda response: response.json())
+        )
+
+    async def _request_page(self, url: str, params: dict, headers: dict, key: str) -> Page:
+        """
+        Request a page of results, decoding the ``key`` array item by item as
+        the body arrives instead of buffering the whole response.
+        """
+        page = await self._cached(
+            url,
+            params,
+            lambda: self._call(url, params, headers, lambda response: self._read_page(response, key)),
+            encode=_encode_page,
+            decode=_decode_page,
+        )
+        for book in page.books:
+            book.fetched_at = response_fetched_at.get()
+        return page
+
+    async def _cached(
+        self,
+        url: str,
+        params: dict,
+        fetch: Callable[[], Awaitable[Any]],
+        encode: Optional[Callable[[Any], Any]] = None,
+        decode: Optional[Callable[[Any], Any]] = None,
+    ) -> Any:
+        """
+        Serve a call from the disk cache when one is configured, storing
+        fetched responses and 404s in it. Sets response_fetched_at.
+        """
+        cache = self.disk_cache
+        if cache is None:
+            result = await fetch()
+            response_fetched_at.set(utcnow())
+            return result
+        # Auth is sent in headers, so keys never end up in the cache
+        key = cache.key(self.origin, url, params)
+        # Background refreshes exist to pick up upstream changes
+        if current_priority.get() != BACKGROUND:
+            with span('disk cache'):
+                cached = await cache.get(key)
+            if cached is NOT_FOUND:
+                raise ConnectorFails("Not found upstream (cached)", status=404)
+            if cached is not MISSING:
+                # A hit is as fresh as the fetch that stored it, not as the read
+                response_fetched_at.set(datetime.fromisoformat(cached['fetched_at']))
+                return decode(cached['value']) if decode else cached['value']
+        try:
+            result = await fetch()
+        except ConnectorFails as exc:
+            if exc.status == 404:
+                cache.put_not_found(key)
+            raise
+        fetched_at = utcnow()
+        response_fetched_at.set(fetched_at)
+        cache.put(key, {'fetched_at': fetched_at.isoformat(), 'value': encode(result) if encode else result})
+        return result
+
+    async def _call(
+        self,
+        url: str,
+        params: dict,
+        headers: dict,
+        read: Callable[[aiohttp.ClientResponse], Awaitable[Any]],
+    ) -> Any:
+        attempts = 0
+
+        def attempt() -> Awaitable[Any]:
+            nonlocal attempts
+            attempts += 1
+            return self._attempt(url, params, headers, read)
+
+        started = time.perf_counter()
+        error: Optional[BaseException] = None
+        with span(f'upstream {self.origin}', CLIENT, url=url) as current:
+            try:
+                return await self.retry_policy.call(attempt)
+            except BaseException as exc:
+                error = exc
+                raise
+            finally:
+                UPSTREAM_REQUEST_SECONDS.labels(self.origin, outcome(error), attempts).observe(
+                    time.perf_counter() - started
+                )
+                if current is not None:
+                    current.set('attempts', attempts)
+                    current.set('status', outcome(error))
+
+    async def _attempt(
+        self,
+        url: str,
+        params: dict,
+        headers: dict,
+        read: Callable[[aiohttp.ClientResponse], Awaitable[Any]],
+    ) -> Any:
+        # Health is checked per attempt, so an opening circuit also ends retries
+        started = time.perf_counter()
+        error: Optional[BaseException] = None
+        with span('attempt'):
+            try:
+                return await self.health.call(lambda: self._request_once(url, params, headers, read))
+            except BaseException as exc:
+                error = exc
+                raise
+            finally:
+                UPSTREAM_ATTEMPT_SECONDS.labels(self.origin, outcome(error)).observe(time.perf_counter() - started)
+
+    async def _read_page(self, response: aiohttp.ClientResponse, key: str) -> Page:
+        decoder = ArrayStreamDecoder(key)
+        books: List[Book] = []
+        count = 0
+        try:
+            async for chunk in response.content.iter_chunked(STREAM_CHUNK_SIZE):
+                items = decoder.feed(chunk)
+                count += len(items)
+                books.extend(self._to_books(items))
+            items = decoder.close()
+        except TruncatedDocument as exc:
+            # The connection ended mid-body; a new attempt may get all of it
+            raise ConnectorFails(f"Incomplete response from the API: {exc}", retryable=True) from exc
+        except ValueError as exc:
+            raise ConnectorFails(f"Invalid response from the API: {exc}") from exc
+        count += len(items)
+        books.extend(self._to_books(items))
+        return Page(decoder.meta, books, count)
+
+    async def _request_once(
+        self,
+        url: str,
+        params: dict,
+        headers: dict,
+        read: Callable[[aiohttp.ClientResponse], Awaitable[Any]],
+    ) -> Any:
+        session = self.sessions.get(self.origin)
+        try:
+            async with session.get(url, params=params, headers=headers) as response:
+                if response.status != 200:
+                    raise ConnectorFails(
+                        "Failed to retrieve data from the API",
+                        status=response.status,
+                        retryable=self.retry_policy.is_retryable_status(response.status),
+                        retry_after=parse_retry_after(response.headers.get('Retry-After')),
+                    )
+                return await read(response)
+        except aiohttp.ClientResponseError as exc:
+            # Raised while reading a 200 (e.g. ContentTypeError); repeating the call gets the same body
+            raise ConnectorFails(f"Invalid response from the API: {exc.message}") from exc
+        except aiohttp.ClientError as exc:
+            raise ConnectorFails(str(exc) or exc.__class__.__name__, retryable=True) from exc
 
     @abstractmethod
-    def search(self, search_params: Dict) -> List[Book]:
+    def iter_search(self, search_params: Dict, limit: int = SEARCH_MAX_RESULTS) -> AsyncIterator[Book]:
+        """
+        Abstract method to iterate over every book matching the search parameters,
+        requesting further pages from the API as needed.
+
+        :param search_params: A dictionary of search parameters.
+        :param limit: Maximum number of books to yield.
+        :return: An async iterator of Book instances.
+        """
+        ...
+
+    async def search(self, search_params: Dict, limit: int = SEARCH_MAX_RESULTS) -> List[Book]:
         """
-        Abstract method to search through the repository using provided search parameters.
+        Search the API using provided search parameters.
 
         :param search_params: A dictionary of search parameters.
+        :param limit: Maximum number of books to return.
         :return: A list of Book instances that match the search criteria.
         """
+        books = {}
+        async for book in self.iter_search(search_params, limit):
+            books.setdefault(book.id, book)
+        return list(books.values())
+
+    def _to_books(self, items: Iterable[dict]) -> Iterator[Book]:
+        """
+        Convert API items, skipping the ones too incomplete to build a Book.
+        """
+        for item in items:
+            try:
+                yield self._to_book(item)
+            except (ValueError, TypeError, IndexError, AttributeError) as exc:
+                logger.debug("Skipping %s item: %s", self.origin, exc)
+
+    @abstractmethod
+    def _to_book(self, item: dict) -> Book:
+        """
+        Abstract method to build a Book from one item of an API response.
+        """
         ...
+
+    def translate(self, search_params: dict) -> Optional[dict]:
+        """
+        Rewrite search params into the ones this connector's search understands.
+
+        :return: The translated params, or None if the API cannot filter on
+            any of them and calling it would be wasted.
+        """
+        params = {
+            key: value for key, value in search_params.items()
+            if key in self.capabilities.search_fields
+        }
+        return params or None
+
+    def owns_id(self, book_id: str) -> bool:
+        """
+        Whether book_id looks like an identifier issued by this connector's API.
+        """
+        pattern = self.capabilities.id_pattern
+        return bool(pattern and pattern.match(book_id))
+
+    async def get_by_id(self, book_id: str) -> Optional[Book]:
+        """
+        Fetch a single book by the identifier issued by this connector's API.
+
+        :param book_id: The upstream identifier, as stored in Book.id.
+        :return: The Book, or None if the API does not know it.
+        """
+        return None
+
+    async def refresh(self, book: Book) -> Optional[Book]:
+        """
+        Fetch the current version of a book stored from this connector's API.
+
+        :param book: The stored copy.
+        :return: The current Book, the stored copy itself if the API's record
+            is too incomplete to replace it, or None if the API does not know it.
+        """
+        return await self.get_by_id(book.id)
@@ -0,0 +1,206 @@
+import asyncio
+import logging
+import os
+import sqlite3
+import time
+import zlib
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Optional, Set
+from urllib.parse import urlencode
+
+import orjson
+
+from observability.metrics import Counter
+
+logger = logging.getLogger(__name__)
+
+# SQLite file holding upstream responses across restarts; unset disables the cache
+UPSTREAM_DISK_CACHE_PATH = os.environ.get('UPSTREAM_DISK_CACHE_PATH')
+UPSTREAM_DISK_CACHE_TTL = float(os.environ.get('UPSTREAM_DISK_CACHE_TTL', str(24 * 3600)))
+# How long an upstream 404 is remembered
+UPSTREAM_DISK_CACHE_NEGATIVE_TTL = float(os.environ.get('UPSTREAM_DISK_CACHE_NEGATIVE_TTL', '3600'))
+UPSTREAM_DISK_CACHE_MAX_BYTES = int(os.environ.get('UPSTREAM_DISK_CACHE_MAX_BYTES', str(256 * 1024 * 1024)))
+COMPRESSION_LEVEL = 6
+# Compaction evicts down to this share of max_bytes, so it does not run on every write
+COMPACT_TARGET = 0.9
+
+MISSING = object()
+NOT_FOUND = object()
+
+DISK_CACHE_LOOKUPS = Counter(
+    'upstream_disk_cache_lookups_total',
+    'Upstream calls looked up in the disk cache, by result.',
+    ('result',),
+)
+_HITS = DISK_CACHE_LOOKUPS.labels('hit')
+_NOT_FOUND_HITS = DISK_CACHE_LOOKUPS.labels('not_found')
+_MISSES = DISK_CACHE_LOOKUPS.labels('miss')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS responses (
+    key TEXT PRIMARY KEY,
+    payload BLOB,
+    expires REAL NOT NULL,
+    accessed REAL NOT NULL,
+    size INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed);
+"""
+
+
+class DiskCache:
+    """
+    Persistent cache of upstream responses, so a restarted process can
+    answer repeated calls without the network.
+
+    Entries are zlib-compressed JSON in a SQLite file and expire after
+    ``ttl`` seconds; remembered 404s (stored without a payload) after
+    ``negative_ttl``. Once the payloads exceed ``max_bytes``, expired
+    entries and then the least recently read ones are deleted.
+
+    SQLite is only used from one worker thread: the file is opened on
+    first use, reads are awaited and writes are queued without waiting,
+    so the event loop never blocks on disk.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        ttl: float = UPSTREAM_DISK_CACHE_TTL,
+        negative_ttl: float = UPSTREAM_DISK_CACHE_NEGATIVE_TTL,
+        max_bytes: int = UPSTREAM_DISK_CACHE_MAX_BYTES,
+        clock: Callable[[], float] = time.time,
+    ):
+        self.path = path
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.max_bytes = max_bytes
+        self.clock = clock
+        self.size = 0
+        self._db: Optional[sqlite3.Connection] = None
+        self._broken = False
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='disk-cache')
+        self._writes: Set[Future] = set()
+        # Metrics
+        self.evictions = 0
+        self.errors = 0
+
+    @staticmethod
+    def key(origin: str, url: str, params: dict) -> str:
+        return f"{origin} {url}?{urlencode(sorted(params.items()))}"
+
+    def _connection(self) -> Optional[sqlite3.Connection]:
+        if self._db is None and not self._broken:
+            try:
+                directory = os.path.dirname(self.path)
+                if directory:
+                    os.makedirs(directory, exist_ok=True)
+                db = sqlite3.connect(self.path, isolation_level=None, check_same_thread=False)
+                # auto_vacuum only applies to new files; it lets compaction shrink them
+                db.execute('PRAGMA auto_vacuum=INCREMENTAL')
+                db.execute('PRAGMA journal_mode=WAL')
+                db.execute('PRAGMA synchronous=NORMAL')
+                db.executescript(SCHEMA)
+                self.size = db.execute('SELECT COALESCE(SUM(size), 0) FROM responses').fetchone()[0]
+                self._db = db
+            except (sqlite3.Error, OSError):
+                # A cache that cannot be opened is skipped, never fatal
+                logger.exception("Disabling the upstream disk cache at %s", self.path)
+                self._broken = True
+        return self._db
+
+    async def get(self, key: str) -> Any:
+        """
+        Return the cached response, NOT_FOUND for a remembered 404, or MISSING.
+        """
+        loop = asyncio.get_running_loop()
+        value = await loop.run_in_executor(self._executor, self._get, key)
+        if value is MISSING:
+            _MISSES.inc()
+        elif value is NOT_FOUND:
+            _NOT_FOUND_HITS.inc()
+        else:
+            _HITS.inc()
+        return value
+
+    def put(self, key: str, value: Any) -> None:
+        self._submit(self._put, key, value, self.ttl)
+
+    def put_not_found(self, key: str) -> None:
+        self._submit(self._put, key, NOT_FOUND, self.negative_ttl)
+
+    def _submit(self, func: Callable, *args: Any) -> None:
+        future = self._executor.submit(func, *args)
+        self._writes.add(future)
+        future.add_done_callback(self._writes.discard)
+
+    async def flush(self) -> None:
+        """
+        Wait for the writes queued so far.
+        """
+        if self._writes:
+            await asyncio.gather(*[asyncio.wrap_future(future) for future in list(self._writes)])
+
+    async def close(self) -> None:
+        await self.flush()
+        await asyncio.get_running_loop().run_in_executor(self._executor, self._close)
+        self._executor.shutdown(wait=False)
+
+    def _close(self) -> None:
+        if self._db is not None:
+            self._db.close()
+            self._db = None
+
+    def _get(self, key: str) -> Any:
+        db = self._connection()
+        if db is None:
+            return MISSING
+        now = self.clock()
+        try:
+            row = db.execute('SELECT payload, expires FROM responses WHERE key = ?', (key,)).fetchone()
+            if row is None or row[1] <= now:
+                return MISSING
+            db.execute('UPDATE responses SET accessed = ? WHERE key = ?', (now, key))
+            if row[0] is None:
+                return NOT_FOUND
+            return orjson.loads(zlib.decompress(row[0]))
+        except (sqlite3.Error, zlib.error, orjson.JSONDecodeError) as exc:
+            self.errors += 1
+            logger.warning("Unreadable disk cache entry %s: %s", key, exc)
+            return MISSING
+
+    def _put(self, key: str, value: Any, ttl: float) -> None:
+        db = self._connection()
+        if db is None:
+            return
+        try:
+            payload = None if value is NOT_FOUND else zlib.compress(orjson.dumps(value), COMPRESSION_LEVEL)
+            size = len(key) + (len(payload) if payload else 0)
+            now = self.clock()
+            previous = db.execute('SELECT size FROM responses WHERE key = ?', (key,)).fetchone()
+            db.execute(
+                'INSERT OR REPLACE INTO responses (key, payload, expires, accessed, size) VALUES (?, ?, ?, ?, ?)',
+                (key, payload, now + ttl, now, size),
+            )
+            self.size += size - (previous[0] if previous else 0)
+            if self.size > self.max_bytes:
+                self._compact(db, now)
+        except (sqlite3.Error, TypeError) as exc:
+            self.errors += 1
+            logger.warning("Could not write disk cache entry %s: %s", key, exc)
+
+    def _compact(self, db: sqlite3.Connection, now: float) -> None:
+        db.execute('DELETE FROM responses WHERE expires <= ?', (now,))
+        self.size = db.execute('SELECT COALESCE(SUM(size), 0) FROM responses').fetchone()[0]
+        excess = self.size - self.max_bytes * COMPACT_TARGET
+        if excess > 0:
+            evicted = []
+            for key, size in db.execute('SELECT key, size FROM responses ORDER BY accessed'):
+                evicted.append((key,))
+                excess -= size
+                if excess <= 0:
+                    break
+            db.executemany('DELETE FROM responses WHERE key = ?', evicted)
+            self.evictions += len(evicted)
+            self.size = db.execute('SELECT COALESCE(SUM(size), 0) FROM responses').fetchone()[0]
+        db.execute('PRAGMA incremental_vacuum')
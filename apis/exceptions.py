@@ -1,3 +1,38 @@
+from typing import Optional
+
 
 class ConnectorFails(Exception):
-    pass
\ No newline at end of file
+
+    def __init__(
+        self,
+        message: str = "Failed to retrieve data from the API",
+        status: Optional[int] = None,
+        retryable: bool = False,
+        retry_after: Optional[float] = None,
+    ):
+        super().__init__(message)
+        self.status = status
+        self.retryable = retryable
+        self.retry_after = retry_after
+
+
+class ConnectorUnavailable(ConnectorFails):
+
+    def __init__(self, message: str = "The API is unhealthy, call not attempted"):
+        super().__init__(message, retryable=False)
+
+
+class QuotaExhausted(ConnectorFails):
+
+    def __init__(
+        self,
+        message: str = "The API quota is spent until it resets",
+        retry_after: Optional[float] = None,
+    ):
+        super().__init__(message, status=429, retryable=False, retry_after=retry_after)
+
+
+class ConnectorTimeout(ConnectorFails):
+
+    def __init__(self, message: str = "Timed out waiting for the API"):
+        super().__init__(message, retryable=True)
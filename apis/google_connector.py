@@ -1,19 +1,46 @@
+import asyncio
 import logging
 import os
-from typing import Optional
+import re
+from typing import Any, AsyncIterator, Awaitable, Callable, Optional
 
 import aiohttp
-from retry import retry
+
 from domain.models import Book
-from apis.connector import RestConnector
-from apis.exceptions import ConnectorFails
+from apis.connector import SEARCH_MAX_RESULTS, Capabilities, RestConnector, response_fetched_at
+from apis.disk_cache import DiskCache
+from apis.exceptions import ConnectorFails, ConnectorUnavailable
+from apis.health import HealthController
+from apis.http_session import HttpSessionRegistry, http_sessions
+from apis.quota import QuotaScheduler
+from apis.retry import RetryPolicy, default_retry_policy
+from observability.tracing import span
 
 
 logger = logging.getLogger(__name__)
 logger.level = logging.INFO
 
 GOOGLE_API_KEY = os.environ.get('GOOGLE_API_KEY', None)
+# Optional comma separated keys to rotate between, each with its own quota
+GOOGLE_API_KEYS = os.environ.get('GOOGLE_API_KEYS', '')
+GOOGLE_QUOTA_PER_SECOND = float(os.environ.get('GOOGLE_QUOTA_PER_SECOND', '10'))
+GOOGLE_QUOTA_BURST = float(os.environ.get('GOOGLE_QUOTA_BURST', '10'))
+# Counted per process: split the key's quota between the processes using it
+GOOGLE_QUOTA_PER_DAY = int(os.environ.get('GOOGLE_QUOTA_PER_DAY', '1000'))
 GOOGLE_API_URL = os.environ.get('GOOGLE_API_URL', 'https://www.googleapis.com/books/v1/volumes')
+# Google APIs read the key from this header as from the `key` query parameter
+API_KEY_HEADER = 'X-Goog-Api-Key'
+# The volumes endpoint returns at most 40 items per page
+GOOGLE_PAGE_SIZE = 40
+# Partial responses: only the members _to_book reads are sent back
+VOLUME_FIELDS = (
+    'id,volumeInfo(title,subtitle,authors,categories,publishedDate,publisher,'
+    'description,imageLinks/thumbnail)'
+)
+SEARCH_FIELDS = f'totalItems,items({VOLUME_FIELDS})'
+
+# Google volume ids are 12 url-safe characters, e.g. "zyTCAlFPjgYC"
+VOLUME_ID_PATTERN = re.compile(r'^[A-Za-z0-9_-]{12}$')
 
 SEARCH_ATTRIBUTES = {
     'title': 'intitle',
@@ -25,9 +52,34 @@ SEARCH_ATTRIBUTES = {
 
 
 class GoogleBooksConnector(RestConnector):
+    # Searches are metered against the API key's daily quota
+    capabilities = Capabilities(
+        search_fields=frozenset({'title', 'author'}),
+        id_pattern=VOLUME_ID_PATTERN,
+        cost=2.0,
+        latency=0.4,
+    )
 
-    def __init__(self, api_key: str = GOOGLE_API_KEY):
-        self.api_key = api_key
+    def __init__(
+        self,
+        api_key: Optional[str] = None,
+        sessions: HttpSessionRegistry = http_sessions,
+        retry_policy: RetryPolicy = default_retry_policy,
+        health: Optional[HealthController] = None,
+        disk_cache: Optional[DiskCache] = None,
+        quota: Optional[QuotaScheduler] = None,
+    ):
+        super().__init__(sessions, retry_policy, health, disk_cache)
+        # An explicit key wins; otherwise rotate GOOGLE_API_KEYS, falling back to GOOGLE_API_KEY
+        if api_key:
+            keys = [api_key]
+        else:
+            keys = [key.strip() for key in GOOGLE_API_KEYS.split(',') if key.strip()]
+            keys = keys or ([GOOGLE_API_KEY] if GOOGLE_API_KEY else [])
+        self.api_key = next(iter(keys), None)
+        self.quota = quota or QuotaScheduler(
+            keys, GOOGLE_QUOTA_PER_SECOND, GOOGLE_QUOTA_PER_DAY, GOOGLE_QUOTA_BURST
+        )
         self.url = GOOGLE_API_URL
         self.origin = 'Google Books API'
 
@@ -36,30 +88,76 @@ class GoogleBooksConnector(RestConnector):
         Add authentication details to request parameters.
         """
         assert self.api_key, "API key is required"
-        headers = {'key': self.api_key}
+        headers = {API_KEY_HEADER: self.api_key}
         return headers
 
-    @retry(ConnectorFails, tries=3, delay=2)
-    async def _make_request(self, url: str, params: dict, headers: dict) -> dict:
-        async with aiohttp.ClientSession() as session:
-            async with session.get(url, params=params, headers=headers) as response:
-                if response.status != 200:
-                    raise ConnectorFails("Failed to retrieve data from the API")
-                return await response.json()
+    async def _attempt(
+        self,
+        url: str,
+        params: dict,
+        headers: dict,
+        read: Callable[[aiohttp.ClientResponse], Awaitable[Any]],
+    ) -> Any:
+        # Every attempt, retries included, spends quota: wait for a token
+        # before the health check so queueing is not taken for upstream latency
+        key = None
+        try:
+            with span('quota wait'):
+                key = await self.quota.acquire()
+            return await super()._attempt(url, params, {**headers, API_KEY_HEADER: key}, read)
+        except (ConnectorUnavailable, asyncio.CancelledError):
+            # Shed by the health check, or abandoned by the deadline or a faster source
+            if key is not None:
+                self.quota.release(key)
+            raise
 
-    async def search(self, search_params: dict) -> Optional[Book]:
+    async def iter_search(
+        self, search_params: dict, limit: int = SEARCH_MAX_RESULTS
+    ) -> AsyncIterator[Book]:
         headers = self._authenticate_request()
         search_params = self._format_search_params(search_params)
-        response = await self._make_request(self.url, params=search_params, headers=headers)
+        start = 0
+        while start < limit:
+            page_size = min(GOOGLE_PAGE_SIZE, limit - start)
+            params = {
+                **search_params,
+                'startIndex': start,
+                'maxResults': page_size,
+                'fields': SEARCH_FIELDS,
+            }
+            page = await self._request_page(self.url, params=params, headers=headers, key='items')
+            for book in page.books:
+                yield book
+            start += page.count
+            if page.count < page_size or start >= page.meta.get('totalItems', 0):
+                break
 
-        # TODO handle multiple books
-        data = response.get('items', [])
-        if not data:
+    async def get_by_id(self, book_id: str) -> Optional[Book]:
+        headers = self._authenticate_request()
+        try:
+            item = await self._make_request(
+                f"{self.url}/{book_id}", params={'fields': VOLUME_FIELDS}, headers=headers
+            )
+        except ConnectorFails as exc:
+            if exc.status == 404:
+                return None
+            raise
+        try:
+            if not item.get('volumeInfo'):
+                return None
+            book = self._to_book(item)
+        except (ValueError, TypeError, IndexError, AttributeError) as exc:
+            # Unusable like a bad search item, rather than a server error
+            logger.warning("Skipping %s volume %s: %s", self.origin, book_id, exc)
             return None
-        book_data = data[0].get('volumeInfo', {})
-        logger.info(f"Found book: {book_data}")
+        book.fetched_at = response_fetched_at.get()
+        return book
+
+    def _to_book(self, item: dict) -> Book:
+        book_data = item.get('volumeInfo', {})
+        logger.debug("Found book %s", item.get('id'))
         book = Book(
-            id=data[0].get('id'),
+            id=item.get('id'),
             title=book_data.get('title'),
             subtitle=book_data.get('subtitle', ''),
             authors=book_data.get('authors', []),
@@ -0,0 +1,200 @@
+import logging
+import os
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional, TypeVar
+
+from apis.exceptions import ConnectorFails, ConnectorUnavailable
+
+logger = logging.getLogger(__name__)
+
+CIRCUIT_FAILURE_THRESHOLD = int(os.environ.get('CIRCUIT_FAILURE_THRESHOLD', '5'))
+CIRCUIT_RESET_SECONDS = float(os.environ.get('CIRCUIT_RESET_SECONDS', '30'))
+CIRCUIT_HALF_OPEN_PROBES = int(os.environ.get('CIRCUIT_HALF_OPEN_PROBES', '1'))
+CONCURRENCY_INITIAL_LIMIT = float(os.environ.get('CONCURRENCY_INITIAL_LIMIT', '20'))
+CONCURRENCY_MIN_LIMIT = float(os.environ.get('CONCURRENCY_MIN_LIMIT', '1'))
+CONCURRENCY_MAX_LIMIT = float(os.environ.get('CONCURRENCY_MAX_LIMIT', '200'))
+# Completions slower than this count as congestion and shrink the limit
+CONCURRENCY_LATENCY_TARGET = float(os.environ.get('CONCURRENCY_LATENCY_TARGET', '2'))
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+_T = TypeVar('_T')
+
+
+class CircuitBreaker:
+    """
+    Stop calling an upstream after ``failure_threshold`` consecutive failures.
+
+    While open every call is rejected. After ``reset_timeout`` seconds the
+    breaker is half-open and lets ``half_open_probes`` calls through: a
+    successful probe closes it again, a failed one re-opens it.
+    """
+
+    def __init__(
+        self,
+        failure_threshold: int = CIRCUIT_FAILURE_THRESHOLD,
+        reset_timeout: float = CIRCUIT_RESET_SECONDS,
+        half_open_probes: int = CIRCUIT_HALF_OPEN_PROBES,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.half_open_probes = half_open_probes
+        self.clock = clock
+        self._state = CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probes = 0
+        # Metrics
+        self.opened = 0
+
+    @property
+    def state(self) -> str:
+        if self._state == OPEN and self.clock() - self._opened_at >= self.reset_timeout:
+            self._state = HALF_OPEN
+            self._probes = 0
+        return self._state
+
+    def allow(self) -> bool:
+        state = self.state
+        if state == CLOSED:
+            return True
+        if state == HALF_OPEN and self._probes < self.half_open_probes:
+            self._probes += 1
+            return True
+        return False
+
+    def release_probe(self) -> None:
+        """
+        Give back a probe slot whose call ended without a verdict.
+        """
+        if self._state == HALF_OPEN and self._probes:
+            self._probes -= 1
+
+    def record_success(self) -> None:
+        if self._state != CLOSED:
+            logger.info("Circuit closed")
+        self._state = CLOSED
+        self._failures = 0
+
+    def record_failure(self) -> None:
+        self._failures += 1
+        if self._state == HALF_OPEN or self._failures >= self.failure_threshold:
+            if self._state != OPEN:
+                self.opened += 1
+                logger.warning("Circuit opened after %s failures", self._failures)
+            self._state = OPEN
+            self._opened_at = self.clock()
+
+
+class AdaptiveLimiter:
+    """
+    AIMD limit on concurrent calls to an upstream.
+
+    Every fast, successful completion grows the limit by ``1 / limit``
+    (about one per round of calls); a failure or a completion slower than
+    ``latency_target`` multiplies it by ``backoff``. Calls over the limit
+    are rejected rather than queued.
+    """
+
+    def __init__(
+        self,
+        initial_limit: float = CONCURRENCY_INITIAL_LIMIT,
+        min_limit: float = CONCURRENCY_MIN_LIMIT,
+        max_limit: float = CONCURRENCY_MAX_LIMIT,
+        latency_target: float = CONCURRENCY_LATENCY_TARGET,
+        backoff: float = 0.5,
+    ):
+        self.limit = initial_limit
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.latency_target = latency_target
+        self.backoff = backoff
+        self.in_flight = 0
+
+    def try_acquire(self) -> bool:
+        if self.in_flight >= int(self.limit):
+            return False
+        self.in_flight += 1
+        return True
+
+    def release(self) -> None:
+        self.in_flight -= 1
+
+    def record(self, seconds: float, ok: bool) -> None:
+        if ok and seconds <= self.latency_target:
+            self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+        else:
+            self.limit = max(self.min_limit, self.limit * self.backoff)
+
+
+class HealthController:
+    """
+    Shed calls to a sick upstream before they are made.
+
+    Combines a circuit breaker with an adaptive concurrency limit. Only
+    failures that point at the upstream itself (timeouts, connection
+    errors, 429 and 5xx responses) count against it; a 404 is an answer.
+    """
+
+    def __init__(
+        self,
+        breaker: Optional[CircuitBreaker] = None,
+        limiter: Optional[AdaptiveLimiter] = None,
+    ):
+        self.breaker = breaker or CircuitBreaker()
+        self.limiter = limiter or AdaptiveLimiter()
+        # Metrics
+        self.rejected = 0
+        self.failures = 0
+
+    async def call(self, func: Callable[[], Awaitable[_T]]) -> _T:
+        if not self.breaker.allow():
+            self.rejected += 1
+            raise ConnectorUnavailable("Circuit open")
+        if not self.limiter.try_acquire():
+            self.breaker.release_probe()
+            self.rejected += 1
+            raise ConnectorUnavailable("Concurrency limit reached")
+
+        started = time.monotonic()
+        verdict = None
+        try:
+            result = await func()
+            verdict = True
+            return result
+        except ConnectorFails as exc:
+            verdict = not exc.retryable
+            raise
+        finally:
+            self.limiter.release()
+            elapsed = time.monotonic() - started
+            if verdict is None:
+                # Cancelled by a faster source or the request deadline: only
+                # a slow call says anything about the upstream, and a hanging
+                # one must still be able to open the circuit
+                if elapsed > self.limiter.latency_target:
+                    self.limiter.record(elapsed, False)
+                    self.failures += 1
+                    self.breaker.record_failure()
+                else:
+                    self.breaker.release_probe()
+            else:
+                self.limiter.record(elapsed, verdict)
+                if verdict:
+                    self.breaker.record_success()
+                else:
+                    self.failures += 1
+                    self.breaker.record_failure()
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            'circuit_state': self.breaker.state,
+            'circuit_opened': self.breaker.opened,
+            'concurrency_limit': self.limiter.limit,
+            'in_flight': self.limiter.in_flight,
+            'rejected': self.rejected,
+            'failures': self.failures,
+        }
@@ -0,0 +1,64 @@
+import os
+from typing import Dict, Optional
+
+import aiohttp
+
+HTTP_LIMIT = int(os.environ.get('HTTP_LIMIT', '100'))
+HTTP_LIMIT_PER_HOST = int(os.environ.get('HTTP_LIMIT_PER_HOST', '20'))
+HTTP_KEEPALIVE_TIMEOUT = float(os.environ.get('HTTP_KEEPALIVE_TIMEOUT', '30'))
+HTTP_DNS_CACHE_TTL = int(os.environ.get('HTTP_DNS_CACHE_TTL', '300'))
+HTTP_CONNECT_TIMEOUT = float(os.environ.get('HTTP_CONNECT_TIMEOUT', '3'))
+HTTP_READ_TIMEOUT = float(os.environ.get('HTTP_READ_TIMEOUT', '10'))
+
+
+class HttpSessionRegistry:
+    """
+    Keep-alive aiohttp sessions shared by every RestConnector.
+
+    One session is created lazily per name (usually the connector origin) and
+    reused until ``close`` is called on application shutdown.
+    """
+
+    def __init__(
+        self,
+        limit: int = HTTP_LIMIT,
+        limit_per_host: int = HTTP_LIMIT_PER_HOST,
+        keepalive_timeout: float = HTTP_KEEPALIVE_TIMEOUT,
+        dns_cache_ttl: int = HTTP_DNS_CACHE_TTL,
+        connect_timeout: float = HTTP_CONNECT_TIMEOUT,
+        read_timeout: float = HTTP_READ_TIMEOUT,
+    ):
+        self.limit = limit
+        self.limit_per_host = limit_per_host
+        self.keepalive_timeout = keepalive_timeout
+        self.dns_cache_ttl = dns_cache_ttl
+        self.timeout = aiohttp.ClientTimeout(
+            sock_connect=connect_timeout,
+            sock_read=read_timeout,
+        )
+        self._sessions: Dict[str, aiohttp.ClientSession] = {}
+
+    def _create_session(self) -> aiohttp.ClientSession:
+        connector = aiohttp.TCPConnector(
+            limit=self.limit,
+            limit_per_host=self.limit_per_host,
+            keepalive_timeout=self.keepalive_timeout,
+            ttl_dns_cache=self.dns_cache_ttl,
+            use_dns_cache=True,
+        )
+        return aiohttp.ClientSession(connector=connector, timeout=self.timeout)
+
+    def get(self, name: str) -> aiohttp.ClientSession:
+        session: Optional[aiohttp.ClientSession] = self._sessions.get(name)
+        if session is None or session.closed:
+            session = self._create_session()
+            self._sessions[name] = session
+        return session
+
+    async def close(self) -> None:
+        sessions, self._sessions = self._sessions, {}
+        for session in sessions.values():
+            await session.close()
+
+
+http_sessions = HttpSessionRegistry()
@@ -1,35 +1,143 @@
-import aiohttp
-from typing import Optional
+import asyncio
+import os
+import re
+from typing import AsyncIterator, List, Optional
 
-from retry import retry
-
-from apis.connector import RestConnector
+from apis.connector import SEARCH_MAX_RESULTS, Capabilities, RestConnector, response_fetched_at
+from apis.disk_cache import DiskCache
 from apis.exceptions import ConnectorFails
+from apis.health import HealthController
+from apis.http_session import HttpSessionRegistry, http_sessions
+from apis.retry import RetryPolicy, default_retry_policy
+from data.normalize import date_range
 from domain.models import Book
 
 
+OPEN_LIBRARY_URL = os.environ.get('OPEN_LIBRARY_URL', 'https://openlibrary.org')
+# Open Library work keys look like "OL45804W"
+WORK_ID_PATTERN = re.compile(r'^OL\d+W$')
+OPEN_LIBRARY_PAGE_SIZE = 20
+# search.json returns every edition key, ISBN, language... unless told otherwise
+SEARCH_FIELDS = ','.join([
+    'key', 'title', 'subtitle', 'author_name', 'subject', 'publish_date',
+    'first_publish_year', 'publisher', 'notes', 'cover_i',
+])
+
+
 class OpenLibraryConnector(RestConnector):
-    def __init__(self):
-        self.url = "https://openlibrary.org"
-        self.origin = "Open Library API"
+    capabilities = Capabilities(
+        search_fields=frozenset({'title', 'author', 'publication_date'}),
+        id_pattern=WORK_ID_PATTERN,
+        cost=1.0,
+        latency=1.2,
+    )
 
-    @retry(ConnectorFails, tries=3, delay=2)
-    async def _make_request(self, url: str, params: dict, headers: dict) -> dict:
-        async with aiohttp.ClientSession() as session:
-            async with session.get(url, params=params, headers=headers) as response:
-                if response.status != 200:
-                    raise ConnectorFails("Failed to retrieve data from the API")
-                return await response.json()
+    def __init__(
+        self,
+        sessions: HttpSessionRegistry = http_sessions,
+        retry_policy: RetryPolicy = default_retry_policy,
+        health: Optional[HealthController] = None,
+        disk_cache: Optional[DiskCache] = None,
+    ):
+        super().__init__(sessions, retry_policy, health, disk_cache)
+        self.url = OPEN_LIBRARY_URL
+        self.origin = "Open Library API"
 
-    async def search(self, search_params: dict) -> Optional[Book]:
+    async def iter_search(
+        self, search_params: dict, limit: int = SEARCH_MAX_RESULTS
+    ) -> AsyncIterator[Book]:
         search_url = f"{self.url}/search.json"
-        data = await self._make_request(search_url, params=search_params, headers={})
-        result = data.get('docs', [])
-        if not result:
-            return
-        book = self._to_book(result[0])
+        search_params = dict(search_params)
+        # Left by translate when the date is finer than the year searched upstream
+        published = search_params.pop('publication_date', None)
+        start, end = date_range(published)[:2] if published else (None, None)
+        # The page size must stay constant for page numbers to line up
+        page_size = min(OPEN_LIBRARY_PAGE_SIZE, limit)
+        page, fetched = 1, 0
+        while fetched < limit:
+            params = {**search_params, 'page': page, 'limit': page_size, 'fields': SEARCH_FIELDS}
+            result = await self._request_page(search_url, params=params, headers={}, key='docs')
+            for book in result.books[:limit - fetched]:
+                if start is None or start <= book.publication_date < end:
+                    yield book
+            fetched += result.count
+            page += 1
+            if result.count < page_size or fetched >= result.meta.get('numFound', 0):
+                break
+
+    def translate(self, search_params: dict) -> Optional[dict]:
+        params = super().translate(search_params)
+        if params and 'publication_date' in params:
+            # search.json has no date parameter; the year is a Solr field query
+            published = params.pop('publication_date')
+            try:
+                start, _, precision = date_range(published)
+            except ValueError:
+                return params or None
+            params['q'] = f'first_publish_year:{start.year}'
+            if precision != 'year':
+                # Kept for iter_search to narrow the year's results down
+                params['publication_date'] = published
+        return params
+
+    async def get_by_id(self, book_id: str) -> Optional[Book]:
+        work = await self._get_work(book_id)
+        if not work or not work.get('title') or not work.get('first_publish_date'):
+            return None
+        fetched_at = response_fetched_at.get()
+        book = self._work_to_book(book_id, work, await self._author_names(work))
+        book.fetched_at = fetched_at
         return book
 
+    async def refresh(self, book: Book) -> Optional[Book]:
+        work = await self._get_work(book.id)
+        if work is None:
+            return None
+        if not work.get('title'):
+            return book
+        # Many works have no first_publish_date; keep the stored date rather than the book
+        work = {**work, 'first_publish_date': work.get('first_publish_date') or book.publication_date}
+        return self._work_to_book(book.id, work, await self._author_names(work))
+
+    async def _get_work(self, book_id: str) -> Optional[dict]:
+        try:
+            return await self._make_request(f"{self.url}/works/{book_id}.json", params={}, headers={})
+        except ConnectorFails as exc:
+            if exc.status == 404:
+                return None
+            raise
+
+    async def _author_names(self, work: dict) -> List[str]:
+        authors = await asyncio.gather(*[
+            self._author_name(author.get('author', {}).get('key'))
+            for author in work.get('authors', [])
+        ])
+        return [name for name in authors if name]
+
+    async def _author_name(self, key: Optional[str]) -> Optional[str]:
+        if not key:
+            return None
+        author = await self._make_request(f"{self.url}{key}.json", params={}, headers={})
+        return author.get('name')
+
+    def _work_to_book(self, book_id: str, work: dict, authors: list) -> Book:
+        description = work.get('description', '')
+        if isinstance(description, dict):
+            description = description.get('value', '')
+        covers = [cover for cover in work.get('covers', []) if cover and cover > 0]
+        return Book(
+            id=book_id,
+            title=work.get('title'),
+            subtitle=work.get('subtitle'),
+            authors=authors,
+            categories=work.get('subjects', []),
+            publication_date=work.get('first_publish_date'),
+            editor='',
+            description=description,
+            image=f"http://covers.openlibrary.org/b/id/{covers[0]}-L.jpg" if covers else None,
+            origin=self.origin
+        )
+
     def _to_book(self, item: dict) -> Book:
         return Book(
             id=item.get('key').split('/')[-1],
@@ -37,8 +145,8 @@ class OpenLibraryConnector(RestConnector):
             subtitle=item.get('subtitle'),
             authors=item.get('author_name', []),
             categories=item.get('subject', []),
-            publication_date=item.get('publish_date', '')[0],
-            editor=item.get('publisher', '')[0],
+            publication_date=(item.get('publish_date') or [str(item.get('first_publish_year', ''))])[0],
+            editor=(item.get('publisher') or [''])[0],
             description=item.get('notes', ''),
             image=f"http://covers.openlibrary.org/b/id/{item.get('cover_i', '')}-L.jpg" if item.get('cover_i') else None,
             origin=self.origin
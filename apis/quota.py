@@ -0,0 +1,240 @@
+import asyncio
+import heapq
+import itertools
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+from dateutil import tz
+
+from apis.exceptions import QuotaExhausted
+
+# Lower values are served first
+INTERACTIVE = 0
+BACKGROUND = 10
+
+current_priority: ContextVar[int] = ContextVar('current_priority', default=INTERACTIVE)
+
+
+@contextmanager
+def priority_scope(priority: int) -> Iterator[None]:
+    """
+    Set the priority of every quota-limited call made inside the block.
+    """
+    token = current_priority.set(priority)
+    try:
+        yield
+    finally:
+        current_priority.reset(token)
+
+
+class TokenBucket:
+    """
+    Continuously refilled bucket: ``rate`` tokens per second, up to ``capacity``.
+    """
+
+    def __init__(self, rate: float, capacity: float, clock: Callable[[], float] = time.monotonic):
+        self.rate = rate
+        self.capacity = capacity
+        self.clock = clock
+        self._tokens = capacity
+        self._updated = clock()
+
+    def _refill(self) -> None:
+        now = self.clock()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def take(self) -> bool:
+        self._refill()
+        if self._tokens < 1:
+            return False
+        self._tokens -= 1
+        return True
+
+    def give_back(self) -> None:
+        self._tokens = min(self.capacity, self._tokens + 1)
+
+    def wait_time(self) -> float:
+        """
+        Seconds until a token is available.
+        """
+        self._refill()
+        return max(0.0, (1 - self._tokens) / self.rate)
+
+
+class DailyBucket:
+    """
+    Bucket of ``limit`` tokens refilled at once at midnight in ``timezone``,
+    matching how daily API quotas are reset.
+
+    Usage is counted in memory: it starts from zero on restart and is not
+    shared between processes, so ``limit`` should be the key's daily quota
+    divided by the number of processes using the key.
+    """
+
+    def __init__(
+        self,
+        limit: int,
+        timezone: str = 'America/Los_Angeles',
+        clock: Callable[[], float] = time.time,
+    ):
+        self.limit = limit
+        self.timezone = tz.gettz(timezone) or tz.UTC
+        self.clock = clock
+        self.used = 0
+        self._resets_at = self._next_reset()
+
+    def _next_reset(self) -> float:
+        now = datetime.fromtimestamp(self.clock(), self.timezone)
+        midnight = datetime.combine(now.date() + timedelta(days=1), datetime.min.time(), self.timezone)
+        return midnight.timestamp()
+
+    def _roll(self) -> None:
+        if self.clock() >= self._resets_at:
+            self.used = 0
+            self._resets_at = self._next_reset()
+
+    @property
+    def remaining(self) -> int:
+        self._roll()
+        return self.limit - self.used
+
+    def take(self) -> bool:
+        if self.remaining <= 0:
+            return False
+        self.used += 1
+        return True
+
+    def give_back(self) -> None:
+        self.used = max(0, self.used - 1)
+
+    def reset_in(self) -> float:
+        return max(0.0, self._resets_at - self.clock())
+
+
+class ApiKeyQuota:
+
+    def __init__(self, key: str, per_second: float, burst: float, per_day: int):
+        self.key = key
+        self.second = TokenBucket(per_second, burst)
+        self.day = DailyBucket(per_day)
+        self.granted = 0
+
+    def take(self) -> bool:
+        if self.day.remaining <= 0 or not self.second.take():
+            return False
+        self.day.take()
+        self.granted += 1
+        return True
+
+    def give_back(self) -> None:
+        self.second.give_back()
+        self.day.give_back()
+        self.granted -= 1
+
+
+class QuotaScheduler:
+    """
+    Hand out API keys so calls never exceed any key's per-second or daily quota.
+
+    Callers wait in a priority queue (see ``priority_scope``) until one of
+    the keys has a token; keys are used in turn so the load, and the quota,
+    is spread across all of them. When every key has spent its daily quota
+    ``QuotaExhausted`` is raised instead of waiting until midnight.
+
+    Quotas are enforced per process; see ``DailyBucket``.
+    """
+
+    def __init__(self, keys: List[str], per_second: float, per_day: int, burst: Optional[float] = None):
+        self.keys = [ApiKeyQuota(key, per_second, burst or per_second, per_day) for key in keys]
+        self._next_key = 0
+        self._queue: List[list] = []
+        self._sequence = itertools.count()
+        self._dispatcher: Optional[asyncio.Task] = None
+        # Metrics
+        self.waited = 0
+        self.exhausted = 0
+
+    def _take(self) -> Optional[str]:
+        for offset in range(len(self.keys)):
+            index = (self._next_key + offset) % len(self.keys)
+            if self.keys[index].take():
+                self._next_key = index + 1
+                return self.keys[index].key
+        return None
+
+    def _check_daily(self) -> None:
+        if all(quota.day.remaining <= 0 for quota in self.keys):
+            self.exhausted += 1
+            raise QuotaExhausted(retry_after=min(quota.day.reset_in() for quota in self.keys))
+
+    async def acquire(self, priority: Optional[int] = None) -> str:
+        self._check_daily()
+        if not self._queue:
+            key = self._take()
+            if key is not None:
+                return key
+
+        self.waited += 1
+        future = asyncio.get_running_loop().create_future()
+        priority = current_priority.get() if priority is None else priority
+        heapq.heappush(self._queue, [priority, next(self._sequence), future])
+        if self._dispatcher is None or self._dispatcher.done():
+            self._dispatcher = asyncio.ensure_future(self._dispatch())
+        try:
+            return await future
+        except asyncio.CancelledError:
+            # Granted just as the caller gave up: the key was never used
+            if future.done() and not future.cancelled() and future.exception() is None:
+                self.release(future.result())
+            raise
+
+    def release(self, key: str) -> None:
+        """
+        Return the token of a call that was never sent.
+        """
+        for quota in self.keys:
+            if quota.key == key:
+                quota.give_back()
+                return
+
+    async def _dispatch(self) -> None:
+        while self._queue:
+            # Waiters that gave up (deadline, cancelled fan-out) hold no token
+            while self._queue and self._queue[0][2].done():
+                heapq.heappop(self._queue)
+            if not self._queue:
+                break
+
+            try:
+                self._check_daily()
+            except QuotaExhausted as exc:
+                for _, _, future in self._queue:
+                    if not future.done():
+                        future.set_exception(exc)
+                self._queue.clear()
+                break
+
+            key = self._take()
+            if key is not None:
+                _, _, future = heapq.heappop(self._queue)
+                future.set_result(key)
+                continue
+
+            await asyncio.sleep(
+                min(quota.second.wait_time() for quota in self.keys if quota.day.remaining > 0)
+            )
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'queued': sum(1 for _, _, future in self._queue if not future.done()),
+            'waited': self.waited,
+            'exhausted': self.exhausted,
+            'keys': [
+                {'granted': quota.granted, 'used_today': quota.day.used, 'remaining_today': quota.day.remaining}
+                for quota in self.keys
+            ],
+        }
@@ -0,0 +1,133 @@
+import asyncio
+import os
+import random
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import Awaitable, Callable, Iterator, Optional, TypeVar
+
+from apis.exceptions import ConnectorFails, ConnectorTimeout
+
+RETRY_TRIES = int(os.environ.get('RETRY_TRIES', '3'))
+RETRY_BASE_DELAY = float(os.environ.get('RETRY_BASE_DELAY', '0.2'))
+RETRY_MAX_DELAY = float(os.environ.get('RETRY_MAX_DELAY', '2'))
+RETRYABLE_STATUSES = frozenset({429, 500, 502, 503, 504})
+
+_T = TypeVar('_T')
+
+
+class Deadline:
+    """
+    Absolute point in (monotonic) time by which a request must be answered.
+    """
+
+    def __init__(self, seconds: float):
+        self.expires_at = time.monotonic() + seconds
+
+    def remaining(self) -> float:
+        return max(0.0, self.expires_at - time.monotonic())
+
+    @property
+    def expired(self) -> bool:
+        return self.remaining() <= 0
+
+
+current_deadline: ContextVar[Optional[Deadline]] = ContextVar('current_deadline', default=None)
+
+
+@contextmanager
+def deadline_scope(seconds: Optional[float]) -> Iterator[Optional[Deadline]]:
+    """
+    Set the deadline seen by every connector call made inside the block.
+
+    Tasks spawned inside the block inherit the deadline through the context.
+    A nested scope can only shorten an outer deadline, never extend it.
+    """
+    deadline = Deadline(seconds) if seconds is not None else None
+    outer = current_deadline.get()
+    if outer is not None and (deadline is None or outer.expires_at < deadline.expires_at):
+        deadline = outer
+    token = current_deadline.set(deadline)
+    try:
+        yield deadline
+    finally:
+        current_deadline.reset(token)
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """
+    Parse a Retry-After header given either as seconds or as an HTTP date.
+    """
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        date = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if date.tzinfo is None:
+        date = date.replace(tzinfo=timezone.utc)
+    return max(0.0, (date - datetime.now(timezone.utc)).total_seconds())
+
+
+class RetryPolicy:
+    """
+    Asyncio-native retries with exponential backoff and full jitter.
+
+    Only failures flagged as retryable (429/5xx, timeouts and connection
+    errors) are retried, and no attempt or sleep is allowed to run past the
+    current request deadline.
+    """
+
+    def __init__(
+        self,
+        tries: int = RETRY_TRIES,
+        base_delay: float = RETRY_BASE_DELAY,
+        max_delay: float = RETRY_MAX_DELAY,
+        retryable_statuses: frozenset = RETRYABLE_STATUSES,
+    ):
+        self.tries = tries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.retryable_statuses = retryable_statuses
+
+    def is_retryable_status(self, status: int) -> bool:
+        return status in self.retryable_statuses
+
+    def backoff(self, attempt: int) -> float:
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+    async def call(self, func: Callable[[], Awaitable[_T]]) -> _T:
+        deadline = current_deadline.get()
+        attempt = 0
+        while True:
+            timeout = deadline.remaining() if deadline else None
+            if timeout is not None and timeout <= 0:
+                raise ConnectorTimeout("Request deadline exceeded")
+            try:
+                return await asyncio.wait_for(func(), timeout=timeout)
+            except asyncio.TimeoutError:
+                error = ConnectorTimeout()
+            except ConnectorFails as exc:
+                error = exc
+
+            attempt += 1
+            if not error.retryable or attempt >= self.tries:
+                raise error
+
+            if error.retry_after is not None:
+                # Server-supplied, so capped like our own backoff
+                delay = min(error.retry_after, self.max_delay)
+            else:
+                delay = self.backoff(attempt - 1)
+            if deadline is not None and delay >= deadline.remaining():
+                raise error
+            await asyncio.sleep(delay)
+
+
+default_retry_policy = RetryPolicy()
@@ -0,0 +1,121 @@
+import codecs
+import json
+import re
+from typing import Any, Dict, List, Optional
+
+_WHITESPACE = re.compile(r'[ \t\n\r]*')
+
+
+class TruncatedDocument(ValueError):
+    """
+    The body ended before the JSON document was complete.
+    """
+
+
+class ArrayStreamDecoder:
+    """
+    Incrementally decode a JSON object, yielding the elements of one of its
+    top-level arrays as soon as each element is complete.
+
+    Other top-level members are collected into ``meta``. Only the element
+    being decoded is held in memory, so the peak size no longer depends on
+    how many elements the array has.
+    """
+
+    def __init__(self, key: str):
+        self.key = key
+        self.meta: Dict[str, Any] = {}
+        self._decoder = json.JSONDecoder()
+        self._text = codecs.getincrementaldecoder('utf-8')()
+        self._buffer = ''
+        self._pos = 0
+        self._state = 'start'
+        self._member: Optional[str] = None
+
+    def feed(self, data: bytes) -> List[Any]:
+        self._buffer = self._buffer[self._pos:] + self._text.decode(data)
+        self._pos = 0
+        return self._parse(final=False)
+
+    def close(self) -> List[Any]:
+        self._buffer = self._buffer[self._pos:] + self._text.decode(b'', final=True)
+        self._pos = 0
+        items = self._parse(final=True)
+        if self._state != 'done':
+            raise TruncatedDocument("Truncated JSON document")
+        return items
+
+    def _skip_whitespace(self) -> Optional[str]:
+        self._pos = _WHITESPACE.match(self._buffer, self._pos).end()
+        return self._buffer[self._pos] if self._pos < len(self._buffer) else None
+
+    def _decode_value(self, final: bool) -> Any:
+        """
+        Decode the value at the cursor; raise EOFError if it may be incomplete.
+        """
+        try:
+            value, end = self._decoder.raw_decode(self._buffer, self._pos)
+        except json.JSONDecodeError as exc:
+            if final:
+                # A value cut off by the end of the body, rather than a malformed one
+                if exc.pos >= len(self._buffer) or exc.msg.startswith('Unterminated'):
+                    raise TruncatedDocument("Truncated JSON document") from None
+                raise ValueError("Invalid JSON document")
+            raise EOFError
+        # A number at the very end of the buffer may continue in the next chunk
+        if end == len(self._buffer) and not final:
+            raise EOFError
+        self._pos = end
+        return value
+
+    def _parse(self, final: bool) -> List[Any]:
+        items = []
+        try:
+            while self._state != 'done':
+                char = self._skip_whitespace()
+                if char is None:
+                    break
+                if self._state == 'start':
+                    if char != '{':
+                        raise ValueError("Expected a JSON object")
+                    self._pos += 1
+                    self._state = 'member'
+                elif self._state == 'member':
+                    if char == '}':
+                        self._pos += 1
+                        self._state = 'done'
+                        continue
+                    self._member = self._decode_value(final)
+                    self._state = 'colon'
+                elif self._state == 'colon':
+                    if char != ':':
+                        raise ValueError("Expected ':'")
+                    self._pos += 1
+                    self._state = 'value'
+                elif self._state == 'value':
+                    if self._member == self.key and char == '[':
+                        self._pos += 1
+                        self._state = 'element'
+                    else:
+                        self.meta[self._member] = self._decode_value(final)
+                        self._state = 'next_member'
+                elif self._state == 'next_member':
+                    if char not in ',}':
+                        raise ValueError("Expected ',' or '}'")
+                    self._pos += 1
+                    self._state = 'member' if char == ',' else 'done'
+                elif self._state == 'element':
+                    if char == ']':
+                        self._pos += 1
+                        self._state = 'next_member'
+                        continue
+                    items.append(self._decode_value(final))
+                    self._state = 'next_element'
+                elif self._state == 'next_element':
+                    if char not in ',]':
+                        raise ValueError("Expected ',' or ']'")
+                    self._pos += 1
+                    self._state = 'element' if char == ',' else 'next_member'
+        except EOFError:
+            pass
+        return items
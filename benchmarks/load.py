@@ -0,0 +1,240 @@
+"""
+Load test the API end to end against local stand-ins for both upstreams.
+
+    python -m benchmarks.load [--concurrency 32] [--requests 2000] \
+        [--seed-books 10000] [--database bench] [--output benchmarks/results/load.json]
+
+Starts the stub upstreams (benchmarks.stubs), points the connectors at
+them, serves main:app with uvicorn in-process and seeds the books
+collection of --database (default "bench"; it is emptied first) with a
+deterministic dataset. The run refuses to use the app's own database
+(DB_NAME). Each scenario then sends a fixed number of requests at a
+fixed concurrency:
+
+    hit       searches, lookups and pages of seeded books
+    miss      searches and lookups only the upstreams can answer
+    degraded  like miss, with slow upstreams failing 30% of calls
+
+Throughput and p50/p95/p99 latency per scenario and endpoint are printed
+and written as JSON, so runs can be compared.
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import math
+import os
+import platform
+import random
+import subprocess
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Callable, Dict, List, Tuple
+
+import aiohttp
+
+from benchmarks.stubs import StubConfig, UpstreamStubs
+from domain.models import Book
+
+API_KEY = 'bench'
+# The app's own database (data.mongo_connector's default), which a run must not empty
+APP_DB_NAME = os.environ.get('DB_NAME', 'test')
+# (endpoint label, method, path, json body)
+Request = Tuple[str, str, str, object]
+
+
+def percentile(samples: List[float], percent: float) -> float:
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    return ordered[max(0, math.ceil(len(ordered) * percent / 100) - 1)]
+
+
+def seed_documents(repository, count: int, seed: int) -> List[dict]:
+    rng = random.Random(seed)
+    words = ['river', 'garden', 'winter', 'machine', 'letters', 'shadow', 'harbour', 'silver']
+    first = datetime(1950, 1, 1)
+    return [
+        repository.to_document(Book(
+            id=f'OL{index + 1}W',
+            title=f'{rng.choice(words).title()} {rng.choice(words)} {index}',
+            authors=[f'Author {rng.randrange(1000)}'],
+            categories=['Fiction'],
+            publication_date=first + timedelta(days=rng.randrange(25000)),
+            editor=f'Publisher {rng.randrange(50)}',
+            description=' '.join(rng.choice(words) for _ in range(80)),
+            origin='Open Library API',
+            fetched_at=datetime.now(timezone.utc).replace(tzinfo=None),
+        ))
+        for index in range(count)
+    ]
+
+
+def hit_requests(titles: List[str], ids: List[str]) -> Callable[[int], Request]:
+    def make(index: int) -> Request:
+        kind = index % 3
+        if kind == 0:
+            return 'search', 'POST', '/books/search', {'title': titles[index % len(titles)]}
+        if kind == 1:
+            return 'get', 'GET', f'/books/{ids[index % len(ids)]}', None
+        return 'list', 'GET', '/books?limit=50', None
+    return make
+
+
+def miss_requests(run: str) -> Callable[[int], Request]:
+    # Unique queries, so neither the cache nor request coalescing can help
+    def make(index: int) -> Request:
+        if index % 2:
+            return 'get', 'GET', f'/books/OL{900000000 + index}W', None
+        return 'search', 'POST', '/books/search', {'title': f'uncatalogued {run} {index}'}
+    return make
+
+
+async def drive(
+    base_url: str, make_request: Callable[[int], Request], total: int, concurrency: int
+) -> Dict[str, dict]:
+    counter = itertools.count()
+    samples: Dict[str, List[float]] = {}
+    errors: Dict[str, int] = {}
+    headers = {'api-key': API_KEY}
+    connector = aiohttp.TCPConnector(limit=concurrency)
+
+    async def worker(session: aiohttp.ClientSession) -> None:
+        while True:
+            index = next(counter)
+            if index >= total:
+                return
+            label, method, path, body = make_request(index)
+            started = time.perf_counter()
+            try:
+                async with session.request(method, base_url + path, json=body, headers=headers) as response:
+                    await response.read()
+                    failed = response.status >= 500
+            except aiohttp.ClientError:
+                failed = True
+            samples.setdefault(label, []).append(time.perf_counter() - started)
+            if failed:
+                errors[label] = errors.get(label, 0) + 1
+
+    started = time.perf_counter()
+    async with aiohttp.ClientSession(connector=connector) as session:
+        await asyncio.gather(*[worker(session) for _ in range(concurrency)])
+    elapsed = time.perf_counter() - started
+
+    report = {}
+    for label, latencies in sorted(samples.items()):
+        report[label] = {
+            'requests': len(latencies),
+            'errors': errors.get(label, 0),
+            'throughput_rps': round(len(latencies) / elapsed, 1),
+            'p50_ms': round(percentile(latencies, 50) * 1000, 2),
+            'p95_ms': round(percentile(latencies, 95) * 1000, 2),
+            'p99_ms': round(percentile(latencies, 99) * 1000, 2),
+        }
+    return report
+
+
+def git_revision() -> str:
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+async def run(args: argparse.Namespace) -> dict:
+    stubs = UpstreamStubs(StubConfig(latency=args.upstream_latency, seed=args.seed))
+    await stubs.start()
+
+    # The app reads its configuration at import time
+    os.environ['GOOGLE_API_URL'] = stubs.google_url
+    os.environ['OPEN_LIBRARY_URL'] = stubs.open_library_url
+    os.environ['API_KEY'] = API_KEY
+    os.environ.setdefault('GOOGLE_API_KEY', 'bench')
+    os.environ['DB_NAME'] = args.database
+    # Our own quota pacing would otherwise be what is measured
+    os.environ.setdefault('GOOGLE_QUOTA_PER_SECOND', '100000')
+    os.environ.setdefault('GOOGLE_QUOTA_BURST', '100000')
+    os.environ.setdefault('GOOGLE_QUOTA_PER_DAY', '100000000')
+    import uvicorn
+    from data.mongo_connector import MONGO_DB, mongo_client
+    from main import app, book_repository
+
+    server = uvicorn.Server(uvicorn.Config(app, host='127.0.0.1', port=args.port, log_level='warning'))
+    serving = asyncio.ensure_future(server.serve())
+    while not server.started:
+        if serving.done():
+            await stubs.stop()
+            raise RuntimeError("The API did not start, is Mongo reachable?")
+        await asyncio.sleep(0.05)
+    base_url = f'http://127.0.0.1:{args.port}'
+
+    try:
+        documents = seed_documents(book_repository, args.seed_books, args.seed)
+        async with mongo_client('books', MONGO_DB) as collection:
+            await collection.delete_many({})
+        for start in range(0, len(documents), 5000):
+            await book_repository.save_documents(documents[start:start + 5000])
+
+        titles = [document['title'] for document in documents]
+        ids = [document['id'] for document in documents]
+        run_id = datetime.now(timezone.utc).strftime('%Y%m%d%H%M%S')
+        scenarios = {}
+        scenarios['hit'] = await drive(
+            base_url, hit_requests(titles, ids), args.requests, args.concurrency
+        )
+        scenarios['miss'] = await drive(
+            base_url, miss_requests(f'{run_id}-miss'), args.requests, args.concurrency
+        )
+        stubs.config.latency, stubs.config.error_rate = args.upstream_latency * 10, 0.3
+        scenarios['degraded'] = await drive(
+            base_url, miss_requests(f'{run_id}-degraded'), args.requests, args.concurrency
+        )
+    finally:
+        server.should_exit = True
+        await serving
+        await stubs.stop()
+
+    return {
+        'started_at': run_id,
+        'revision': git_revision(),
+        'python': platform.python_version(),
+        'database': MONGO_DB,
+        'settings': vars(args),
+        'upstream_requests': dict(stubs.requests),
+        'scenarios': scenarios,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--concurrency', type=int, default=32)
+    parser.add_argument('--requests', type=int, default=2000, help='requests per scenario')
+    parser.add_argument('--seed-books', type=int, default=10000)
+    parser.add_argument('--upstream-latency', type=float, default=0.05)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--database', default='bench', help='emptied and seeded; must not be DB_NAME')
+    parser.add_argument('--output', help='defaults to benchmarks/results/load-<time>.json')
+    args = parser.parse_args()
+    if args.database == APP_DB_NAME:
+        parser.error(f"--database {args.database} is the app's DB_NAME; the load test would empty it")
+
+    results = asyncio.run(run(args))
+
+    print(f"{'scenario':<10} {'endpoint':<8} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'errors':>7}")
+    for scenario, endpoints in results['scenarios'].items():
+        for endpoint, stats in endpoints.items():
+            print(
+                f"{scenario:<10} {endpoint:<8} {stats['throughput_rps']:>8} {stats['p50_ms']:>8} "
+                f"{stats['p95_ms']:>8} {stats['p99_ms']:>8} {stats['errors']:>7}"
+            )
+
+    output = args.output or os.path.join('benchmarks', 'results', f"load-{results['started_at']}.json")
+    os.makedirs(os.path.dirname(output) or '.', exist_ok=True)
+    with open(output, 'w') as file:
+        json.dump(results, file, indent=2)
+    print(f"Results written to {output}")
+
+
+if __name__ == '__main__':
+    main()
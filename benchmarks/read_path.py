@@ -0,0 +1,81 @@
+"""
+Per-book cost of turning stored Mongo documents into an API response.
+
+    python -m benchmarks.read_path [--sizes 1000 10000] [--repeat 5]
+
+"old" is the previous path: Book(**doc) for every document, then FastAPI's
+response_model validation, jsonable_encoder and json.dumps.
+"new" is the trusted path: Book.model_construct via to_domain, then orjson.
+"""
+import argparse
+import json
+import time
+from datetime import datetime, timedelta
+from typing import Callable, List
+
+from fastapi.encoders import jsonable_encoder
+from pydantic import TypeAdapter
+
+from data.mongo_repository import MongoDBRepository
+from domain.models import Book
+from responses import dumps
+
+BOOKS = TypeAdapter(List[Book])
+
+
+def make_documents(size: int) -> List[dict]:
+    repository = MongoDBRepository(None, db_name="bench", collection_name="books")
+    started = datetime(1950, 1, 1)
+    return [
+        repository.to_document(Book(
+            id=f"book-{index}",
+            title=f"Benchmark Book Title {index}",
+            subtitle="A subtitle",
+            authors=["Jane Doe", "John Doe"],
+            categories=["Fiction", "Adventure"],
+            publication_date=started + timedelta(days=index),
+            editor="Example Editor",
+            description="A reasonably sized description of the book. " * 5,
+            image="https://example.com/image.jpg",
+        ))
+        for index in range(size)
+    ]
+
+
+def old_path(documents: List[dict]) -> bytes:
+    books = [Book(**document) for document in documents]
+    validated = BOOKS.validate_python(books)
+    return json.dumps(jsonable_encoder(validated)).encode()
+
+
+def new_path(documents: List[dict]) -> bytes:
+    repository = MongoDBRepository(None, db_name="bench", collection_name="books")
+    return dumps([repository.to_domain(document) for document in documents])
+
+
+def measure(func: Callable[[List[dict]], bytes], documents: List[dict], repeat: int) -> float:
+    best = float('inf')
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func(documents)
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000])
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    print(f"{'books':>8} {'old us/book':>12} {'new us/book':>12} {'speedup':>8}")
+    for size in args.sizes:
+        documents = make_documents(size)
+        assert json.loads(old_path(documents)) == json.loads(new_path(documents))
+        old = measure(old_path, documents, args.repeat) / size * 1e6
+        new = measure(new_path, documents, args.repeat) / size * 1e6
+        print(f"{size:>8} {old:>12.2f} {new:>12.2f} {old / new:>7.1f}x")
+
+
+if __name__ == '__main__':
+    main()
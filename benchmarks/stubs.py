@@ -0,0 +1,177 @@
+"""
+Local stand-ins for the Google Books and Open Library APIs.
+
+Responses are generated deterministically from the request, so runs can
+be compared, and follow the shapes the connectors read. Latency, error
+rate and payload size are set through a shared StubConfig that can be
+changed while the servers run.
+"""
+import asyncio
+import random
+import zlib
+from collections import Counter
+from typing import List, Optional
+
+from aiohttp import web
+
+
+class StubConfig:
+
+    def __init__(
+        self,
+        latency: float = 0.05,
+        jitter: float = 0.02,
+        error_rate: float = 0.0,
+        results: int = 40,
+        description_size: int = 500,
+        seed: int = 0,
+    ):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.results = results  # total matches reported for any search
+        self.description_size = description_size
+        self.seed = seed
+
+
+class UpstreamStubs:
+
+    def __init__(self, config: Optional[StubConfig] = None):
+        self.config = config or StubConfig()
+        self.requests: Counter = Counter()
+        # Google calls by the API key they carried
+        self.google_keys: Counter = Counter()
+        self.google_url = ''
+        self.open_library_url = ''
+        self._runners: List[web.AppRunner] = []
+        self._random = random.Random(self.config.seed)
+
+    async def start(self, host: str = '127.0.0.1') -> None:
+        google = web.Application()
+        google.router.add_get('/books/v1/volumes', self._google_search)
+        google.router.add_get('/books/v1/volumes/{id}', self._google_volume)
+        open_library = web.Application()
+        open_library.router.add_get('/search.json', self._open_library_search)
+        open_library.router.add_get('/works/{id}.json', self._open_library_work)
+        open_library.router.add_get('/authors/{id}.json', self._open_library_author)
+
+        self.google_url = f'{await self._serve(google, host)}/books/v1/volumes'
+        self.open_library_url = await self._serve(open_library, host)
+
+    async def _serve(self, app: web.Application, host: str) -> str:
+        runner = web.AppRunner(app, access_log=None)
+        await runner.setup()
+        site = web.TCPSite(runner, host, 0)
+        await site.start()
+        self._runners.append(runner)
+        port = site._server.sockets[0].getsockname()[1]
+        return f'http://{host}:{port}'
+
+    async def stop(self) -> None:
+        for runner in self._runners:
+            await runner.cleanup()
+        self._runners = []
+
+    async def _delay(self, name: str) -> Optional[web.Response]:
+        """
+        Apply the configured latency; return an error response if this call fails.
+        """
+        self.requests[name] += 1
+        config = self.config
+        await asyncio.sleep(max(0.0, config.latency + self._random.uniform(-config.jitter, config.jitter)))
+        if self._random.random() < config.error_rate:
+            return web.json_response({'error': 'unavailable'}, status=503)
+        return None
+
+    def _text(self, seed: int) -> str:
+        words = ['adventure', 'river', 'mystery', 'garden', 'history', 'winter', 'letters', 'machine']
+        rng = random.Random(seed)
+        text = ' '.join(rng.choice(words) for _ in range(self.config.description_size // 7 + 1))
+        return text[:self.config.description_size]
+
+    @staticmethod
+    def _seed(*parts: object) -> int:
+        return zlib.crc32('|'.join(map(str, parts)).encode())
+
+    def _volume(self, volume_id: str, title: str) -> dict:
+        seed = self._seed(volume_id)
+        return {
+            'id': volume_id,
+            'volumeInfo': {
+                'title': title,
+                'authors': [f'Author {seed % 997}'],
+                'categories': ['Fiction'],
+                'publishedDate': f'{1950 + seed % 70}-{1 + seed % 12:02d}-{1 + seed % 28:02d}',
+                'publisher': f'Publisher {seed % 53}',
+                'description': self._text(seed),
+                'imageLinks': {'thumbnail': f'https://books.example/{volume_id}.jpg'},
+            },
+        }
+
+    async def _google_search(self, request: web.Request) -> web.Response:
+        self.google_keys[request.headers.get('X-Goog-Api-Key')] += 1
+        error = await self._delay('google_search')
+        if error:
+            return error
+        query = request.query.get('q', '')
+        start = int(request.query.get('startIndex', 0))
+        size = int(request.query.get('maxResults', 10))
+        count = max(0, min(size, self.config.results - start))
+        items = [
+            self._volume(f'{self._seed(query, index) % 10 ** 12:012d}', f'{query} {index}')
+            for index in range(start, start + count)
+        ]
+        return web.json_response({'totalItems': self.config.results, 'items': items})
+
+    async def _google_volume(self, request: web.Request) -> web.Response:
+        self.google_keys[request.headers.get('X-Goog-Api-Key')] += 1
+        error = await self._delay('google_volume')
+        if error:
+            return error
+        volume_id = request.match_info['id']
+        return web.json_response(self._volume(volume_id, f'Volume {volume_id}'))
+
+    async def _open_library_search(self, request: web.Request) -> web.Response:
+        error = await self._delay('open_library_search')
+        if error:
+            return error
+        query = ' '.join(request.query.get(key, '') for key in ('title', 'author', 'q')).strip()
+        page = int(request.query.get('page', 1))
+        size = int(request.query.get('limit', 20))
+        start = (page - 1) * size
+        count = max(0, min(size, self.config.results - start))
+        docs = []
+        for index in range(start, start + count):
+            seed = self._seed(query, index)
+            docs.append({
+                'key': f'/works/OL{seed % 10 ** 8}W',
+                'title': f'{query} {index}',
+                'author_name': [f'Author {seed % 997}'],
+                'subject': ['Fiction'],
+                'publish_date': [str(1950 + seed % 70)],
+                'publisher': [f'Publisher {seed % 53}'],
+                'notes': self._text(seed),
+                'cover_i': seed % 10 ** 7,
+            })
+        return web.json_response({'numFound': self.config.results, 'start': start, 'docs': docs})
+
+    async def _open_library_work(self, request: web.Request) -> web.Response:
+        error = await self._delay('open_library_work')
+        if error:
+            return error
+        work_id = request.match_info['id']
+        seed = self._seed(work_id)
+        return web.json_response({
+            'title': f'Work {work_id}',
+            'first_publish_date': str(1950 + seed % 70),
+            'authors': [{'author': {'key': f'/authors/OL{seed % 997}A'}}],
+            'description': {'value': self._text(seed)},
+            'subjects': ['Fiction'],
+            'covers': [seed % 10 ** 7],
+        })
+
+    async def _open_library_author(self, request: web.Request) -> web.Response:
+        error = await self._delay('open_library_author')
+        if error:
+            return error
+        return web.json_response({'name': f"Author {request.match_info['id']}"})
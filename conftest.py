@@ -1,4 +1,5 @@
-from typing import Dict, List, TypeVar
+from typing import AsyncIterator, Dict, List, Optional, TypeVar
+from data.pagination import decode_cursor, parse_order, sort_value
 from data.repository import Repository
 from domain.models import Book
 
@@ -17,17 +18,55 @@ class FakeRepository(Repository):
         ]
         return [self.to_domain(result) for result in results]
 
-    async def list(self, order_by: str = None, limit: int = None) -> List[Book]:
-        results = self._client
-        if order_by:
-            results = sorted(self._client, key=lambda x: getattr(x, order_by, None))
+    async def search_many(self, search_params_list: List[Dict]) -> List[List[Book]]:
+        return [await self.search(search_params) for search_params in search_params_list]
+
+    async def get_by_id(self, id: str) -> Optional[Book]:
+        for item in self._client:
+            if getattr(item, 'id') == id:
+                return self.to_domain(item)
+        return None
+
+    async def list(self, order_by: str = None, limit: int = None, after: str = None) -> List[Book]:
+        return [self.to_domain(item) for item in self._page(order_by, limit, after)]
+
+    async def stream(
+        self, order_by: str = None, limit: int = None, after: str = None, fields: List[str] = None
+    ) -> AsyncIterator[Dict]:
+        key, _, _ = parse_order(order_by)
+        for item in self._page(order_by, limit, after):
+            document = item.model_dump()
+            if fields:
+                document = {k: v for k, v in document.items() if k in {*fields, 'id', key}}
+            yield document
+
+    def _page(self, order_by: str, limit: int, after: str) -> List[_M]:
+        key, _, direction = parse_order(order_by)
+        sort_key = lambda x: (sort_value(key, x), x.id)  # noqa: E731
+        results = sorted(self._client, key=sort_key, reverse=direction < 0)
+        if after:
+            value, item_id = decode_cursor(order_by, after)
+            if direction < 0:
+                results = [item for item in results if sort_key(item) < (value, item_id)]
+            else:
+                results = [item for item in results if sort_key(item) > (value, item_id)]
         if limit:
             results = results[:limit]
-        return [self.to_domain(item) for item in results]
+        return results
 
     async def save(self, model: _M) -> None:
         self._client.append(model)
 
+    async def save_many(self, models: List[_M], overwrite: bool = False) -> None:
+        known = {getattr(item, 'id'): index for index, item in enumerate(self._client)}
+        for model in models:
+            index = known.get(getattr(model, 'id'))
+            if index is None:
+                known[getattr(model, 'id')] = len(self._client)
+                self._client.append(model)
+            elif overwrite:
+                self._client[index] = model
+
     async def delete(self, id: str) -> None:
         self._client = [item for item in self._client if getattr(item, 'id') != id]
 
@@ -0,0 +1,35 @@
+"""
+Bring books written by older versions up to the current document schema.
+
+    python -m data.backfill [--batch-size 1000]
+
+Documents without the current schema_version lack the normalized search
+fields (title/author tokens, publication year and month), so searches
+never match them. Run once after upgrading; documents already up to date
+are not touched, so it is safe to run again.
+"""
+import argparse
+import asyncio
+import logging
+
+from data.mongo_connector import MONGO_DB, mongo_client
+from data.mongo_repository import MongoDBRepository
+
+logger = logging.getLogger(__name__)
+
+
+async def main(args: argparse.Namespace) -> None:
+    await mongo_client.connect()
+    try:
+        repository = MongoDBRepository(mongo_client, MONGO_DB, 'books')
+        updated = await repository.backfill_search_fields(batch_size=args.batch_size)
+        logger.info("%d books backfilled", updated)
+    finally:
+        mongo_client.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--batch-size', type=int, default=1000)
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(message)s')
+    asyncio.run(main(parser.parse_args()))
@@ -1,8 +1,11 @@
+import asyncio
 import os
+from typing import Dict, List, Optional
 
 from motor import motor_asyncio
 from dotenv import load_dotenv
 from contextlib import asynccontextmanager
+from pymongo import ASCENDING, TEXT, IndexModel
 
 # Load environment variables
 load_dotenv()
@@ -16,14 +19,111 @@ MONGO_DB = os.getenv("DB_NAME", "test")
 if not MONGO_URI:
     MONGO_URI = f"mongodb://{MONGO_INITDB_ROOT_USERNAME}:{MONGO_INITDB_ROOT_PASSWORD}@{MONGO_HOST}:{MONGO_PORT}/{MONGO_DB}"
 
+# Connection pool sizing
+MONGO_MIN_POOL_SIZE = int(os.getenv("MONGO_MIN_POOL_SIZE", "0"))
+MONGO_MAX_POOL_SIZE = int(os.getenv("MONGO_MAX_POOL_SIZE", "100"))
+MONGO_MAX_IDLE_TIME_MS = int(os.getenv("MONGO_MAX_IDLE_TIME_MS", "60000"))
+MONGO_WAIT_QUEUE_TIMEOUT_MS = int(os.getenv("MONGO_WAIT_QUEUE_TIMEOUT_MS", "5000"))
 
-@asynccontextmanager
-async def mongo_client(collection: str, db_name: str = MONGO_DB):
-    client = motor_asyncio.AsyncIOMotorClient(MONGO_URI)
-    try:
-        db = client[db_name]
-        collection = db[collection]
-        await collection.create_index('id', unique=True)
-        yield collection
-    finally:
-        client.close()
+# Indexes created once per collection when the client is first used
+INDEXES: Dict[str, List[IndexModel]] = {
+    'books': [
+        IndexModel([('id', ASCENDING)], unique=True),
+        IndexModel([
+            ('title_tokens', ASCENDING),
+            ('publication_year', ASCENDING),
+            ('publication_month', ASCENDING),
+        ]),
+        IndexModel([
+            ('author_tokens', ASCENDING),
+            ('publication_year', ASCENDING),
+            ('publication_month', ASCENDING),
+        ]),
+        # Keyset pagination orders, with id as the tie breaker
+        IndexModel([('title_norm', ASCENDING), ('id', ASCENDING)]),
+        IndexModel([('publication_date', ASCENDING), ('id', ASCENDING)]),
+        IndexModel([
+            ('publication_year', ASCENDING),
+            ('publication_month', ASCENDING),
+            ('publication_date', ASCENDING),
+        ]),
+        # Fields are already normalized, so the text index must not stem them
+        IndexModel(
+            [('title_norm', TEXT), ('authors_norm', TEXT)],
+            default_language='none',
+            weights={'title_norm': 2, 'authors_norm': 1},
+        ),
+    ],
+}
+
+
+class MongoConnectionManager:
+    """
+    Owns a single pooled Motor client for the lifetime of the application.
+
+    Calling the manager returns an async context manager yielding a collection,
+    so it can be handed to repositories wherever ``mongo_client`` was used.
+    """
+
+    def __init__(
+        self,
+        uri: str = MONGO_URI,
+        indexes: Optional[Dict[str, List[IndexModel]]] = None,
+        min_pool_size: int = MONGO_MIN_POOL_SIZE,
+        max_pool_size: int = MONGO_MAX_POOL_SIZE,
+        max_idle_time_ms: int = MONGO_MAX_IDLE_TIME_MS,
+        wait_queue_timeout_ms: int = MONGO_WAIT_QUEUE_TIMEOUT_MS,
+    ):
+        self.uri = uri
+        self.indexes = INDEXES if indexes is None else indexes
+        self.pool_options = {
+            'minPoolSize': min_pool_size,
+            'maxPoolSize': max_pool_size,
+            'maxIdleTimeMS': max_idle_time_ms,
+            'waitQueueTimeoutMS': wait_queue_timeout_ms,
+        }
+        self._client: Optional[motor_asyncio.AsyncIOMotorClient] = None
+        self._bootstrapped: set = set()
+        self._lock: Optional[asyncio.Lock] = None
+
+    @property
+    def client(self) -> motor_asyncio.AsyncIOMotorClient:
+        if self._client is None:
+            self._client = motor_asyncio.AsyncIOMotorClient(self.uri, **self.pool_options)
+        return self._client
+
+    async def connect(self, db_name: str = MONGO_DB) -> None:
+        """
+        Create the pooled client and bootstrap every registered index.
+        """
+        for collection in self.indexes:
+            await self._ensure_indexes(db_name, collection)
+
+    async def _ensure_indexes(self, db_name: str, collection: str) -> None:
+        key = (db_name, collection)
+        if key in self._bootstrapped:
+            return
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            if key in self._bootstrapped:
+                return
+            indexes = self.indexes.get(collection)
+            if indexes:
+                await self.client[db_name][collection].create_indexes(indexes)
+            self._bootstrapped.add(key)
+
+    def close(self) -> None:
+        if self._client is not None:
+            self._client.close()
+        self._client = None
+        self._bootstrapped = set()
+        self._lock = None
+
+    @asynccontextmanager
+    async def __call__(self, collection: str, db_name: str = MONGO_DB):
+        await self._ensure_indexes(db_name, collection)
+        yield self.client[db_name][collection]
+
+
+mongo_client = MongoConnectionManager()
@@ -1,62 +1,316 @@
+import os
 import re
+import time
 from datetime import datetime
-from typing import Callable, Optional
+from typing import AsyncIterator, Callable, Iterable, List, Optional
 
-from dateutil import parser
+from pymongo import UpdateOne
 from pymongo.errors import DuplicateKeyError
 
+from data.normalize import date_range, normalize_text, tokenize, tokenize_all
+from data.pagination import after_query, parse_order
 from data.repository import Repository
 from domain.models import Book
+from observability.metrics import Counter, Histogram, timed
+from observability.tracing import start_span, traced
+
+# How title/author searches are matched against the normalized fields:
+#   token  - every search token must be a whole token of the field
+#   prefix - like token, but the last search token may be a prefix
+#   text   - Mongo text search, ordered by relevance score
+SEARCH_MODES = ('token', 'prefix', 'text')
+SEARCH_MODE = os.environ.get('SEARCH_MODE', 'prefix')
+SEARCH_LIMIT = 10
+# Stamped on documents written by save; such documents are trusted on read
+SCHEMA_VERSION = 1
+STREAM_BATCH_SIZE = int(os.environ.get('STREAM_BATCH_SIZE', '500'))
+BOOK_FIELDS = tuple(Book.model_fields)
+# Values an overwrite leaves alone rather than store over a known one
+EMPTY_VALUES = ('', None, [])
+
+REPOSITORY_SECONDS = Histogram(
+    'repository_operation_duration_seconds',
+    'Time of a MongoDBRepository operation, by operation.',
+    ('operation',),
+)
+REPOSITORY_ERRORS = Counter(
+    'repository_operation_errors_total',
+    'MongoDBRepository operations that raised, by operation.',
+    ('operation',),
+)
 
 
 class MongoDBRepository(Repository):
 
-    def __init__(self, get_client: Callable, db_name: str, collection_name: str):
+    def __init__(
+        self,
+        get_client: Callable,
+        db_name: str,
+        collection_name: str,
+        search_mode: str = SEARCH_MODE,
+    ):
+        if search_mode not in SEARCH_MODES:
+            raise ValueError(f"Unknown search mode: {search_mode}")
         self._client = get_client
         self.db_name = db_name
         self.collection_name = collection_name
+        self.search_mode = search_mode
 
-    async def search(self, search_params: dict) -> list[Book]:
-        breakpoint()
-        query = {}
-        if 'title' in search_params:
-            query['title'] = {'$regex': search_params['title'], '$options': 'i'}
+    def build_query(self, search_params: dict) -> dict:
+        """
+        Translate search params into a query served by the normalized-field indexes.
 
-        if 'author' in search_params:
-            query['authors'] = {'$all': [
-                re.compile(author, re.IGNORECASE) for author in search_params['author']]
-            }
+        Raises ValueError if publication_date cannot be parsed.
+        """
+        query = {}
+        if self.search_mode == 'text':
+            terms = ' '.join(
+                normalize_text(search_params[key]) for key in ('title', 'author') if key in search_params
+            )
+            if terms:
+                query['$text'] = {'$search': terms}
+        else:
+            conditions = []
+            if 'title' in search_params:
+                conditions += self._token_conditions('title_tokens', search_params['title'])
+            if 'author' in search_params:
+                conditions += self._token_conditions('author_tokens', search_params['author'])
+            if len(conditions) == 1:
+                query.update(conditions[0])
+            elif conditions:
+                query['$and'] = conditions
 
         if 'publication_date' in search_params:
-            date = parser.parse(search_params.get('publication_date'), default=datetime(1, 1, 1))
-            query['publication_date'] = {"$gte": date, "$lt": date}
+            start, end, precision = date_range(search_params['publication_date'])
+            query['publication_year'] = start.year
+            if precision != 'year':
+                query['publication_month'] = start.month
+            query['publication_date'] = {"$gte": start, "$lt": end}
+        return query
+
+    def _token_conditions(self, field: str, value: str) -> List[dict]:
+        tokens = tokenize(value)
+        if not tokens:
+            return []
+        if self.search_mode == 'prefix':
+            # An anchored, case-sensitive regex is still an index range scan
+            exact, prefix = tokens[:-1], tokens[-1]
+            conditions = [{field: {'$regex': f'^{re.escape(prefix)}'}}]
+            if exact:
+                conditions.insert(0, {field: {'$all': exact}})
+            return conditions
+        return [{field: {'$all': tokens}}]
+
+    @traced('mongo search')
+    @timed(REPOSITORY_SECONDS, 'search', errors=REPOSITORY_ERRORS)
+    async def search(self, search_params: dict) -> list[Book]:
+        try:
+            query = self.build_query(search_params)
+        except ValueError:
+            return []
         async with self._client(self.collection_name, self.db_name) as client:
-            results = client.find(query)
-            results = await results.to_list(length=10)
+            if '$text' in query:
+                results = client.find(query, {'score': {'$meta': 'textScore'}})
+                results = results.sort([('score', {'$meta': 'textScore'})])
+            else:
+                results = client.find(query)
+            results = await results.to_list(length=SEARCH_LIMIT)
             return [self.to_domain(doc) for doc in results]
 
+    @traced('mongo search_many')
+    @timed(REPOSITORY_SECONDS, 'search_many', errors=REPOSITORY_ERRORS)
+    async def search_many(self, search_params_list: List[dict]) -> List[List[Book]]:
+        results: List[List[Book]] = [[] for _ in search_params_list]
+        branches = []
+        for index, search_params in enumerate(search_params_list):
+            try:
+                query = self.build_query(search_params)
+            except ValueError:
+                continue
+            branches.append(self._search_pipeline(query) + [{'$addFields': {'_query': index}}])
+        if not branches:
+            return results
+
+        # Each branch keeps its own index plan; $unionWith only concatenates them
+        pipeline = branches[0] + [
+            {'$unionWith': {'coll': self.collection_name, 'pipeline': branch}}
+            for branch in branches[1:]
+        ]
+        async with self._client(self.collection_name, self.db_name) as client:
+            async for doc in client.aggregate(pipeline):
+                results[doc.pop('_query')].append(self.to_domain(doc))
+        return results
+
+    @staticmethod
+    def _search_pipeline(query: dict) -> List[dict]:
+        pipeline = [{'$match': query}]
+        if '$text' in query:
+            pipeline.append({'$sort': {'score': {'$meta': 'textScore'}}})
+        pipeline.append({'$limit': SEARCH_LIMIT})
+        return pipeline
+
+    @traced('mongo get_by_id')
+    @timed(REPOSITORY_SECONDS, 'get_by_id', errors=REPOSITORY_ERRORS)
+    async def get_by_id(self, id: str) -> Optional[Book]:
+        async with self._client(self.collection_name, self.db_name) as client:
+            doc = await client.find_one({'id': id}, projection={'_id': 0})
+            return self.to_domain(doc) if doc else None
+
     async def list(
-        self, order_by: Optional[str] = None, limit: Optional[int] = None
+        self,
+        order_by: Optional[str] = None,
+        limit: Optional[int] = None,
+        after: Optional[str] = None,
     ) -> list[Book]:
-        async with self._client(self.collection_name, self.db_name) as client:
-            results = client.find()
-            results = await results.to_list(length=limit)
-            if order_by:
-                results = results.sort(order_by)
-            if limit:
-                results = results.limit(limit)
-            return [self.to_domain(doc) for doc in results]
+        documents = self._documents(order_by, limit, after, BOOK_FIELDS + ('schema_version',), 'list')
+        return [self.to_domain(doc) async for doc in documents]
+
+    def stream(
+        self,
+        order_by: Optional[str] = None,
+        limit: Optional[int] = None,
+        after: Optional[str] = None,
+        fields: Optional[List[str]] = None,
+    ) -> AsyncIterator[dict]:
+        return self._documents(order_by, limit, after, fields or BOOK_FIELDS, 'stream')
 
+    async def _documents(
+        self,
+        order_by: Optional[str],
+        limit: Optional[int],
+        after: Optional[str],
+        fields: Iterable[str],
+        operation: str,
+    ) -> AsyncIterator[dict]:
+        key, sort_field, direction = parse_order(order_by)
+        query = after_query(order_by, after) if after else {}
+        projection = {'_id': 0}
+        # id and the sort key are always returned so the caller can build a cursor
+        for field in set(fields) | {'id', key}:
+            projection[field] = 1
+        # Timed until the cursor is exhausted or closed, so streams count whole.
+        # The span is not made current: the generator's caller runs between items
+        started = time.perf_counter()
+        current = start_span(f'mongo {operation}')
+        error: Optional[Exception] = None
+        try:
+            async with self._client(self.collection_name, self.db_name) as client:
+                cursor = client.find(
+                    query,
+                    projection,
+                    sort=[(sort_field, direction), ('id', direction)],
+                    limit=limit or 0,
+                    batch_size=STREAM_BATCH_SIZE,
+                )
+                async for doc in cursor:
+                    yield doc
+        except Exception as exc:
+            error = exc
+            REPOSITORY_ERRORS.labels(operation).inc()
+            raise
+        finally:
+            REPOSITORY_SECONDS.labels(operation).observe(time.perf_counter() - started)
+            if current is not None:
+                current.finish(error)
+
+    @traced('mongo save')
+    @timed(REPOSITORY_SECONDS, 'save', errors=REPOSITORY_ERRORS)
     async def save(self, model: Book) -> None:
         async with self._client(self.collection_name, self.db_name) as client:
             try:
-                client.insert_one(model.model_dump())
+                await client.insert_one(self.to_document(model))
             except DuplicateKeyError:
                 pass
 
+    async def save_many(self, models: List[Book], overwrite: bool = False) -> None:
+        await self.save_documents([self.to_document(model) for model in models], overwrite)
+
+    @traced('mongo save_documents')
+    @timed(REPOSITORY_SECONDS, 'save_documents', errors=REPOSITORY_ERRORS)
+    async def save_documents(self, documents: List[dict], overwrite: bool = False) -> None:
+        """
+        Bulk upsert documents already built with to_document.
+        """
+        if not documents:
+            return
+        # Without overwrite, upserts keep save's semantics: an existing book is left untouched
+        update = self._overwrite if overwrite else lambda document: {'$setOnInsert': document}
+        operations = [
+            UpdateOne({'id': document['id']}, update(document), upsert=True)
+            for document in documents
+        ]
+        async with self._client(self.collection_name, self.db_name) as client:
+            await client.bulk_write(operations, ordered=False)
+
+    @staticmethod
+    def _overwrite(document: dict) -> dict:
+        """
+        Update replacing the stored fields, except with empty values: a source
+        without e.g. a publisher must not erase the one already stored.
+        """
+        update = {'$set': {key: value for key, value in document.items() if value not in EMPTY_VALUES}}
+        missing = {key: value for key, value in document.items() if value in EMPTY_VALUES}
+        if missing:
+            update['$setOnInsert'] = missing
+        return update
+
+    @traced('mongo delete')
+    @timed(REPOSITORY_SECONDS, 'delete', errors=REPOSITORY_ERRORS)
     async def delete(self, id: str) -> None:
         async with self._client(self.collection_name, self.db_name) as client:
-            client.delete_one({"id": id})
+            await client.delete_one({"id": id})
+
+    async def backfill_search_fields(self, batch_size: int = 1000) -> int:
+        """
+        Add search fields and the schema version to documents written by older versions.
+        """
+        updated = 0
+        async with self._client(self.collection_name, self.db_name) as client:
+            cursor = client.find(
+                {'schema_version': {'$ne': SCHEMA_VERSION}},
+                batch_size=batch_size,
+            )
+            batch = []
+            async for doc in cursor:
+                fields = self.search_fields(
+                    doc.get('title', ''), doc.get('authors', []), doc.get('publication_date')
+                )
+                fields['schema_version'] = SCHEMA_VERSION
+                batch.append(UpdateOne({'_id': doc['_id']}, {'$set': fields}))
+                if len(batch) >= batch_size:
+                    await client.bulk_write(batch, ordered=False)
+                    updated += len(batch)
+                    batch = []
+            if batch:
+                await client.bulk_write(batch, ordered=False)
+                updated += len(batch)
+        return updated
+
+    @staticmethod
+    def search_fields(
+        title: str, authors: List[str], publication_date: Optional[datetime]
+    ) -> dict:
+        fields = {
+            'title_norm': normalize_text(title),
+            'title_tokens': tokenize(title),
+            'authors_norm': [normalize_text(author) for author in authors],
+            'author_tokens': tokenize_all(authors),
+        }
+        if isinstance(publication_date, datetime):
+            fields['publication_year'] = publication_date.year
+            fields['publication_month'] = publication_date.month
+        return fields
+
+    def to_document(self, model: Book) -> dict:
+        document = model.model_dump()
+        document.update(self.search_fields(model.title, model.authors, model.publication_date))
+        document['schema_version'] = SCHEMA_VERSION
+        return document
 
     def to_domain(self, model: dict) -> Book:
+        if model.get('schema_version') == SCHEMA_VERSION:
+            # Written by save from a validated Book, so skip re-validation
+            return Book.model_construct(**{
+                field: model[field] for field in BOOK_FIELDS if field in model
+            })
         return Book(**model)
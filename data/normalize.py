@@ -0,0 +1,57 @@
+import re
+import unicodedata
+from datetime import datetime, timedelta
+from typing import Iterable, List, Tuple
+
+from dateutil import parser
+
+_NON_WORD = re.compile(r'[^\w]+')
+
+
+def normalize_text(value: str) -> str:
+    """
+    Lowercase, strip accents and collapse punctuation/whitespace to single spaces.
+    """
+    decomposed = unicodedata.normalize('NFKD', value or '')
+    folded = ''.join(char for char in decomposed if not unicodedata.combining(char))
+    return ' '.join(_NON_WORD.sub(' ', folded.casefold()).replace('_', ' ').split())
+
+
+def tokenize(value: str) -> List[str]:
+    return normalize_text(value).split()
+
+
+def tokenize_all(values: Iterable[str]) -> List[str]:
+    """
+    Distinct tokens of several values, in first-seen order.
+    """
+    tokens = {}
+    for value in values:
+        for token in tokenize(value):
+            tokens.setdefault(token, None)
+    return list(tokens)
+
+
+def date_range(value: str) -> Tuple[datetime, datetime, str]:
+    """
+    Half-open [start, end) interval covered by a date given at any precision.
+
+    "1999" covers the whole year, "1999-05" or "May 1999" the month and a
+    full date a single day. The precision ("year", "month" or "day") is
+    returned as the third element. Raises ValueError for unparsable input.
+    """
+    try:
+        first = parser.parse(value, default=datetime(1, 1, 1))
+        second = parser.parse(value, default=datetime(1, 2, 2))
+    except (OverflowError, parser.ParserError) as exc:
+        raise ValueError(f"Invalid date: {value}") from exc
+
+    if first.month != second.month:
+        start = datetime(first.year, 1, 1)
+        return start, datetime(first.year + 1, 1, 1), 'year'
+    if first.day != second.day:
+        start = datetime(first.year, first.month, 1)
+        end = datetime(first.year + first.month // 12, first.month % 12 + 1, 1)
+        return start, end, 'month'
+    start = datetime(first.year, first.month, first.day)
+    return start, start + timedelta(days=1), 'day'
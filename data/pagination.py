@@ -0,0 +1,82 @@
+import base64
+import json
+from datetime import datetime
+from typing import Any, Mapping, Tuple, Union
+
+from pymongo import ASCENDING, DESCENDING
+
+from data.normalize import normalize_text
+from domain.models import Book
+
+# Public sort keys and the indexed document field each one is served from
+ORDER_FIELDS = {
+    'id': 'id',
+    'title': 'title_norm',
+    'publication_date': 'publication_date',
+}
+DEFAULT_ORDER = 'id'
+
+
+def parse_order(order_by: str = None) -> Tuple[str, str, int]:
+    """
+    Split an order such as "-publication_date" into (public key, stored field, direction).
+    """
+    order_by = order_by or DEFAULT_ORDER
+    direction = DESCENDING if order_by.startswith('-') else ASCENDING
+    key = order_by.lstrip('-')
+    if key not in ORDER_FIELDS:
+        raise ValueError(f"Cannot order by {key}; use one of {', '.join(ORDER_FIELDS)}")
+    return key, ORDER_FIELDS[key], direction
+
+
+def sort_value(key: str, item: Union[Book, Mapping[str, Any]]) -> Any:
+    """
+    Value of the stored sort field for a book or a book-shaped document.
+    """
+    value = getattr(item, key) if isinstance(item, Book) else item.get(key)
+    if key == 'title':
+        return normalize_text(value)
+    return value
+
+
+def encode_cursor(order_by: str, item: Union[Book, Mapping[str, Any]]) -> str:
+    key, _, _ = parse_order(order_by)
+    value = sort_value(key, item)
+    if isinstance(value, datetime):
+        value = value.isoformat()
+    item_id = item.id if isinstance(item, Book) else item.get('id')
+    payload = json.dumps([order_by or DEFAULT_ORDER, value, item_id], separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+
+def decode_cursor(order_by: str, cursor: str) -> Tuple[Any, str]:
+    """
+    Return the (sort value, id) a page must start after. Raises ValueError
+    if the cursor is malformed or was issued for a different order.
+    """
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        cursor_order, value, item_id = json.loads(base64.urlsafe_b64decode(padded))
+    except (ValueError, TypeError) as exc:
+        raise ValueError("Invalid cursor") from exc
+    if cursor_order != (order_by or DEFAULT_ORDER):
+        raise ValueError("Cursor was issued for a different order_by")
+    key, _, _ = parse_order(order_by)
+    if key == 'publication_date' and value is not None:
+        value = datetime.fromisoformat(value)
+    return value, item_id
+
+
+def after_query(order_by: str, cursor: str) -> dict:
+    """
+    Keyset condition selecting the documents that sort strictly after cursor.
+    """
+    _, field, direction = parse_order(order_by)
+    value, item_id = decode_cursor(order_by, cursor)
+    op = '$gt' if direction == ASCENDING else '$lt'
+    if field == 'id':
+        return {'id': {op: item_id}}
+    return {'$or': [
+        {field: {op: value}},
+        {field: value, 'id': {op: item_id}},
+    ]}
@@ -1,5 +1,5 @@
 from abc import ABC, abstractmethod
-from typing import Any, Dict, TypeVar, Optional
+from typing import Any, AsyncIterator, Dict, List, TypeVar, Optional
 
 # Define a generic type variable _M
 _M = TypeVar('_M')
@@ -9,32 +9,70 @@ class Repository(ABC):
     __client: Any
 
     @abstractmethod
-    def search(self, search_params: Dict) -> Any:
+    async def search(self, search_params: Dict) -> Any:
         """
         Search in the database based on search_params
         """
         ...
 
     @abstractmethod
-    def list(
+    async def search_many(self, search_params_list: List[Dict]) -> List[Any]:
+        """
+        Run several searches in one round trip, returning the results of
+        each in the same order as search_params_list
+        """
+        ...
+
+    @abstractmethod
+    async def get_by_id(self, id: str) -> Any:
+        """
+        Get a single item from the database based on its ID
+        """
+        ...
+
+    @abstractmethod
+    async def list(
         self,
         order_by: Optional[str] = None,
-        limit: Optional[int] = None
+        limit: Optional[int] = None,
+        after: Optional[str] = None
     ) -> Any:
         """
-        List items from the database based on order_by and slots
+        List items from the database based on order_by and slots, starting
+        after the item the ``after`` cursor points to
+        """
+        ...
+
+    @abstractmethod
+    def stream(
+        self,
+        order_by: Optional[str] = None,
+        limit: Optional[int] = None,
+        after: Optional[str] = None,
+        fields: Optional[List[str]] = None
+    ) -> AsyncIterator[Dict]:
+        """
+        Iterate over items as plain documents, optionally restricted to fields
         """
         ...
 
     @abstractmethod
-    def save(self, model: _M) -> None:
+    async def save(self, model: _M) -> None:
         """
         Save a model of type _M to the database
         """
         ...
 
     @abstractmethod
-    def delete(self, id: str) -> None:
+    async def save_many(self, models: List[_M], overwrite: bool = False) -> None:
+        """
+        Save several models of type _M to the database in one round trip,
+        replacing existing items only if overwrite is set
+        """
+        ...
+
+    @abstractmethod
+    async def delete(self, id: str) -> None:
         """
         Delete an item from the database based on its ID
         """
@@ -0,0 +1,163 @@
+import asyncio
+import logging
+import os
+import time
+from typing import Dict, Optional, Tuple
+
+from data.repository import Repository
+from domain.models import Book
+from observability.metrics import Counter, Histogram
+
+logger = logging.getLogger(__name__)
+
+WRITE_BEHIND_BATCH_SIZE = int(os.environ.get('WRITE_BEHIND_BATCH_SIZE', '500'))
+WRITE_BEHIND_FLUSH_INTERVAL = float(os.environ.get('WRITE_BEHIND_FLUSH_INTERVAL', '1'))
+WRITE_BEHIND_MAX_PENDING = int(os.environ.get('WRITE_BEHIND_MAX_PENDING', '10000'))
+WRITE_BEHIND_MAX_WAIT = float(os.environ.get('WRITE_BEHIND_MAX_WAIT', '0.1'))
+
+WRITE_BEHIND_FLUSH_SECONDS = Histogram(
+    'write_behind_flush_duration_seconds',
+    'Time of a write-behind flush, failed ones included.',
+)
+WRITE_BEHIND_FLUSH_ERRORS = Counter(
+    'write_behind_flush_errors_total',
+    'Write-behind flushes whose write failed.',
+)
+WRITE_BEHIND_BOOKS = Counter(
+    'write_behind_books_total',
+    'Books leaving the write-behind queue, by outcome.',
+    ('outcome',),
+)
+BOOKS_WRITTEN = WRITE_BEHIND_BOOKS.labels('written')
+BOOKS_DROPPED = WRITE_BEHIND_BOOKS.labels('dropped')
+
+
+class WriteBehindQueue:
+    """
+    Buffer books discovered upstream and persist them in the background.
+
+    Books are deduplicated by id and flushed with ``Repository.save_many``
+    whenever ``batch_size`` books are pending or every ``flush_interval``
+    seconds; books put with ``overwrite`` replace the stored copy. When ``max_pending`` books are already buffered, ``put`` waits
+    up to ``max_wait`` seconds for a flush and then drops the book.
+    """
+
+    def __init__(
+        self,
+        repository: Repository,
+        batch_size: int = WRITE_BEHIND_BATCH_SIZE,
+        flush_interval: float = WRITE_BEHIND_FLUSH_INTERVAL,
+        max_pending: int = WRITE_BEHIND_MAX_PENDING,
+        max_wait: float = WRITE_BEHIND_MAX_WAIT,
+    ):
+        self.repository = repository
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.max_wait = max_wait
+        # Book id -> (latest copy, whether any put asked to overwrite)
+        self._pending: Dict[str, Tuple[Book, bool]] = {}
+        self._wakeup: Optional[asyncio.Event] = None
+        self._space: Optional[asyncio.Condition] = None
+        self._task: Optional[asyncio.Task] = None
+        self._flush_lock: Optional[asyncio.Lock] = None
+        # Totals for this queue; the exported metrics add up every queue
+        self.written = 0
+        self.dropped = 0
+        self.flush_errors = 0
+
+    @property
+    def depth(self) -> int:
+        return len(self._pending)
+
+    def _ensure_primitives(self) -> None:
+        if self._wakeup is None:
+            self._wakeup = asyncio.Event()
+            self._space = asyncio.Condition()
+            self._flush_lock = asyncio.Lock()
+
+    def start(self) -> None:
+        self._ensure_primitives()
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """
+        Stop the background task and flush everything still pending.
+        """
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        while self._pending:
+            if not await self.flush():
+                break
+
+    async def put(self, book: Book, overwrite: bool = False) -> bool:
+        self._ensure_primitives()
+        if book.id not in self._pending and len(self._pending) >= self.max_pending:
+            self._wakeup.set()
+            try:
+                async with self._space:
+                    await asyncio.wait_for(
+                        self._space.wait_for(lambda: len(self._pending) < self.max_pending),
+                        timeout=self.max_wait,
+                    )
+            except asyncio.TimeoutError:
+                self.dropped += 1
+                BOOKS_DROPPED.inc()
+                logger.warning("Write-behind queue full, dropping book %s", book.id)
+                return False
+        queued = self._pending.get(book.id)
+        self._pending[book.id] = (book, overwrite or (queued is not None and queued[1]))
+        if len(self._pending) >= self.batch_size:
+            self._wakeup.set()
+        return True
+
+    async def flush(self) -> bool:
+        """
+        Write one batch of pending books. Returns False if the write failed.
+        """
+        self._ensure_primitives()
+        async with self._flush_lock:
+            if not self._pending:
+                return True
+            ids = list(self._pending)[:self.batch_size]
+            batch = [self._pending.pop(book_id) for book_id in ids]
+            started = time.perf_counter()
+            try:
+                inserts = [book for book, overwrite in batch if not overwrite]
+                if inserts:
+                    await self.repository.save_many(inserts)
+                overwrites = [book for book, overwrite in batch if overwrite]
+                if overwrites:
+                    await self.repository.save_many(overwrites, overwrite=True)
+            except Exception:
+                self.flush_errors += 1
+                WRITE_BEHIND_FLUSH_ERRORS.inc()
+                logger.exception("Write-behind flush of %d books failed", len(batch))
+                # Put the batch back unless a newer copy was queued meanwhile
+                for book, overwrite in batch:
+                    self._pending.setdefault(book.id, (book, overwrite))
+                return False
+            finally:
+                WRITE_BEHIND_FLUSH_SECONDS.observe(time.perf_counter() - started)
+            self.written += len(batch)
+            BOOKS_WRITTEN.inc(len(batch))
+        async with self._space:
+            self._space.notify_all()
+        return True
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            while self._pending:
+                if not await self.flush() or len(self._pending) < self.batch_size:
+                    break
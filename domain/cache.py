@@ -0,0 +1,90 @@
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Tuple
+
+SEARCH_CACHE_SIZE = int(os.environ.get('SEARCH_CACHE_SIZE', '10000'))
+SEARCH_CACHE_TTL = float(os.environ.get('SEARCH_CACHE_TTL', '3600'))
+SEARCH_CACHE_NEGATIVE_TTL = float(os.environ.get('SEARCH_CACHE_NEGATIVE_TTL', '300'))
+
+MISSING = object()
+
+
+def normalize_search_params(search_params: Dict) -> Tuple:
+    """
+    Build a cache key that ignores key order, case and repeated whitespace.
+    """
+    return tuple(sorted(
+        (str(key).lower(), ' '.join(str(value).lower().split()))
+        for key, value in search_params.items()
+        if value is not None
+    ))
+
+
+class TTLCache:
+    """
+    Size-bounded LRU cache whose entries expire after a TTL.
+
+    Empty values (``None``, ``[]``) are cached too, with the shorter
+    ``negative_ttl``, so known misses are not re-queried on every request.
+    """
+
+    def __init__(
+        self,
+        maxsize: int = SEARCH_CACHE_SIZE,
+        ttl: float = SEARCH_CACHE_TTL,
+        negative_ttl: float = SEARCH_CACHE_NEGATIVE_TTL,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.clock = clock
+        self._data: 'OrderedDict[Hashable, Tuple[float, Any]]' = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def get(self, key: Hashable, default: Any = MISSING) -> Any:
+        entry = self._data.get(key)
+        if entry is None:
+            self.misses += 1
+            return default
+        expires_at, value = entry
+        if expires_at <= self.clock():
+            del self._data[key]
+            self.expirations += 1
+            self.misses += 1
+            return default
+        self._data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key: Hashable, value: Any) -> None:
+        ttl = self.ttl if value else self.negative_ttl
+        if ttl <= 0:
+            return
+        self._data[key] = (self.clock() + ttl, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+            self.evictions += 1
+
+    def invalidate(self, key: Hashable) -> None:
+        self._data.pop(key, None)
+
+    def clear(self) -> None:
+        self._data.clear()
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            'size': len(self._data),
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'expirations': self.expirations,
+        }
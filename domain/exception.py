@@ -1,3 +1,11 @@
 
 class BookNotFound(Exception):
-    pass
\ No newline at end of file
+    pass
+
+
+class SourcesUnavailable(Exception):
+    pass
+
+
+class PartialOutage(SourcesUnavailable):
+    pass
@@ -0,0 +1,143 @@
+import asyncio
+import os
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, Hashable, List, Optional, Tuple
+
+from domain.exception import PartialOutage, SourcesUnavailable
+
+SEARCH_GRACE_SECONDS = float(os.environ.get('SEARCH_GRACE_SECONDS', '0.05'))
+# Percentile of a source's recent latency after which a hedged request is
+# fired; unset disables hedging since it spends extra upstream quota.
+SEARCH_HEDGE_PERCENTILE = os.environ.get('SEARCH_HEDGE_PERCENTILE')
+
+Call = Tuple[Hashable, Callable[[], Awaitable[Any]]]
+
+
+class LatencyTracker:
+    """
+    Sliding window of recent successful call latencies per source.
+    """
+
+    def __init__(self, window: int = 200, min_samples: int = 20):
+        self.window = window
+        self.min_samples = min_samples
+        self._samples: Dict[Hashable, Deque[float]] = {}
+
+    def record(self, key: Hashable, seconds: float) -> None:
+        samples = self._samples.get(key)
+        if samples is None:
+            samples = self._samples[key] = deque(maxlen=self.window)
+        samples.append(seconds)
+
+    def percentile(self, key: Hashable, percentile: float) -> Optional[float]:
+        samples = self._samples.get(key)
+        if not samples or len(samples) < self.min_samples:
+            return None
+        ordered = sorted(samples)
+        index = min(len(ordered) - 1, int(len(ordered) * percentile / 100))
+        return ordered[index]
+
+
+class FanOut:
+    """
+    Race several sources and keep the first usable result.
+
+    Sources are given in priority order. As soon as a usable result arrives
+    it is returned if no preferred source is still pending; otherwise the
+    preferred sources get ``grace`` seconds to answer. Tasks that are no
+    longer needed are cancelled. ``SourcesUnavailable`` is raised when every
+    source failed, and ``PartialOutage`` when some failed and the others had
+    nothing, so callers can tell an outage from a genuine miss.
+    """
+
+    def __init__(
+        self,
+        grace: float = SEARCH_GRACE_SECONDS,
+        hedge_percentile: Optional[float] = (
+            float(SEARCH_HEDGE_PERCENTILE) if SEARCH_HEDGE_PERCENTILE else None
+        ),
+        latencies: Optional[LatencyTracker] = None,
+        is_usable: Callable[[Any], bool] = bool,
+    ):
+        self.grace = grace
+        self.hedge_percentile = hedge_percentile
+        self.latencies = latencies or LatencyTracker()
+        self.is_usable = is_usable
+
+    async def first(self, calls: List[Call]) -> Any:
+        tasks = [asyncio.ensure_future(self._call(key, factory)) for key, factory in calls]
+        try:
+            return await self._race(tasks)
+        finally:
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+
+    async def _race(self, tasks: List[asyncio.Future]) -> Any:
+        loop = asyncio.get_running_loop()
+        best: Optional[int] = None
+        grace_ends: Optional[float] = None
+        pending = set(tasks)
+
+        while pending:
+            timeout = None if grace_ends is None else max(0.0, grace_ends - loop.time())
+            done, pending = await asyncio.wait(
+                pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED
+            )
+            if not done:
+                break
+
+            for task in done:
+                if task.cancelled() or task.exception() is not None:
+                    continue
+                index = tasks.index(task)
+                if self.is_usable(task.result()) and (best is None or index < best):
+                    best = index
+
+            if best is None:
+                continue
+            if all(task.done() for task in tasks[:best]):
+                break
+            if grace_ends is None:
+                grace_ends = loop.time() + self.grace
+
+        if best is not None:
+            return tasks[best].result()
+        failed = [task for task in tasks if task.done() and not task.cancelled() and task.exception() is not None]
+        if tasks and len(failed) == len(tasks):
+            raise SourcesUnavailable("Every source failed")
+        if failed:
+            # The failed sources might have had the answer
+            raise PartialOutage(f"{len(failed)} of {len(tasks)} sources failed")
+        return None
+
+    def _hedge_delay(self, key: Hashable) -> Optional[float]:
+        if self.hedge_percentile is None:
+            return None
+        return self.latencies.percentile(key, self.hedge_percentile)
+
+    async def _call(self, key: Hashable, factory: Callable[[], Awaitable[Any]]) -> Any:
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        attempts = {asyncio.ensure_future(factory())}
+        error: Optional[BaseException] = None
+        try:
+            delay = self._hedge_delay(key)
+            if delay is not None:
+                done, _ = await asyncio.wait(attempts, timeout=delay)
+                if not done:
+                    attempts.add(asyncio.ensure_future(factory()))
+
+            while attempts:
+                done, attempts = await asyncio.wait(
+                    attempts, return_when=asyncio.FIRST_COMPLETED
+                )
+                for attempt in done:
+                    if attempt.exception() is None:
+                        self.latencies.record(key, loop.time() - started)
+                        return attempt.result()
+                    error = attempt.exception()
+            raise error
+        finally:
+            for attempt in attempts:
+                attempt.cancel()
@@ -8,6 +8,11 @@ def validate_date(value):
     if isinstance(value, datetime):
         return value
     if isinstance(value, str):
+        try:
+            # ISO dates are by far the most common input and much cheaper to parse
+            return datetime.fromisoformat(value)
+        except ValueError:
+            pass
         date = parser.parse(value, default=datetime(1, 1, 1))
         return date
     raise TypeError('Invalid type for date')
@@ -27,6 +32,8 @@ class Book(BaseModel):
     description: str = Field(...)
     image: Optional[str] = Field(None)
     origin: str = Field(default='repository')
+    # When the book was last fetched from its origin; None if never
+    fetched_at: Optional[datetime] = Field(None)
 
     class Config:
         json_schema_extra = {
@@ -0,0 +1,44 @@
+import os
+from typing import List, Optional, Tuple
+
+from apis.connector import RestConnector
+
+# Cap on connectors queried per search; unset queries every capable one
+SEARCH_MAX_SOURCES = os.environ.get('SEARCH_MAX_SOURCES')
+
+Plan = List[Tuple[RestConnector, dict]]
+
+
+class QueryPlanner:
+    """
+    Decide which connectors a query is sent to, and with which params.
+
+    Connectors that cannot filter on any of the search params, or cannot
+    have issued the requested id, are skipped. The rest are ordered by the
+    number of params they have to drop, then by cost and typical latency, so
+    the first entries of the plan are the cheapest complete answers.
+    """
+
+    def __init__(
+        self,
+        max_sources: Optional[int] = int(SEARCH_MAX_SOURCES) if SEARCH_MAX_SOURCES else None,
+    ):
+        self.max_sources = max_sources
+
+    def plan_search(self, clients: List[RestConnector], search_params: dict) -> Plan:
+        ranked = []
+        for position, client in enumerate(clients):
+            params = client.translate(search_params)
+            if params is None:
+                continue
+            capabilities = client.capabilities
+            dropped = len(set(search_params) - capabilities.search_fields)
+            rank = (dropped, capabilities.cost, capabilities.latency, position)
+            ranked.append((rank, client, params))
+        ranked.sort(key=lambda entry: entry[0])
+        return [(client, params) for _, client, params in ranked[:self.max_sources]]
+
+    def plan_lookup(self, clients: List[RestConnector], book_id: str) -> List[RestConnector]:
+        owners = [client for client in clients if client.owns_id(book_id)]
+        owners.sort(key=lambda client: (client.capabilities.cost, client.capabilities.latency))
+        return owners[:self.max_sources]
@@ -0,0 +1,184 @@
+import asyncio
+import logging
+import os
+from datetime import datetime
+from typing import Callable, Dict, Iterable, List, Optional
+
+from apis.connector import RestConnector, utcnow
+from apis.quota import BACKGROUND, priority_scope
+from apis.retry import deadline_scope
+from data.repository import Repository
+from domain.cache import MISSING, TTLCache
+from domain.models import Book
+
+logger = logging.getLogger(__name__)
+
+# Books fetched within this window are served without a refresh
+BOOK_FRESH_SECONDS = float(os.environ.get('BOOK_FRESH_SECONDS', str(7 * 24 * 3600)))
+# Older books are no longer served as-is; unset serves stale books forever
+BOOK_MAX_STALE_SECONDS = os.environ.get('BOOK_MAX_STALE_SECONDS')
+REFRESH_BATCH_SIZE = int(os.environ.get('REFRESH_BATCH_SIZE', '20'))
+REFRESH_INTERVAL = float(os.environ.get('REFRESH_INTERVAL', '5'))
+REFRESH_MAX_PENDING = int(os.environ.get('REFRESH_MAX_PENDING', '1000'))
+# A book whose refresh was attempted is not retried for this long
+REFRESH_RETRY_SECONDS = float(os.environ.get('REFRESH_RETRY_SECONDS', '600'))
+REFRESH_DEADLINE_SECONDS = float(os.environ.get('REFRESH_DEADLINE_SECONDS', '30'))
+
+
+def merge(stored: Book, fresh: Book) -> Book:
+    """
+    Overlay a refreshed book on the stored copy, keeping the stored value of
+    every field the refreshed record leaves empty (Open Library works, for
+    one, have no publisher).
+    """
+    kept = {
+        name: getattr(stored, name) for name in Book.model_fields
+        if not getattr(fresh, name) and getattr(stored, name)
+    }
+    return fresh.model_copy(update=kept) if kept else fresh
+
+
+class BackgroundRefresher:
+    """
+    Keep stored books current without making readers wait for upstream.
+
+    Readers hand every book they serve to ``schedule``; books older than
+    ``fresh_for`` seconds are queued and re-fetched from the connector named
+    by their ``origin``, at most ``batch_size`` at a time every ``interval``
+    seconds and at background quota priority. Refreshed books overwrite
+    the stored copy, except for fields the refreshed record leaves empty.
+    """
+
+    def __init__(
+        self,
+        repository: Repository,
+        clients: List[RestConnector],
+        fresh_for: float = BOOK_FRESH_SECONDS,
+        max_stale: Optional[float] = float(BOOK_MAX_STALE_SECONDS) if BOOK_MAX_STALE_SECONDS else None,
+        batch_size: int = REFRESH_BATCH_SIZE,
+        interval: float = REFRESH_INTERVAL,
+        max_pending: int = REFRESH_MAX_PENDING,
+        retry_after: float = REFRESH_RETRY_SECONDS,
+        clock: Callable[[], datetime] = utcnow,
+    ):
+        self.repository = repository
+        self.clients: Dict[str, RestConnector] = {client.origin: client for client in clients}
+        self.fresh_for = fresh_for
+        self.max_stale = max_stale
+        self.batch_size = batch_size
+        self.interval = interval
+        self.max_pending = max_pending
+        self.clock = clock
+        self._pending: Dict[str, Book] = {}
+        self._attempted = TTLCache(maxsize=max_pending * 10, ttl=retry_after, negative_ttl=retry_after)
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        # Metrics
+        self.refreshed = 0
+        self.gone = 0
+        self.kept = 0
+        self.failed = 0
+        self.skipped = 0
+
+    @property
+    def depth(self) -> int:
+        return len(self._pending)
+
+    def age(self, book: Book) -> float:
+        if book.fetched_at is None:
+            return float('inf')
+        return (self.clock() - book.fetched_at).total_seconds()
+
+    def is_stale(self, book: Book) -> bool:
+        return self.age(book) > self.fresh_for
+
+    def is_expired(self, book: Book) -> bool:
+        """
+        Whether the book is too old to be served while it is refreshed.
+        """
+        return self.max_stale is not None and self.age(book) > self.max_stale
+
+    def schedule(self, books: Iterable[Book]) -> int:
+        """
+        Queue the stale books among ``books`` for a refresh.
+        """
+        queued = 0
+        for book in books:
+            if not self.is_stale(book) or book.id in self._pending:
+                continue
+            if book.origin not in self.clients or self._attempted.get(book.id) is not MISSING:
+                continue
+            if len(self._pending) >= self.max_pending:
+                self.skipped += 1
+                continue
+            self._pending[book.id] = book
+            queued += 1
+        if queued and self._wakeup is not None and len(self._pending) >= self.batch_size:
+            self._wakeup.set()
+        return queued
+
+    def start(self) -> None:
+        if self._wakeup is None:
+            self._wakeup = asyncio.Event()
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        # Pending refreshes are dropped: stored copies stay usable
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def refresh(self) -> int:
+        """
+        Refresh one batch of pending books. Returns how many were updated.
+        """
+        ids = list(self._pending)[:self.batch_size]
+        batch = [self._pending.pop(book_id) for book_id in ids]
+        if not batch:
+            return 0
+        for book in batch:
+            self._attempted.set(book.id, True)
+
+        with priority_scope(BACKGROUND), deadline_scope(REFRESH_DEADLINE_SECONDS):
+            results = await asyncio.gather(
+                *[self.clients[book.origin].refresh(book) for book in batch],
+                return_exceptions=True,
+            )
+
+        books = []
+        for book, result in zip(batch, results):
+            if isinstance(result, Exception):
+                self.failed += 1
+                logger.debug("Refresh of book %s failed: %s", book.id, result)
+            elif result is None:
+                # Unknown upstream now; the stored copy is kept as it is
+                self.gone += 1
+            elif result is book:
+                # Upstream record too incomplete to replace the stored copy
+                self.kept += 1
+            else:
+                books.append(merge(book, result))
+        if books:
+            now = self.clock()
+            for book in books:
+                book.fetched_at = now
+            await self.repository.save_many(books, overwrite=True)
+            self.refreshed += len(books)
+        return len(books)
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            try:
+                await self.refresh()
+            except Exception:
+                logger.exception("Book refresh failed")
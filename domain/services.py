@@ -1,34 +1,237 @@
 import asyncio
-from typing import Optional, Union
+import os
+from typing import AsyncIterator, Dict, List, Optional, Tuple
 
 from apis.connector import RestConnector
-from apis.exceptions import ConnectorFails
-from domain.exception import BookNotFound
+from data.write_behind import WriteBehindQueue
+from domain.cache import MISSING, TTLCache, normalize_search_params
+from domain.exception import BookNotFound, SourcesUnavailable
+from domain.fanout import FanOut
 from domain.models import Book
+from domain.planner import QueryPlanner
+from domain.refresher import BackgroundRefresher, utcnow
+from domain.singleflight import SingleFlight
+from observability.metrics import Counter
+from observability.tracing import traced
+
+
+# Shared so that latency history used for hedging survives across requests
+default_fanout = FanOut()
+# Upstream searches in flight at once for one batch
+BATCH_CONCURRENCY = int(os.environ.get('BATCH_CONCURRENCY', '8'))
+
+REPOSITORY_LOOKUPS = Counter(
+    'book_repository_lookups_total',
+    'Searches and lookups answered from the repository (hit) or sent upstream (miss).',
+    ('operation', 'result'),
+)
+SEARCH_HITS = REPOSITORY_LOOKUPS.labels('search', 'hit')
+SEARCH_MISSES = REPOSITORY_LOOKUPS.labels('search', 'miss')
+GET_HITS = REPOSITORY_LOOKUPS.labels('get', 'hit')
+GET_MISSES = REPOSITORY_LOOKUPS.labels('get', 'miss')
 
 
 class BookServices:
 
-    def __init__(self, repository, clients: list[RestConnector]):
+    def __init__(
+        self,
+        repository,
+        clients: list[RestConnector],
+        fanout: Optional[FanOut] = None,
+        cache: Optional[TTLCache] = None,
+        inflight: Optional[SingleFlight] = None,
+        writer: Optional[WriteBehindQueue] = None,
+        planner: Optional[QueryPlanner] = None,
+        refresher: Optional[BackgroundRefresher] = None,
+    ):
         self.repository = repository
         self.clients = clients
+        self.fanout = fanout or default_fanout
+        self.cache = cache
+        self.inflight = inflight or SingleFlight()
+        self.writer = writer
+        self.planner = planner or QueryPlanner()
+        self.refresher = refresher
 
-    async def search_books(self, search_params: dict) -> Union[list[Book], Book, None]:
+    @traced('services search_books')
+    async def search_books(self, search_params: dict) -> list[Book]:
         books = await self.repository.search(search_params)
-        if books:
+        if self._serve_local(books):
+            SEARCH_HITS.inc()
             return books
+        SEARCH_MISSES.inc()
+        result = await self._search_upstream(search_params, overwrite=bool(books))
+        self._schedule_unrefreshed(books, result)
+        # Books too old to serve as-is are still better than nothing
+        return result or books
+
+    async def search_books_batch(
+        self, queries: List[dict], concurrency: int = BATCH_CONCURRENCY
+    ) -> AsyncIterator[Tuple[List[int], list[Book]]]:
+        """
+        Resolve many searches, yielding (positions in queries, books) as each
+        distinct search completes.
+
+        Repeated searches are resolved once, local hits are found with a
+        single repository round trip and misses go upstream with at most
+        ``concurrency`` in flight.
+        """
+        positions: Dict[tuple, List[int]] = {}
+        distinct: Dict[tuple, dict] = {}
+        for position, search_params in enumerate(queries):
+            key = normalize_search_params(search_params)
+            positions.setdefault(key, []).append(position)
+            distinct.setdefault(key, search_params)
+
+        keys = list(distinct)
+        found = await self.repository.search_many([distinct[key] for key in keys])
+        misses = []
+        for key, books in zip(keys, found):
+            if self._serve_local(books):
+                SEARCH_HITS.inc()
+                yield positions[key], books
+            else:
+                SEARCH_MISSES.inc()
+                misses.append((key, books))
+
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def resolve(key: tuple, books: list[Book]) -> Tuple[tuple, list[Book]]:
+            async with semaphore:
+                result = await self._search_upstream(distinct[key], overwrite=bool(books))
+            self._schedule_unrefreshed(books, result)
+            return key, result or books
+
+        tasks = [asyncio.ensure_future(resolve(key, books)) for key, books in misses]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                key, books = await next_done
+                yield positions[key], books
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    def _serve_local(self, books: list[Book]) -> bool:
+        """
+        Whether books found in the repository can be served as they are.
+        """
+        if not books:
+            return False
+        if self.refresher is None:
+            return True
+        if all(self.refresher.is_expired(book) for book in books):
+            # Re-fetched by the caller right away instead
+            return False
+        # Stale books are served now and re-fetched in the background
+        self.refresher.schedule(books)
+        return True
 
-        tasks = [client.search(search_params) for client in self.clients]
-        results = await asyncio.gather(*tasks, return_exceptions=True)
+    def _schedule_unrefreshed(self, stored: list[Book], fetched: Optional[list[Book]]) -> None:
+        """
+        Queue for a background refresh the expired stored books that a
+        synchronous re-fetch did not bring back.
+        """
+        if self.refresher is None or not stored:
+            return
+        fetched_ids = {book.id for book in fetched or []}
+        unrefreshed = [book for book in stored if book.id not in fetched_ids]
+        if unrefreshed:
+            self.refresher.schedule(unrefreshed)
 
-        for result in results:
-            if isinstance(result, Exception):
-                continue
-            if result:
-                await self.repository.save(result)
+    async def _search_upstream(self, search_params: dict, overwrite: bool = False) -> list[Book]:
+        # Identical concurrent misses share one upstream fetch and one write
+        key = normalize_search_params(search_params)
+        return await self.inflight.do(key, lambda: self._search_clients(key, search_params, overwrite))
+
+    @traced('services get_book')
+    async def get_book(self, book_id: str) -> Optional[Book]:
+        book = await self.repository.get_by_id(book_id)
+        if book and self._serve_local([book]):
+            GET_HITS.inc()
+            return book
+        GET_MISSES.inc()
+        result = await self._fetch_upstream(book_id, overwrite=book is not None)
+        if book:
+            self._schedule_unrefreshed([book], [result] if result else [])
+        return result or book
+
+    async def _fetch_upstream(self, book_id: str, overwrite: bool = False) -> Optional[Book]:
+        key = (('id', book_id),)
+        return await self.inflight.do(key, lambda: self._fetch_by_id(key, book_id, overwrite))
+
+    @traced('upstream fetch')
+    async def _fetch_by_id(self, key: tuple, book_id: str, overwrite: bool = False) -> Optional[Book]:
+        if self.cache is not None:
+            result = self.cache.get(key)
+            if result is not MISSING:
+                if result and overwrite:
+                    # Fetched since the stored copy, which it replaces
+                    await self._store([result], overwrite)
                 return result
 
-        return []
+        # Only the APIs that issue ids of this shape can resolve it
+        clients = self.planner.plan_lookup(self.clients, book_id)
+        try:
+            result = await self.fanout.first([
+                (client, lambda client=client: client.get_by_id(book_id))
+                for client in clients
+            ])
+        except SourcesUnavailable:
+            return None
+
+        if self.cache is not None:
+            self.cache.set(key, result)
+        if result:
+            await self._store([result], overwrite)
+        return result
+
+    @traced('upstream search')
+    async def _search_clients(self, key: tuple, search_params: dict, overwrite: bool = False) -> list[Book]:
+        if self.cache is not None:
+            result = self.cache.get(key)
+            if result is not MISSING:
+                if result and overwrite:
+                    await self._store(result, overwrite)
+                return result
+
+        # Connectors that cannot filter on the params are not called at all
+        plan = self.planner.plan_search(self.clients, search_params)
+        try:
+            result = await self.fanout.first([
+                (client, lambda client=client, params=params: client.search(params))
+                for client, params in plan
+            ])
+        except SourcesUnavailable:
+            # Outages are not cached as misses
+            return []
+
+        result = result or []
+        if self.cache is not None:
+            self.cache.set(key, result)
+        if result:
+            # Every book of the page warms the local catalogue, not just the first
+            await self._store(result, overwrite)
+        return result
+
+    @traced('store')
+    async def _store(self, books: list[Book], overwrite: bool = False) -> None:
+        """
+        Save books fetched upstream. With ``overwrite`` they replace the
+        stored copies, which callers pass when those had expired.
+        """
+        # Connectors stamp when they fetched a book; a disk cache hit keeps its original time
+        now = self.refresher.clock() if self.refresher is not None else utcnow()
+        for book in books:
+            if book.fetched_at is None:
+                book.fetched_at = now
+        # With a write-behind queue the caller does not wait on the database
+        if self.writer is not None:
+            for book in books:
+                await self.writer.put(book, overwrite)
+        elif overwrite:
+            await self.repository.save_many(books, overwrite=True)
+        else:
+            await self.repository.save_many(books)
 
     async def delete_book(self, id: str) -> None:
         await self.repository.delete(id)
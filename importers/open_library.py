@@ -0,0 +1,339 @@
+"""
+Seed the books collection from an Open Library dump.
+
+    python -m importers.open_library ol_dump_works_latest.txt.gz \
+        [--authors ol_dump_authors_latest.txt.gz] [--workers 4] [--resume]
+
+Accepts the official dumps (gzip or plain TSV: type, key, revision,
+last_modified, JSON record) and JSON lines files holding one work or one
+search.json doc per line. The file is streamed, records are mapped in a
+process pool with the same code as OpenLibraryConnector and written with
+unordered bulk upserts. After every batch the number of lines written is
+saved to a checkpoint file, which --resume continues from.
+
+Author names are looked up in a SQLite index of the authors dump, built
+next to it on first use, so workers do not each hold every author in memory.
+"""
+import argparse
+import asyncio
+import gzip
+import itertools
+import json
+import logging
+import os
+import sqlite3
+import time
+from collections import Counter
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import IO, Awaitable, Callable, Dict, Iterator, List, Optional, Tuple
+
+from apis.open_library import OpenLibraryConnector
+from data.mongo_connector import MONGO_DB, mongo_client
+from data.mongo_repository import MongoDBRepository
+from domain.models import Book
+from domain.refresher import utcnow
+
+logger = logging.getLogger(__name__)
+
+CHUNK_LINES = 5000
+BATCH_SIZE = 10000
+REPORT_SECONDS = 10.0
+AUTHOR_INSERT_BATCH = 10000
+WORK_TYPE = '/type/work'
+AUTHOR_TYPE = '/type/author'
+
+# Set in every worker process by _init_worker
+_connector: Optional[OpenLibraryConnector] = None
+_repository: Optional[MongoDBRepository] = None
+_authors: Optional[sqlite3.Connection] = None
+
+
+def open_dump(path: str) -> IO[bytes]:
+    return gzip.open(path, 'rb') if path.endswith('.gz') else open(path, 'rb')
+
+
+def parse_record(line: bytes, record_type: str = WORK_TYPE) -> Optional[dict]:
+    """
+    Extract the JSON record of a dump TSV row or a JSON line; None for other types.
+    """
+    columns = line.rstrip(b'\r\n').split(b'\t')
+    if len(columns) == 5:
+        if columns[0].decode() != record_type:
+            return None
+        return json.loads(columns[4])
+    return json.loads(line)
+
+
+def iter_authors(path: str) -> Iterator[Tuple[str, str]]:
+    """
+    Yield (author key, name), e.g. ("/authors/OL34184A", "Roald Dahl"), from an authors dump.
+    """
+    with open_dump(path) as dump:
+        for line in dump:
+            try:
+                record = parse_record(line, AUTHOR_TYPE)
+            except ValueError:
+                continue
+            if record and record.get('key') and record.get('name'):
+                yield record['key'], record['name']
+
+
+def build_author_index(dump_path: str, index_path: str) -> int:
+    """
+    Write the author names of an authors dump to a SQLite file at
+    index_path, replacing it atomically. Returns the number of authors.
+    """
+    temporary = f'{index_path}.tmp'
+    if os.path.exists(temporary):
+        os.remove(temporary)
+    db = sqlite3.connect(temporary)
+    try:
+        db.execute('CREATE TABLE authors (key TEXT PRIMARY KEY, name TEXT NOT NULL) WITHOUT ROWID')
+        count = 0
+        authors = iter_authors(dump_path)
+        while True:
+            batch = list(itertools.islice(authors, AUTHOR_INSERT_BATCH))
+            if not batch:
+                break
+            db.executemany('INSERT OR REPLACE INTO authors VALUES (?, ?)', batch)
+            count += len(batch)
+        db.commit()
+    finally:
+        db.close()
+    os.replace(temporary, index_path)
+    return count
+
+
+def author_index(dump_path: str) -> str:
+    """
+    Path of the index of an authors dump, (re)built if missing or older than the dump.
+    """
+    index_path = f'{dump_path}.sqlite3'
+    if not os.path.exists(index_path) or os.path.getmtime(index_path) < os.path.getmtime(dump_path):
+        logger.info("Indexing authors of %s", dump_path)
+        logger.info("%d authors indexed", build_author_index(dump_path, index_path))
+    return index_path
+
+
+def author_names(keys: List[str]) -> List[str]:
+    """
+    Names of the authors with the given keys, in order, leaving out unknown ones.
+    """
+    keys = [key for key in keys if key]
+    if _authors is None or not keys:
+        return []
+    rows = _authors.execute(
+        f'SELECT key, name FROM authors WHERE key IN ({", ".join("?" * len(keys))})', keys
+    )
+    names = dict(rows)
+    return [names[key] for key in keys if key in names]
+
+
+class Skipped(Exception):
+    """
+    A record that does not make a book; the message is the reason.
+    """
+
+
+def to_book(record: dict) -> Book:
+    if not record.get('title'):
+        raise Skipped('untitled')
+    if 'author_name' in record or 'cover_i' in record:
+        # search.json doc
+        if not record.get('publish_date') and not record.get('first_publish_year'):
+            raise Skipped('undated')
+        book = _connector._to_book(record)
+    else:
+        # Works without a date cannot be stored; they are counted, not guessed
+        if not record.get('first_publish_date'):
+            raise Skipped('undated')
+        names = author_names([author.get('author', {}).get('key') for author in record.get('authors', [])])
+        book = _connector._work_to_book(record['key'].split('/')[-1], record, names)
+    # Imported books count as fresh, so reading them does not trigger refreshes
+    book.fetched_at = utcnow()
+    return book
+
+
+def _init_worker(authors_index: Optional[str]) -> None:
+    global _connector, _repository, _authors
+    _connector = OpenLibraryConnector()
+    _repository = MongoDBRepository(None, MONGO_DB, 'books')
+    # Read-only, so any number of workers can share the file
+    _authors = sqlite3.connect(f'file:{authors_index}?mode=ro', uri=True) if authors_index else None
+
+
+def parse_chunk(lines: List[bytes]) -> Tuple[List[dict], Dict[str, int]]:
+    """
+    Map raw dump lines to Mongo documents. Returns (documents, skipped lines by reason).
+    """
+    documents = []
+    skipped: Dict[str, int] = Counter()
+    for line in lines:
+        try:
+            record = parse_record(line)
+        except ValueError:
+            skipped['invalid_json'] += 1
+            continue
+        if record is None:
+            skipped['other_type'] += 1
+            continue
+        if not isinstance(record, dict):
+            skipped['invalid_record'] += 1
+            continue
+        try:
+            book = to_book(record)
+        except Skipped as exc:
+            skipped[str(exc)] += 1
+            logger.debug("Skipping %s record %s", exc, record.get('key'))
+            continue
+        except (ValueError, TypeError, KeyError, IndexError, AttributeError) as exc:
+            skipped['invalid_record'] += 1
+            logger.debug("Skipping invalid record %s: %s", record.get('key'), exc)
+            continue
+        documents.append(_repository.to_document(book))
+    return documents, skipped
+
+
+def read_chunks(path: str, skip_lines: int, chunk_lines: int) -> Iterator[List[bytes]]:
+    with open_dump(path) as dump:
+        for _ in range(skip_lines):
+            if not dump.readline():
+                return
+        chunk = []
+        for line in dump:
+            chunk.append(line)
+            if len(chunk) >= chunk_lines:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+
+
+class Checkpoint:
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def load(self) -> int:
+        try:
+            with open(self.path) as file:
+                return json.load(file)['lines']
+        except FileNotFoundError:
+            return 0
+
+    def save(self, lines: int) -> None:
+        # Write then rename, so a crash never leaves a truncated checkpoint
+        temporary = f'{self.path}.tmp'
+        with open(temporary, 'w') as file:
+            json.dump({'lines': lines}, file)
+        os.replace(temporary, self.path)
+
+
+class Progress:
+
+    def __init__(self, lines: int = 0):
+        self.started = time.monotonic()
+        self.reported = self.started
+        self.lines = lines
+        self.written = 0
+        self.skipped = 0
+        self.skipped_by_reason: Dict[str, int] = Counter()
+
+    def report(self, force: bool = False) -> None:
+        now = time.monotonic()
+        if not force and now - self.reported < REPORT_SECONDS:
+            return
+        self.reported = now
+        elapsed = max(now - self.started, 1e-9)
+        reasons = ', '.join(f'{reason}: {count}' for reason, count in sorted(self.skipped_by_reason.items()))
+        logger.info(
+            "%d lines, %d books written (%.0f books/s), %d skipped%s",
+            self.lines, self.written, self.written / elapsed, self.skipped, f' ({reasons})' if reasons else '',
+        )
+
+
+async def import_dump(
+    path: str,
+    write: Callable[[List[dict]], Awaitable[None]],
+    checkpoint: Optional[Checkpoint] = None,
+    authors_index: Optional[str] = None,
+    workers: int = os.cpu_count() or 1,
+    batch_size: int = BATCH_SIZE,
+    chunk_lines: int = CHUNK_LINES,
+) -> Progress:
+    """
+    Stream the dump at path through the worker pool into ``write``.
+
+    Chunks are parsed ahead while a batch is being written, but at most
+    ``2 * workers`` of them are held at once, so memory use does not grow
+    with the size of the dump.
+    """
+    start = checkpoint.load() if checkpoint else 0
+    progress = Progress(start)
+    loop = asyncio.get_running_loop()
+    with ProcessPoolExecutor(workers, initializer=_init_worker, initargs=(authors_index,)) as pool:
+        chunks = read_chunks(path, start, chunk_lines)
+        in_flight: List[Tuple[Future, int]] = []
+        batch: List[dict] = []
+        batch_lines = 0
+
+        def submit() -> None:
+            chunk = next(chunks, None)
+            if chunk is not None:
+                in_flight.append((pool.submit(parse_chunk, chunk), len(chunk)))
+
+        for _ in range(2 * workers):
+            submit()
+        while in_flight:
+            future, lines = in_flight.pop(0)
+            documents, skipped = await asyncio.wrap_future(future, loop=loop)
+            submit()
+            batch.extend(documents)
+            batch_lines += lines
+            progress.skipped += sum(skipped.values())
+            progress.skipped_by_reason.update(skipped)
+            if len(batch) >= batch_size or not in_flight:
+                await write(batch)
+                progress.lines += batch_lines
+                progress.written += len(batch)
+                if checkpoint:
+                    checkpoint.save(progress.lines)
+                batch, batch_lines = [], 0
+                progress.report()
+    progress.report(force=True)
+    return progress
+
+
+async def main(args: argparse.Namespace) -> None:
+    await mongo_client.connect()
+    try:
+        repository = MongoDBRepository(mongo_client, MONGO_DB, 'books')
+        authors_index = author_index(args.authors) if args.authors else None
+        checkpoint = Checkpoint(args.checkpoint or f'{args.dump}.checkpoint')
+        if not args.resume:
+            checkpoint.save(0)
+        await import_dump(
+            args.dump,
+            lambda documents: repository.save_documents(documents, overwrite=args.overwrite),
+            checkpoint=checkpoint,
+            authors_index=authors_index,
+            workers=args.workers,
+            batch_size=args.batch_size,
+        )
+    finally:
+        mongo_client.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('dump', help='works dump or JSON lines file, optionally gzipped')
+    parser.add_argument(
+        '--authors', help='authors dump used to resolve author names of works, indexed to <authors>.sqlite3',
+    )
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+    parser.add_argument('--checkpoint', help='defaults to <dump>.checkpoint')
+    parser.add_argument('--resume', action='store_true', help='continue after the last checkpoint')
+    parser.add_argument('--overwrite', action='store_true', help='replace books that are already stored')
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(message)s')
+    asyncio.run(main(parser.parse_args()))
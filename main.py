@@ -1,38 +1,219 @@
 import os
+from contextlib import asynccontextmanager
 
-from fastapi import FastAPI, Depends, HTTPException, Header
+from fastapi import FastAPI, Depends, HTTPException, Header, Query
+from fastapi.responses import PlainTextResponse, StreamingResponse
 from starlette import status
 
+from admission import (
+    ADMISSION_READ_LIMIT, ADMISSION_SEARCH_LIMIT, AdmissionController, AdmissionMiddleware, RouteClass,
+)
+from apis.disk_cache import UPSTREAM_DISK_CACHE_PATH, DiskCache
 from apis.google_connector import GoogleBooksConnector
+from apis.health import CLOSED
+from apis.http_session import http_sessions
 from apis.open_library import OpenLibraryConnector
+from apis.retry import deadline_scope
 from data.mongo_connector import mongo_client, MONGO_DB
 from data.mongo_repository import MongoDBRepository
+from data.pagination import decode_cursor, encode_cursor, parse_order
+from data.write_behind import WriteBehindQueue
+from domain.cache import TTLCache
+from domain.refresher import BackgroundRefresher
 from domain.services import BookServices
+from domain.singleflight import SingleFlight
 from domain.models import Book, SearchParams
-from typing import Union
+from observability.metrics import CONTENT_TYPE, REGISTRY, Gauge, MetricsMiddleware
+from observability.tracing import PROFILE_MAX_REQUESTS, TracedRoute, TracingMiddleware, default_tracer, span
+from responses import FastJSONResponse, dumps
+from typing import AsyncIterator, List, Optional
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await mongo_client.connect()
+    book_writer.start()
+    book_refresher.start()
+    default_tracer.start()
+    try:
+        yield
+    finally:
+        await default_tracer.stop()
+        await book_refresher.stop()
+        await book_writer.stop()
+        if upstream_cache is not None:
+            await upstream_cache.close()
+        await http_sessions.close()
+        mongo_client.close()
+
+
+app = FastAPI(lifespan=lifespan)
+
 
-app = FastAPI()
+def classify_request(method: str, path: str) -> Optional[str]:
+    """
+    Pick the admission route class of a request; None leaves it uncontrolled.
+    """
+    if not path.startswith('/books'):
+        return None
+    # Searches can fan out upstream; the other book routes are served from Mongo first
+    if path.startswith('/books/search'):
+        return 'search'
+    return 'read'
+
+
+admission = AdmissionController([
+    RouteClass('read', ADMISSION_READ_LIMIT, priority=0),
+    RouteClass('search', ADMISSION_SEARCH_LIMIT, priority=10),
+])
+
+app.router.route_class = TracedRoute
+# Innermost, so shed requests and queueing time still show in metrics and traces
+app.add_middleware(AdmissionMiddleware, controller=admission, classify=classify_request)
+app.add_middleware(MetricsMiddleware)
+app.add_middleware(TracingMiddleware, tracer=default_tracer)
+
+# Connectors are stateless apart from the shared HTTP sessions, so a single
+# instance of each is reused by every request.
+# Optional, so restarts do not send every repeated upstream call over the network again
+upstream_cache = DiskCache(UPSTREAM_DISK_CACHE_PATH) if UPSTREAM_DISK_CACHE_PATH else None
+connectors = [GoogleBooksConnector(disk_cache=upstream_cache), OpenLibraryConnector(disk_cache=upstream_cache)]
+search_cache = TTLCache()
+search_inflight = SingleFlight()
+book_repository = MongoDBRepository(mongo_client, MONGO_DB, "books")
+book_writer = WriteBehindQueue(book_repository)
+book_refresher = BackgroundRefresher(book_repository, connectors)
 
 
 def get_book_services() -> BookServices:
-    collection_name = "books"
-    repository = MongoDBRepository(mongo_client, MONGO_DB, collection_name)
-    clients = [GoogleBooksConnector(), OpenLibraryConnector()]
-    return BookServices(repository, clients)
+    with span('get_book_services'):
+        return BookServices(
+            book_repository,
+            connectors,
+            cache=search_cache,
+            inflight=search_inflight,
+            writer=book_writer,
+            refresher=book_refresher,
+        )
+
+
+# Component state is read when /metrics is scraped, costing nothing per request
+QUEUE_DEPTH = Gauge('background_queue_depth', 'Items waiting in a background queue.', ('queue',))
+QUEUE_DEPTH.labels('write_behind').set_function(lambda: book_writer.depth)
+QUEUE_DEPTH.labels('refresh').set_function(lambda: book_refresher.depth)
+Gauge('search_cache_entries', 'Entries held by the upstream search cache.').set_function(lambda: len(search_cache))
+UPSTREAM_CIRCUIT_OPEN = Gauge('upstream_circuit_open', '1 while calls to the upstream are not all let through.', ('origin',))
+UPSTREAM_CONCURRENCY_LIMIT = Gauge('upstream_concurrency_limit', 'Current adaptive concurrency limit.', ('origin',))
+UPSTREAM_IN_FLIGHT = Gauge('upstream_in_flight', 'Upstream calls in progress.', ('origin',))
+for connector in connectors:
+    health = connector.health
+    UPSTREAM_CIRCUIT_OPEN.labels(connector.origin).set_function(lambda health=health: int(health.breaker.state != CLOSED))
+    UPSTREAM_CONCURRENCY_LIMIT.labels(connector.origin).set_function(lambda health=health: health.limiter.limit)
+    UPSTREAM_IN_FLIGHT.labels(connector.origin).set_function(lambda health=health: health.limiter.in_flight)
+ADMISSION_IN_FLIGHT = Gauge('admission_in_flight', 'Requests admitted and in progress.', ('route_class',))
+ADMISSION_QUEUED = Gauge('admission_queued', 'Requests waiting for admission.', ('route_class',))
+for route_class in admission.classes.values():
+    ADMISSION_IN_FLIGHT.labels(route_class.name).set_function(lambda route_class=route_class: route_class.in_flight)
+    ADMISSION_QUEUED.labels(route_class.name).set_function(lambda route_class=route_class: route_class.queued)
+if upstream_cache is not None:
+    Gauge('upstream_disk_cache_bytes', 'Payload bytes held by the upstream disk cache.').set_function(
+        lambda: upstream_cache.size
+    )
+# Totals since start, exported as gauges since they are read rather than recorded
+SEARCH_CACHE_EVENTS = Gauge('search_cache_events', 'Upstream search cache lookups and removals, by event.', ('event',))
+for event in ('hits', 'misses', 'evictions', 'expirations'):
+    SEARCH_CACHE_EVENTS.labels(event).set_function(lambda event=event: getattr(search_cache, event))
+BOOK_REFRESHES = Gauge('book_refreshes', 'Background refreshes of stored books, by outcome.', ('outcome',))
+for outcome in ('refreshed', 'gone', 'kept', 'failed', 'skipped'):
+    BOOK_REFRESHES.labels(outcome).set_function(lambda outcome=outcome: getattr(book_refresher, outcome))
+UPSTREAM_QUOTA_QUEUED = Gauge('upstream_quota_queued', 'Upstream calls waiting for quota.', ('origin',))
+UPSTREAM_QUOTA_WAITS = Gauge('upstream_quota_waits', 'Upstream calls that had to wait for quota.', ('origin',))
+UPSTREAM_QUOTA_EXHAUSTED = Gauge(
+    'upstream_quota_exhausted', 'Upstream calls refused because every key spent its daily quota.', ('origin',)
+)
+# Keys are labelled by position: the metrics must not leak them
+UPSTREAM_QUOTA_GRANTED = Gauge('upstream_quota_granted', 'Quota tokens granted since start, by key.', ('origin', 'key'))
+UPSTREAM_QUOTA_USED_TODAY = Gauge('upstream_quota_used_today', 'Daily quota used by this process.', ('origin', 'key'))
+UPSTREAM_QUOTA_REMAINING_TODAY = Gauge(
+    'upstream_quota_remaining_today', 'Daily quota left to this process.', ('origin', 'key')
+)
+for connector in connectors:
+    quota = getattr(connector, 'quota', None)
+    if quota is None:
+        continue
+    UPSTREAM_QUOTA_QUEUED.labels(connector.origin).set_function(lambda quota=quota: quota.stats()['queued'])
+    UPSTREAM_QUOTA_WAITS.labels(connector.origin).set_function(lambda quota=quota: quota.waited)
+    UPSTREAM_QUOTA_EXHAUSTED.labels(connector.origin).set_function(lambda quota=quota: quota.exhausted)
+    for index, key_quota in enumerate(quota.keys):
+        labels = (connector.origin, index)
+        UPSTREAM_QUOTA_GRANTED.labels(*labels).set_function(lambda key_quota=key_quota: key_quota.granted)
+        UPSTREAM_QUOTA_USED_TODAY.labels(*labels).set_function(lambda key_quota=key_quota: key_quota.day.used)
+        UPSTREAM_QUOTA_REMAINING_TODAY.labels(*labels).set_function(lambda key_quota=key_quota: key_quota.day.remaining)
 
 
 API_KEY = os.environ.get('API_KEY', "super_secret")
+# Unset disables the /admin endpoints
+ADMIN_API_KEY = os.environ.get('ADMIN_API_KEY')
+# Overall time budget for upstream lookups made while serving one request
+REQUEST_DEADLINE_SECONDS = float(os.environ.get('REQUEST_DEADLINE_SECONDS', '8'))
+DEFAULT_PAGE_SIZE = int(os.environ.get('DEFAULT_PAGE_SIZE', '100'))
+MAX_PAGE_SIZE = int(os.environ.get('MAX_PAGE_SIZE', '1000'))
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+BATCH_MAX_QUERIES = int(os.environ.get('BATCH_MAX_QUERIES', '500'))
+BATCH_DEADLINE_SECONDS = float(os.environ.get('BATCH_DEADLINE_SECONDS', '30'))
 
 
 def get_api_key(api_key: str = Header(None)):
-    if not api_key:
+    with span('get_api_key'):
+        if not api_key:
+            raise HTTPException(status_code=401, detail="Missing Authentication method")
+        if api_key != API_KEY:
+            raise HTTPException(status_code=403, detail="Invalid API Key")
+        return api_key
+
+
+def get_admin_key(admin_key: str = Header(None)):
+    if not ADMIN_API_KEY:
+        raise HTTPException(status_code=403, detail="Admin endpoints are disabled")
+    if not admin_key:
         raise HTTPException(status_code=401, detail="Missing Authentication method")
-    if api_key != API_KEY:
-        raise HTTPException(status_code=403, detail="Invalid API Key")
-    return api_key
+    if admin_key != ADMIN_API_KEY:
+        raise HTTPException(status_code=403, detail="Invalid admin key")
+    return admin_key
+
+
+@app.get("/metrics", response_class=PlainTextResponse, include_in_schema=False)
+async def metrics():
+    # Left unauthenticated like any scrape target; expose it on an internal network only
+    return PlainTextResponse(REGISTRY.render(), media_type=CONTENT_TYPE)
+
+
+@app.post("/admin/profile", status_code=status.HTTP_202_ACCEPTED)
+async def start_profile(
+    requests: int = Query(..., ge=1, le=PROFILE_MAX_REQUESTS),
+    admin_key: str = Depends(get_admin_key),
+):
+    """
+    Profile the next ``requests`` requests; the samples collected so far
+    are read with GET /admin/profile.
+    """
+    default_tracer.profiler.arm(requests)
+    return {"requests": requests}
 
 
-@app.post("/books/search", response_model=Union[list[Book], Book, None])
+@app.get("/admin/profile", response_class=PlainTextResponse)
+async def get_profile(admin_key: str = Depends(get_admin_key)):
+    """
+    Return the profile as collapsed stacks, ready for flamegraph.pl or
+    speedscope. X-Profile-Pending counts the requests still to be profiled.
+    """
+    profiler = default_tracer.profiler
+    return PlainTextResponse(
+        profiler.dump(), headers={"X-Profile-Pending": str(profiler.remaining + profiler.active)}
+    )
+
+
+@app.post("/books/search", response_model=list[Book])
 async def search_books(
     search_params: SearchParams,
     services: BookServices = Depends(get_book_services),
@@ -46,15 +227,90 @@ async def search_books(
                 "message": f"use one of this: {', '.join(search_params.model_fields)}"
             }
         )
-    return await services.search_books(search_params.model_dump(exclude_none=True))
+    with deadline_scope(REQUEST_DEADLINE_SECONDS):
+        books = await services.search_books(search_params.model_dump(exclude_none=True))
+    return FastJSONResponse(books)
+
+
+@app.post("/books/search/batch")
+async def search_books_batch(
+    queries: List[SearchParams],
+    services: BookServices = Depends(get_book_services),
+    api_key: str = Depends(get_api_key)
+):
+    """
+    Run many searches at once. Results are streamed as NDJSON, one line per
+    query with its position in the request, in completion order.
+    """
+    if len(queries) > BATCH_MAX_QUERIES:
+        raise HTTPException(status_code=400, detail=f"At most {BATCH_MAX_QUERIES} queries per batch")
+    search_params = [query.model_dump(exclude_none=True) for query in queries]
+    empty = [index for index, params in enumerate(search_params) if not params]
+    if empty:
+        raise HTTPException(
+            status_code=400,
+            detail={
+                "error": "Incorrect search params",
+                "message": f"queries {empty} use none of: {', '.join(SearchParams.model_fields)}"
+            }
+        )
+    return StreamingResponse(_batch_lines(services, search_params), media_type=NDJSON_MEDIA_TYPE)
+
+
+async def _batch_lines(services: BookServices, search_params: List[dict]) -> AsyncIterator[bytes]:
+    # The deadline covers the whole stream, not just building the response
+    with deadline_scope(BATCH_DEADLINE_SECONDS):
+        async for positions, books in services.search_books_batch(search_params):
+            for position in positions:
+                yield dumps({"index": position, "query": search_params[position], "books": books}) + b"\n"
+
+
+async def _ndjson_lines(documents: AsyncIterator[dict]) -> AsyncIterator[bytes]:
+    async for document in documents:
+        yield dumps(document) + b"\n"
 
 
 @app.get("/books", response_model=list[Book])
 async def list_books(
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE),
+    after: Optional[str] = None,
+    order_by: str = "id",
+    fields: Optional[str] = Query(None, description="Comma separated Book fields"),
+    accept: Optional[str] = Header(None),
     services: BookServices = Depends(get_book_services),
     api_key: str = Depends(get_api_key)
 ):
-    return await services.repository.list()
+    selected = [field.strip() for field in fields.split(",") if field.strip()] if fields else None
+    try:
+        parse_order(order_by)
+        if after:
+            decode_cursor(order_by, after)
+        if selected and not set(selected) <= set(Book.model_fields):
+            raise ValueError(f"fields must be a subset of: {', '.join(Book.model_fields)}")
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+
+    if accept and NDJSON_MEDIA_TYPE in accept:
+        # Streams the whole collection unless a limit is given
+        documents = services.repository.stream(
+            order_by=order_by, limit=limit, after=after, fields=selected
+        )
+        return StreamingResponse(_ndjson_lines(documents), media_type=NDJSON_MEDIA_TYPE)
+
+    limit = limit or DEFAULT_PAGE_SIZE
+    if selected:
+        page = [
+            document async for document in services.repository.stream(
+                order_by=order_by, limit=limit, after=after, fields=selected
+            )
+        ]
+    else:
+        page = await services.repository.list(order_by=order_by, limit=limit, after=after)
+
+    headers = {}
+    if len(page) == limit:
+        headers["X-Next-Cursor"] = encode_cursor(order_by, page[-1])
+    return FastJSONResponse(page, headers=headers)
 
 
 @app.get("/books/{book_id}", response_model=Book)
@@ -63,10 +319,11 @@ async def get_book(
     services: BookServices = Depends(get_book_services),
     api_key: str = Depends(get_api_key)
 ):
-    book = await services.search_books({"id": book_id})
+    with deadline_scope(REQUEST_DEADLINE_SECONDS):
+        book = await services.get_book(book_id)
     if not book:
         raise HTTPException(status_code=404, detail="Book not found")
-    return book[0]
+    return FastJSONResponse(book)
 
 
 @app.delete(
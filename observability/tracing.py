@@ -0,0 +1,513 @@
+"""
+Per-request tracing with ContextVar-scoped spans.
+
+TracingMiddleware starts a trace for every HTTP request when slow request
+logging or OTLP export is configured, and for the requests the sampling
+profiler is armed for. Code on the request path opens child spans with
+``span`` or ``traced``; with no trace in progress either costs a single
+ContextVar lookup, so tracing is close to free when it is switched off.
+"""
+import asyncio
+import functools
+import logging
+import os
+import random
+import sys
+import threading
+import time
+from collections import Counter
+from contextvars import ContextVar
+from typing import Any, Dict, Iterator, List, Optional
+
+import aiohttp
+import orjson
+from fastapi.routing import APIRoute
+
+from apis.http_session import HttpSessionRegistry, http_sessions
+
+logger = logging.getLogger(__name__)
+
+# Requests taking longer are logged with their span breakdown; unset disables the log
+TRACE_SLOW_REQUEST_SECONDS = os.environ.get('TRACE_SLOW_REQUEST_SECONDS')
+# OTLP/HTTP traces endpoint of a collector, e.g. http://localhost:4318/v1/traces
+OTLP_TRACES_ENDPOINT = os.environ.get('OTEL_EXPORTER_OTLP_TRACES_ENDPOINT')
+OTEL_SERVICE_NAME = os.environ.get('OTEL_SERVICE_NAME', 'books-api')
+TRACE_EXPORT_BATCH_SIZE = int(os.environ.get('TRACE_EXPORT_BATCH_SIZE', '512'))
+TRACE_EXPORT_INTERVAL = float(os.environ.get('TRACE_EXPORT_INTERVAL', '5'))
+TRACE_EXPORT_MAX_PENDING = int(os.environ.get('TRACE_EXPORT_MAX_PENDING', '10000'))
+PROFILE_INTERVAL_SECONDS = float(os.environ.get('PROFILE_INTERVAL_SECONDS', '0.005'))
+PROFILE_MAX_REQUESTS = int(os.environ.get('PROFILE_MAX_REQUESTS', '1000'))
+# Requests under this prefix are never profiled, so arming does not profile itself
+PROFILE_EXCLUDED_PREFIX = '/admin/'
+
+# OTLP span kinds
+INTERNAL = 1
+SERVER = 2
+CLIENT = 3
+
+# Spans time with perf_counter; this maps it onto the wall clock for export
+_EPOCH_OFFSET = time.time() - time.perf_counter()
+
+
+class Span:
+    __slots__ = (
+        'name', 'trace_id', 'span_id', 'parent_id', 'kind', 'start', 'end', 'attributes', 'children', 'error',
+    )
+
+    def __init__(
+        self,
+        name: str,
+        trace_id: Optional[str] = None,
+        parent_id: Optional[str] = None,
+        kind: int = INTERNAL,
+        attributes: Optional[Dict[str, Any]] = None,
+    ):
+        self.name = name
+        self.trace_id = trace_id or f'{random.getrandbits(128):032x}'
+        self.span_id = f'{random.getrandbits(64):016x}'
+        self.parent_id = parent_id
+        self.kind = kind
+        self.attributes = attributes or {}
+        self.children: List['Span'] = []
+        self.error: Optional[str] = None
+        self.start = time.perf_counter()
+        self.end: Optional[float] = None
+
+    @property
+    def duration(self) -> float:
+        return (self.end if self.end is not None else time.perf_counter()) - self.start
+
+    def child(self, name: str, kind: int = INTERNAL, attributes: Optional[Dict[str, Any]] = None) -> 'Span':
+        span = Span(name, self.trace_id, self.span_id, kind, attributes)
+        self.children.append(span)
+        return span
+
+    def set(self, key: str, value: Any) -> None:
+        self.attributes[key] = value
+
+    def finish(self, error: Optional[BaseException] = None) -> None:
+        if self.end is None:
+            self.end = time.perf_counter()
+            if error is not None:
+                self.error = f'{type(error).__name__}: {error}' if str(error) else type(error).__name__
+
+    def walk(self) -> Iterator['Span']:
+        yield self
+        for child in self.children:
+            yield from child.walk()
+
+
+_current: ContextVar[Optional[Span]] = ContextVar('current_span', default=None)
+
+
+class _SpanScope:
+    __slots__ = ('span', '_token')
+
+    def __init__(self, span: Span):
+        self.span = span
+
+    def __enter__(self) -> Span:
+        self._token = _current.set(self.span)
+        return self.span
+
+    def __exit__(self, exc_type, exc, traceback) -> bool:
+        self.span.finish(exc)
+        _current.reset(self._token)
+        return False
+
+
+class _NoopScope:
+    __slots__ = ()
+
+    def __enter__(self) -> None:
+        return None
+
+    def __exit__(self, exc_type, exc, traceback) -> bool:
+        return False
+
+
+_NOOP = _NoopScope()
+
+
+def current_span() -> Optional[Span]:
+    return _current.get()
+
+
+def span(name: str, kind: int = INTERNAL, **attributes: Any):
+    """
+    Time a block as a child of the current span. The context manager yields
+    the span, or None when no trace is in progress.
+    """
+    parent = _current.get()
+    if parent is None:
+        return _NOOP
+    return _SpanScope(parent.child(name, kind, attributes))
+
+
+def start_span(name: str, kind: int = INTERNAL, **attributes: Any) -> Optional[Span]:
+    """
+    Open a child of the current span without making it current, for work
+    that spans yields of an async generator. The caller finishes it.
+    """
+    parent = _current.get()
+    return parent.child(name, kind, attributes) if parent is not None else None
+
+
+def traced(name: Optional[str] = None, kind: int = INTERNAL):
+    """
+    Decorate a coroutine function to run in a span named ``name`` (the
+    function's qualified name by default).
+    """
+    def decorate(func):
+        span_name = name or func.__qualname__
+
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            parent = _current.get()
+            if parent is None:
+                return await func(*args, **kwargs)
+            with _SpanScope(parent.child(span_name, kind)):
+                return await func(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def format_breakdown(root: Span) -> str:
+    """
+    Render a finished trace as an indented tree of spans with their offset
+    from the start of the request and their duration, in milliseconds.
+    """
+    lines = []
+
+    def visit(span: Span, depth: int) -> None:
+        line = f"{'  ' * depth}{span.name} +{(span.start - root.start) * 1000:.1f}ms {span.duration * 1000:.1f}ms"
+        if span.attributes and span is not root:
+            line += ' ' + ' '.join(f'{key}={value}' for key, value in span.attributes.items())
+        if span.error:
+            line += f' error={span.error}'
+        lines.append(line)
+        for child in span.children:
+            visit(child, depth + 1)
+
+    visit(root, 0)
+    # Children can run concurrently, so this is a lower bound of the untraced time
+    untraced = max(0.0, root.duration - sum(child.duration for child in root.children))
+    lines.append(f'  (outside child spans: routing, request validation) {untraced * 1000:.1f}ms')
+    return '\n'.join(lines)
+
+
+class SamplingProfiler:
+    """
+    Sample the stack of the event loop thread while armed requests run.
+
+    ``arm(n)`` profiles the next n requests. A daemon thread reads the
+    loop thread's current frame every ``interval`` seconds for as long as
+    one of them is in flight, and the samples are returned by ``dump`` as
+    collapsed stacks ("outer;inner count" lines), the input of
+    flamegraph.pl and speedscope. Requests served concurrently by the same
+    loop land in the same samples.
+    """
+
+    def __init__(self, interval: float = PROFILE_INTERVAL_SECONDS):
+        self.interval = interval
+        self.remaining = 0
+        self.active = 0
+        self.profiled = 0
+        self.samples: Counter = Counter()
+        self._labels: Dict[Any, str] = {}
+        self._lock = threading.Lock()
+        self._stop: Optional[threading.Event] = None
+
+    def arm(self, requests: int) -> None:
+        with self._lock:
+            self.samples.clear()
+        self.remaining = requests
+        self.profiled = 0
+
+    def begin(self) -> bool:
+        """
+        Claim a profiling slot for the request starting now, if one is left.
+        """
+        if not self.remaining:
+            return False
+        self.remaining -= 1
+        self.active += 1
+        self.profiled += 1
+        if self._stop is None:
+            self._stop = threading.Event()
+            thread = threading.Thread(
+                target=self._sample, args=(threading.get_ident(), self._stop), name='sampling-profiler', daemon=True
+            )
+            thread.start()
+        return True
+
+    def end(self) -> None:
+        self.active -= 1
+        if not self.active and not self.remaining and self._stop is not None:
+            # The thread notices within one interval; the loop does not wait for it
+            self._stop.set()
+            self._stop = None
+
+    def _label(self, code) -> str:
+        label = self._labels.get(code)
+        if label is None:
+            filename = code.co_filename
+            if filename.startswith(os.getcwd()):
+                filename = os.path.relpath(filename)
+            label = self._labels[code] = f'{code.co_name} ({filename}:{code.co_firstlineno})'
+        return label
+
+    def _sample(self, target: int, stop: threading.Event) -> None:
+        while not stop.wait(self.interval):
+            frame = sys._current_frames().get(target)
+            stack = []
+            while frame is not None:
+                stack.append(self._label(frame.f_code))
+                frame = frame.f_back
+            if stack:
+                with self._lock:
+                    self.samples[';'.join(reversed(stack))] += 1
+
+    def dump(self) -> str:
+        with self._lock:
+            samples = sorted(self.samples.items())
+        return ''.join(f'{stack} {count}\n' for stack, count in samples)
+
+
+class OTLPExporter:
+    """
+    Send finished traces to an OpenTelemetry collector over OTLP/HTTP JSON.
+
+    Spans are batched and posted every ``interval`` seconds or once
+    ``batch_size`` are pending. Beyond ``max_pending`` spans, new traces
+    are dropped rather than slowing requests down; a failed post drops its
+    batch.
+    """
+
+    def __init__(
+        self,
+        endpoint: str,
+        service_name: str = OTEL_SERVICE_NAME,
+        sessions: HttpSessionRegistry = http_sessions,
+        batch_size: int = TRACE_EXPORT_BATCH_SIZE,
+        interval: float = TRACE_EXPORT_INTERVAL,
+        max_pending: int = TRACE_EXPORT_MAX_PENDING,
+    ):
+        self.endpoint = endpoint
+        self.service_name = service_name
+        self.sessions = sessions
+        self.batch_size = batch_size
+        self.interval = interval
+        self.max_pending = max_pending
+        self._pending: List[Span] = []
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        # Metrics
+        self.exported = 0
+        self.dropped = 0
+        self.failed = 0
+
+    def submit(self, root: Span) -> None:
+        spans = list(root.walk())
+        if len(self._pending) + len(spans) > self.max_pending:
+            self.dropped += len(spans)
+            return
+        self._pending.extend(spans)
+        if self._wakeup is not None and len(self._pending) >= self.batch_size:
+            self._wakeup.set()
+
+    def start(self) -> None:
+        if self._wakeup is None:
+            self._wakeup = asyncio.Event()
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        while self._pending:
+            await self.flush()
+
+    async def flush(self) -> None:
+        batch, self._pending = self._pending[:self.batch_size], self._pending[self.batch_size:]
+        if not batch:
+            return
+        try:
+            async with self.sessions.get('otlp').post(
+                self.endpoint, data=orjson.dumps(self.encode(batch)), headers={'Content-Type': 'application/json'}
+            ) as response:
+                if response.status >= 300:
+                    raise aiohttp.ClientResponseError(
+                        response.request_info, response.history, status=response.status
+                    )
+        except (aiohttp.ClientError, asyncio.TimeoutError) as exc:
+            self.failed += len(batch)
+            logger.debug("Exporting %d spans failed: %s", len(batch), exc)
+            return
+        self.exported += len(batch)
+
+    def encode(self, spans: List[Span]) -> dict:
+        return {
+            'resourceSpans': [{
+                'resource': {'attributes': [_attribute('service.name', self.service_name)]},
+                'scopeSpans': [{
+                    'scope': {'name': __name__},
+                    'spans': [_encode_span(span) for span in spans],
+                }],
+            }],
+        }
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            while self._pending:
+                await self.flush()
+
+
+def _attribute(key: str, value: Any) -> dict:
+    if isinstance(value, bool):
+        encoded = {'boolValue': value}
+    elif isinstance(value, int):
+        encoded = {'intValue': str(value)}
+    elif isinstance(value, float):
+        encoded = {'doubleValue': value}
+    else:
+        encoded = {'stringValue': str(value)}
+    return {'key': key, 'value': encoded}
+
+
+def _encode_span(span: Span) -> dict:
+    encoded = {
+        'traceId': span.trace_id,
+        'spanId': span.span_id,
+        'name': span.name,
+        'kind': span.kind,
+        'startTimeUnixNano': str(int((span.start + _EPOCH_OFFSET) * 1e9)),
+        'endTimeUnixNano': str(int((span.start + span.duration + _EPOCH_OFFSET) * 1e9)),
+        'attributes': [_attribute(key, value) for key, value in span.attributes.items()],
+        # 2 is STATUS_CODE_ERROR
+        'status': {'code': 2, 'message': span.error} if span.error else {},
+    }
+    if span.parent_id:
+        encoded['parentSpanId'] = span.parent_id
+    return encoded
+
+
+class Tracer:
+    """
+    What happens to finished request traces: a slow request log, export,
+    and the sampling profiler that can be armed on demand.
+    """
+
+    def __init__(
+        self,
+        slow_seconds: Optional[float] = None,
+        exporter: Optional[OTLPExporter] = None,
+        profiler: Optional[SamplingProfiler] = None,
+    ):
+        self.slow_seconds = slow_seconds
+        self.exporter = exporter
+        self.profiler = profiler or SamplingProfiler()
+
+    @property
+    def recording(self) -> bool:
+        return self.slow_seconds is not None or self.exporter is not None
+
+    def start(self) -> None:
+        if self.exporter is not None:
+            self.exporter.start()
+
+    async def stop(self) -> None:
+        if self.exporter is not None:
+            await self.exporter.stop()
+
+    def finish(self, root: Span) -> None:
+        if self.slow_seconds is not None and root.duration >= self.slow_seconds:
+            logger.warning("Slow request took %.0fms:\n%s", root.duration * 1000, format_breakdown(root))
+        if self.exporter is not None:
+            self.exporter.submit(root)
+
+
+default_tracer = Tracer(
+    slow_seconds=float(TRACE_SLOW_REQUEST_SECONDS) if TRACE_SLOW_REQUEST_SECONDS else None,
+    exporter=OTLPExporter(OTLP_TRACES_ENDPOINT) if OTLP_TRACES_ENDPOINT else None,
+)
+
+
+class TracingMiddleware:
+    """
+    ASGI middleware running each HTTP request in a root span, when the
+    tracer records traces or the request is picked for profiling.
+    """
+
+    def __init__(self, app, tracer: Tracer = default_tracer):
+        self.app = app
+        self.tracer = tracer
+
+    async def __call__(self, scope, receive, send):
+        tracer = self.tracer
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+        profiled = (
+            tracer.profiler.remaining > 0
+            and not scope['path'].startswith(PROFILE_EXCLUDED_PREFIX)
+            and tracer.profiler.begin()
+        )
+        if not profiled and not tracer.recording:
+            await self.app(scope, receive, send)
+            return
+
+        root = Span(
+            f"{scope['method']} {scope['path']}",
+            kind=SERVER,
+            attributes={'http.method': scope['method'], 'http.target': scope['path']},
+        )
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message['type'] == 'http.response.start':
+                status = message['status']
+            await send(message)
+
+        token = _current.set(root)
+        error: Optional[BaseException] = None
+        try:
+            await self.app(scope, receive, send_with_status)
+        except BaseException as exc:
+            error = exc
+            raise
+        finally:
+            root.finish(error)
+            _current.reset(token)
+            if profiled:
+                tracer.profiler.end()
+            route = scope.get('route')
+            if route is not None:
+                root.name = f"{scope['method']} {route.path}"
+                root.set('http.route', route.path)
+            root.set('http.status_code', status)
+            tracer.finish(root)
+
+
+class TracedRoute(APIRoute):
+    """
+    Route running its endpoint in an "endpoint" span. Dependencies and
+    request validation happen before it, so their cost shows up as the gap
+    before that span.
+    """
+
+    def __init__(self, path: str, endpoint, **kwargs):
+        if asyncio.iscoroutinefunction(endpoint):
+            endpoint = traced(f'endpoint {endpoint.__name__}')(endpoint)
+        super().__init__(path, endpoint, **kwargs)
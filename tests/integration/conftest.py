@@ -4,9 +4,9 @@ import pytest
 from faker import Faker
 import random
 
-from apis.connector import RestConnector
+from apis.connector import Capabilities, RestConnector
 from data.repository import Repository
-from domain.models import Book
+from domain.models import Book, SearchParams
 
 fake = Faker()
 
@@ -43,6 +43,13 @@ def mock_clients():
     # Manually setting async methods to AsyncMock
     client1.search = AsyncMock()
     client2.search = AsyncMock()
+    client1.get_by_id = AsyncMock()
+    client2.get_by_id = AsyncMock()
+
+    # Both clients can answer every search, with the params unchanged
+    for client in (client1, client2):
+        client.capabilities = Capabilities(search_fields=frozenset(SearchParams.model_fields))
+        client.translate.side_effect = lambda search_params: search_params
 
     return [client1, client2]
 
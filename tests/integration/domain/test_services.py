@@ -1,5 +1,13 @@
+import asyncio
+from datetime import datetime
+from unittest.mock import Mock
+
 import pytest
 
+from apis.exceptions import ConnectorFails
+from data.write_behind import WriteBehindQueue
+from domain.cache import TTLCache
+from domain.refresher import BackgroundRefresher
 from domain.services import BookServices
 
 
@@ -23,24 +31,24 @@ class TestServices:
     async def test_search_books_found_in_client(
         self, mock_repository, mock_clients, create_fake_book
     ):
-        book = create_fake_book()
+        books = [create_fake_book(), create_fake_book()]
         mock_repository.search.return_value = []
-        mock_clients[0].search.return_value = book
+        mock_clients[0].search.return_value = books
 
         book_service = BookServices(mock_repository, mock_clients)
         result = await book_service.search_books({"title": "Test Book"})
 
-        assert result == book
+        assert result == books
         mock_repository.search.assert_called_once_with({"title": "Test Book"})
         mock_clients[0].search.assert_called_once_with({"title": "Test Book"})
-        mock_repository.save.assert_called_once_with(book)
+        mock_repository.save_many.assert_called_once_with(books)
 
     async def test_search_books_not_found_anywhere(
         self, mock_repository, mock_clients, create_fake_book
     ):
         mock_repository.search.return_value = []
         for client in mock_clients:
-            client.search.return_value = None
+            client.search.return_value = []
 
         book_service = BookServices(mock_repository, mock_clients)
         result = await book_service.search_books({"title": "Unknown Book"})
@@ -49,3 +57,257 @@ class TestServices:
         mock_repository.search.assert_called_once_with({"title": "Unknown Book"})
         for client in mock_clients:
             client.search.assert_called_with({"title": "Unknown Book"})
+
+    async def test_search_books_caches_upstream_miss(
+        self, mock_repository, mock_clients
+    ):
+        mock_repository.search.return_value = []
+        for client in mock_clients:
+            client.search.return_value = []
+
+        book_service = BookServices(mock_repository, mock_clients, cache=TTLCache())
+        await book_service.search_books({"title": "Unknown Book"})
+        result = await book_service.search_books({"title": " unknown  book"})
+
+        assert result == []
+        for client in mock_clients:
+            client.search.assert_called_once_with({"title": "Unknown Book"})
+
+    async def test_search_books_does_not_cache_outage(
+        self, mock_repository, mock_clients
+    ):
+        mock_repository.search.return_value = []
+        for client in mock_clients:
+            client.search.side_effect = ConnectorFails()
+
+        book_service = BookServices(mock_repository, mock_clients, cache=TTLCache())
+        await book_service.search_books({"title": "Unknown Book"})
+        await book_service.search_books({"title": "Unknown Book"})
+
+        for client in mock_clients:
+            assert client.search.call_count == 2
+
+    async def test_search_books_does_not_cache_partial_outage(
+        self, mock_repository, mock_clients
+    ):
+        mock_repository.search.return_value = []
+        mock_clients[0].search.side_effect = ConnectorFails()
+        for client in mock_clients[1:]:
+            client.search.return_value = []
+
+        book_service = BookServices(mock_repository, mock_clients, cache=TTLCache())
+        assert await book_service.search_books({"title": "Unknown Book"}) == []
+        await book_service.search_books({"title": "Unknown Book"})
+
+        for client in mock_clients:
+            assert client.search.call_count == 2
+
+    async def test_concurrent_identical_searches_are_coalesced(
+        self, mock_repository, mock_clients, create_fake_book
+    ):
+        book = create_fake_book()
+        mock_repository.search.return_value = []
+
+        async def slow_search(search_params):
+            await asyncio.sleep(0.01)
+            return [book]
+        mock_clients[0].search.side_effect = slow_search
+        mock_clients[1].search.return_value = []
+
+        book_service = BookServices(mock_repository, mock_clients)
+        results = await asyncio.gather(*[
+            book_service.search_books({"title": "Test Book"}) for _ in range(5)
+        ])
+
+        assert results == [[book]] * 5
+        mock_clients[0].search.assert_called_once()
+        mock_repository.save_many.assert_called_once_with([book])
+
+    async def test_get_book_found_in_repository(
+        self, mock_repository, mock_clients, create_fake_book
+    ):
+        book = create_fake_book()
+        mock_repository.get_by_id.return_value = book
+
+        book_service = BookServices(mock_repository, mock_clients)
+        result = await book_service.get_book(book.id)
+
+        assert result == book
+        mock_repository.get_by_id.assert_called_once_with(book.id)
+        for client in mock_clients:
+            client.get_by_id.assert_not_called()
+
+    async def test_get_book_routed_to_owning_client(
+        self, mock_repository, mock_clients, create_fake_book
+    ):
+        book = create_fake_book()
+        mock_repository.get_by_id.return_value = None
+        mock_clients[0].owns_id.return_value = False
+        mock_clients[1].owns_id.return_value = True
+        mock_clients[1].get_by_id.return_value = book
+
+        book_service = BookServices(mock_repository, mock_clients)
+        result = await book_service.get_book("OL45804W")
+
+        assert result == book
+        mock_clients[0].get_by_id.assert_not_called()
+        mock_clients[1].get_by_id.assert_called_once_with("OL45804W")
+        mock_repository.save_many.assert_called_once_with([book])
+
+    async def test_get_book_unknown_id_format(
+        self, mock_repository, mock_clients
+    ):
+        mock_repository.get_by_id.return_value = None
+        for client in mock_clients:
+            client.owns_id.return_value = False
+
+        book_service = BookServices(mock_repository, mock_clients)
+
+        assert await book_service.get_book("not-an-upstream-id") is None
+
+    async def test_search_books_writes_behind(
+        self, mock_repository, mock_clients, create_fake_book
+    ):
+        book = create_fake_book()
+        mock_repository.search.return_value = []
+        mock_clients[0].search.return_value = [book]
+        writer = WriteBehindQueue(mock_repository)
+
+        book_service = BookServices(mock_repository, mock_clients, writer=writer)
+        result = await book_service.search_books({"title": "Test Book"})
+
+        assert result == [book]
+        mock_repository.save_many.assert_not_called()
+        assert writer.depth == 1
+
+    async def test_search_books_skips_incapable_client(
+        self, mock_repository, mock_clients, create_fake_book
+    ):
+        book = create_fake_book()
+        mock_repository.search.return_value = []
+        mock_clients[0].translate.side_effect = lambda search_params: None
+        mock_clients[1].translate.side_effect = lambda search_params: {"q": "first_publish_year:1974"}
+        mock_clients[1].search.return_value = [book]
+
+        book_service = BookServices(mock_repository, mock_clients)
+        result = await book_service.search_books({"publication_date": "1974"})
+
+        assert result == [book]
+        mock_clients[0].search.assert_not_called()
+        mock_clients[1].search.assert_called_once_with({"q": "first_publish_year:1974"})
+
+    async def test_search_books_serves_stale_and_schedules_refresh(
+        self, mock_repository, mock_clients, create_fake_book
+    ):
+        book = create_fake_book()
+        mock_repository.search.return_value = [book]
+        refresher = BackgroundRefresher(mock_repository, [])
+        refresher.schedule = Mock(return_value=1)
+
+        book_service = BookServices(mock_repository, mock_clients, refresher=refresher)
+        result = await book_service.search_books({"title": "Test Book"})
+
+        assert result == [book]
+        refresher.schedule.assert_called_once_with([book])
+        for client in mock_clients:
+            client.search.assert_not_called()
+
+    async def test_search_books_refetches_expired(
+        self, mock_repository, mock_clients, create_fake_book
+    ):
+        expired, fresh = create_fake_book(), create_fake_book()
+        mock_repository.search.return_value = [expired]
+        mock_clients[0].search.return_value = [fresh]
+        refresher = BackgroundRefresher(mock_repository, [], max_stale=3600)
+
+        refresher.schedule = Mock(return_value=0)
+
+        book_service = BookServices(mock_repository, mock_clients, refresher=refresher)
+        result = await book_service.search_books({"title": "Test Book"})
+
+        assert result == [fresh]
+        assert fresh.fetched_at is not None
+        mock_repository.save_many.assert_called_once_with([fresh], overwrite=True)
+        refresher.schedule.assert_called_once_with([expired])
+
+    async def test_get_book_refetches_expired(
+        self, mock_repository, mock_clients, create_fake_book
+    ):
+        expired = create_fake_book()
+        fresh = expired.model_copy(update={'title': 'New title'})
+        mock_repository.get_by_id.return_value = expired
+        mock_clients[0].owns_id.return_value = True
+        mock_clients[0].get_by_id.return_value = fresh
+        mock_clients[1].owns_id.return_value = False
+        refresher = BackgroundRefresher(mock_repository, [], max_stale=3600)
+        refresher.schedule = Mock(return_value=0)
+
+        book_service = BookServices(mock_repository, mock_clients, refresher=refresher)
+
+        assert await book_service.get_book(expired.id) == fresh
+        mock_repository.save_many.assert_called_once_with([fresh], overwrite=True)
+        refresher.schedule.assert_not_called()
+
+        # Served as it is, and refreshed later, when upstream has nothing better
+        mock_clients[0].get_by_id.return_value = None
+        book_service = BookServices(mock_repository, mock_clients, refresher=refresher)
+
+        assert await book_service.get_book(expired.id) == expired
+        refresher.schedule.assert_called_once_with([expired])
+
+    async def test_search_books_batch(
+        self, mock_repository, mock_clients, create_fake_book
+    ):
+        local, remote = create_fake_book(), create_fake_book()
+        mock_repository.search_many.return_value = [[local], []]
+        mock_clients[0].search.return_value = [remote]
+
+        book_service = BookServices(mock_repository, mock_clients)
+        results = [
+            result async for result in book_service.search_books_batch([
+                {"title": "Local"}, {"title": "Remote"}, {"title": " local"},
+            ])
+        ]
+
+        assert results == [([0, 2], [local]), ([1], [remote])]
+        mock_repository.search_many.assert_called_once_with([{"title": "Local"}, {"title": "Remote"}])
+        mock_repository.search.assert_not_called()
+        mock_clients[0].search.assert_called_once_with({"title": "Remote"})
+
+    async def test_search_books_batch_bounds_concurrency(
+        self, mock_repository, mock_clients
+    ):
+        mock_repository.search_many.return_value = [[] for _ in range(6)]
+        running, peak = 0, 0
+
+        async def slow_search(search_params):
+            nonlocal running, peak
+            running += 1
+            peak = max(peak, running)
+            await asyncio.sleep(0.01)
+            running -= 1
+            return []
+        mock_clients[0].search.side_effect = slow_search
+        mock_clients[1].search.return_value = []
+
+        book_service = BookServices(mock_repository, mock_clients)
+        queries = [{"title": f"Book {i}"} for i in range(6)]
+        results = [result async for result in book_service.search_books_batch(queries, concurrency=2)]
+
+        assert sorted(positions for positions, _ in results) == [[i] for i in range(6)]
+        assert peak == 2
+
+    async def test_store_keeps_upstream_fetch_time(
+        self, mock_repository, mock_clients, create_fake_book
+    ):
+        cached = create_fake_book()
+        cached.fetched_at = datetime(2024, 1, 1)
+        live = create_fake_book()
+        mock_repository.search.return_value = []
+        mock_clients[0].search.return_value = [cached, live]
+
+        book_service = BookServices(mock_repository, mock_clients)
+        await book_service.search_books({"title": "Test Book"})
+
+        assert cached.fetched_at == datetime(2024, 1, 1)
+        assert live.fetched_at > cached.fetched_at
@@ -1,10 +1,13 @@
+import json
 from unittest.mock import create_autospec, AsyncMock
 
 from fastapi.testclient import TestClient
 
-from apis.connector import RestConnector
+from apis.connector import Capabilities, RestConnector
 from conftest import FakeRepository
+from domain.models import SearchParams
 from domain.services import BookServices
+import main
 from main import app, get_book_services
 
 
@@ -13,9 +16,12 @@ client = TestClient(app)
 
 def get_test_book_services() -> BookServices:
     test_repository = FakeRepository()
-    client_1 = create_autospec(RestConnector)
-    client_2 = create_autospec(RestConnector)
+    client_1 = create_autospec(RestConnector, instance=True)
+    client_2 = create_autospec(RestConnector, instance=True)
     test_clients = [client_1, client_2]
+    for test_client in test_clients:
+        test_client.capabilities = Capabilities(search_fields=frozenset(SearchParams.model_fields))
+        test_client.translate.side_effect = lambda search_params: search_params
     return BookServices(test_repository, test_clients)
 
 
@@ -39,20 +45,20 @@ class TestBookEndpoints:
         assert isinstance(response.json(), list)
 
     def test_search_books_client(self, create_fake_book):
-        book = create_fake_book()
+        books = [create_fake_book(), create_fake_book()]
         for _client in self.services.clients:
-            _client.search = AsyncMock(return_value=book)
+            _client.search = AsyncMock(return_value=books)
         response = client.post(
             "/books/search",
-            json={"title": book.title},
+            json={"title": "Title only upstream knows"},
             headers={'api-key': 'super_secret'}
         )
         assert response.status_code == 200
-        assert isinstance(response.json(), dict)
+        assert [book['id'] for book in response.json()] == [book.id for book in books]
 
     def test_search_books_not_found(self):
         for _client in self.services.clients:
-            _client.search = AsyncMock(return_value=None)
+            _client.search = AsyncMock(return_value=[])
         response = client.post(
             "/books/search",
             json={"title": "Test Book"},
@@ -61,6 +67,33 @@ class TestBookEndpoints:
         assert response.status_code == 200
         assert response.json() == []
 
+    def test_search_books_batch(self, create_fake_book):
+        book = create_fake_book()
+        self.services.repository._client.append(book)
+        for _client in self.services.clients:
+            _client.search = AsyncMock(return_value=[])
+        response = client.post(
+            "/books/search/batch",
+            json=[{"title": book.title}, {"title": "Nowhere to be found"}, {"title": book.title}],
+            headers={'api-key': 'super_secret'}
+        )
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("application/x-ndjson")
+        lines = [json.loads(line) for line in response.text.splitlines()]
+        by_index = {line["index"]: line["books"] for line in lines}
+        assert sorted(by_index) == [0, 1, 2]
+        assert [found["id"] for found in by_index[0]] == [book.id]
+        assert by_index[2] == by_index[0]
+        assert by_index[1] == []
+
+    def test_search_books_batch_rejects_empty_query(self):
+        response = client.post(
+            "/books/search/batch",
+            json=[{"title": "Fox"}, {}],
+            headers={'api-key': 'super_secret'}
+        )
+        assert response.status_code == 400
+
     def test_list_books(self, create_fake_book):
         for _ in range(5):
             self.services.repository._client.append(create_fake_book())
@@ -83,6 +116,8 @@ class TestBookEndpoints:
         assert response.json()['id'] == book.id
 
     def test_get_book_not_found(self):
+        for _client in self.services.clients:
+            _client.get_by_id = AsyncMock(return_value=None)
         response = client.get(
             "/books/id_test",
             headers={'api-key': 'super_secret'}
@@ -120,3 +155,96 @@ class TestBookEndpoints:
     def test_incorrect_api_key(self):
         response = client.get("/books", headers={'api-key': 'incorrect_key'})
         assert response.status_code == 403
+
+    def test_list_books_pagination(self, create_fake_book):
+        for _ in range(5):
+            self.services.repository._client.append(create_fake_book())
+
+        seen = []
+        after = None
+        while True:
+            params = {"limit": 2}
+            if after:
+                params["after"] = after
+            response = client.get("/books", params=params, headers={'api-key': 'super_secret'})
+            assert response.status_code == 200
+            seen += [book['id'] for book in response.json()]
+            after = response.headers.get('x-next-cursor')
+            if not after:
+                break
+
+        assert seen == sorted(book.id for book in self.services.repository._client)
+
+    def test_list_books_fields(self, create_fake_book):
+        self.services.repository._client.append(create_fake_book())
+        response = client.get(
+            "/books",
+            params={"fields": "title", "order_by": "-publication_date"},
+            headers={'api-key': 'super_secret'}
+        )
+        assert response.status_code == 200
+        assert set(response.json()[0]) == {"id", "title", "publication_date"}
+
+    def test_list_books_ndjson(self, create_fake_book):
+        self.services.repository._client.append(create_fake_book())
+        response = client.get(
+            "/books",
+            headers={'api-key': 'super_secret', 'accept': 'application/x-ndjson'}
+        )
+        assert response.status_code == 200
+        assert response.headers['content-type'] == 'application/x-ndjson'
+        lines = response.text.splitlines()
+        assert len(lines) == len(self.services.repository._client)
+        assert 'id' in json.loads(lines[0])
+
+    def test_list_books_invalid_order(self):
+        response = client.get(
+            "/books",
+            params={"order_by": "description"},
+            headers={'api-key': 'super_secret'}
+        )
+        assert response.status_code == 400
+
+    def test_metrics(self, create_fake_book):
+        book = create_fake_book()
+        self.services.repository._client.append(book)
+        client.get(f"/books/{book.id}", headers={"api-key": "super_secret"})
+
+        response = client.get("/metrics")
+
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+        lines = response.text.splitlines()
+        assert any(
+            line.startswith('http_request_duration_seconds_count{method="GET",route="/books/{book_id}",status="200"}')
+            for line in lines
+        )
+        assert any(line.startswith('book_repository_lookups_total{operation="get",result="hit"}') for line in lines)
+        assert any(line.startswith('search_cache_events{event="hits"}') for line in lines)
+        assert any(line.startswith('write_behind_books_total{outcome="written"}') for line in lines)
+        assert any(line.startswith('upstream_quota_queued{origin="Google Books API"}') for line in lines)
+
+    def test_admin_profile_disabled_without_key(self):
+        response = client.post("/admin/profile", params={"requests": 5}, headers={"admin-key": "anything"})
+        assert response.status_code == 403
+
+    def test_admin_profile(self, monkeypatch, create_fake_book):
+        monkeypatch.setattr(main, "ADMIN_API_KEY", "admin_secret")
+        headers = {"admin-key": "admin_secret"}
+        book = create_fake_book()
+        self.services.repository._client.append(book)
+
+        response = client.post("/admin/profile", params={"requests": 1}, headers=headers)
+        assert response.status_code == 202
+        client.get(f"/books/{book.id}", headers={"api-key": "super_secret"})
+
+        response = client.get("/admin/profile", headers=headers)
+        assert response.status_code == 200
+        assert response.headers["x-profile-pending"] == "0"
+
+    def test_admission_route_classes(self):
+        assert main.classify_request("GET", "/books/OL1W") == "read"
+        assert main.classify_request("GET", "/books") == "read"
+        assert main.classify_request("POST", "/books/search") == "search"
+        assert main.classify_request("POST", "/books/search/batch") == "search"
+        assert main.classify_request("GET", "/metrics") is None
@@ -1,6 +1,11 @@
+import os
+from datetime import datetime
+
 import pytest
 from data.mongo_connector import mongo_client
 from data.mongo_repository import MongoDBRepository
+from data.pagination import encode_cursor
+from importers.open_library import import_dump
 from faker import Faker
 
 from data.repository import Repository
@@ -32,6 +37,42 @@ class TestMongoDBRepository:
         assert len(found_books) == 1
         assert found_books[0].title == book.title
 
+    @pytest.mark.asyncio
+    async def test_search_is_case_and_accent_insensitive(
+        self, create_fake_book, mongo_repository
+    ):
+        book = create_fake_book().model_copy(update={'title': 'Cien Años de Soledad'})
+        await mongo_repository.save(book)
+
+        found_books = await mongo_repository.search({"title": "cien anos de sol"})
+        assert book.id in [found.id for found in found_books]
+
+    @pytest.mark.asyncio
+    @pytest.mark.parametrize('search_mode', ['token', 'prefix', 'text'])
+    async def test_search_uses_an_index(self, search_mode):
+        repository = MongoDBRepository(
+            mongo_client, db_name="test", collection_name="books", search_mode=search_mode
+        )
+        query = repository.build_query({"title": "The Hobbit", "author": "Tolkien"})
+
+        async with mongo_client("books", "test") as collection:
+            explain = await collection.find(query).explain()
+
+        assert 'COLLSCAN' not in str(explain['queryPlanner']['winningPlan'])
+
+    @pytest.mark.asyncio
+    @pytest.mark.parametrize('publication_date', ['1999', '1999-05', '1999-05-30'])
+    async def test_search_by_publication_date(
+        self, create_fake_book, mongo_repository, publication_date
+    ):
+        book = create_fake_book().model_copy(update={'publication_date': datetime(1999, 5, 30)})
+        await mongo_repository.save(book)
+
+        found_books = await mongo_repository.search(
+            {"title": book.title, "publication_date": publication_date}
+        )
+        assert [found.id for found in found_books] == [book.id]
+
     @pytest.mark.asyncio
     async def test_save_twice_an_element(
         self, create_fake_book, mongo_repository
@@ -45,6 +86,97 @@ class TestMongoDBRepository:
         assert len(found_books) == 1
         assert found_books[0].title == book.title
 
+    @pytest.mark.asyncio
+    async def test_save_many_upserts(
+        self, create_fake_book, mongo_repository
+    ):
+        books = [create_fake_book() for _ in range(3)]
+        await mongo_repository.save(books[0])
+
+        await mongo_repository.save_many(books + books[:1])
+
+        for book in books:
+            assert (await mongo_repository.get_by_id(book.id)).title == book.title
+
+    @pytest.mark.asyncio
+    async def test_search_many(
+        self, create_fake_book, mongo_repository
+    ):
+        books = [create_fake_book() for _ in range(2)]
+        await mongo_repository.save_many(books)
+
+        results = await mongo_repository.search_many([
+            {'title': books[1].title},
+            {'publication_date': 'not a date'},
+            {'title': books[0].title},
+        ])
+
+        assert books[1].id in [book.id for book in results[0]]
+        assert results[1] == []
+        assert books[0].id in [book.id for book in results[2]]
+
+    @pytest.mark.asyncio
+    async def test_import_open_library_dump(self, mongo_repository):
+        dump = os.path.join(os.path.dirname(__file__), '..', '..', 'fixtures', 'ol_dump_works_sample.txt')
+
+        await import_dump(dump, mongo_repository.save_documents, workers=1)
+
+        found = await mongo_repository.search({'title': 'fantastic mr fox'})
+        assert 'OL45804W' in [book.id for book in found]
+
+    @pytest.mark.asyncio
+    async def test_save_many_overwrite(
+        self, create_fake_book, mongo_repository
+    ):
+        book = create_fake_book()
+        await mongo_repository.save(book)
+        refreshed = book.model_copy(update={'description': 'Refreshed', 'fetched_at': datetime(2024, 1, 1)})
+
+        await mongo_repository.save_many([refreshed])
+        assert (await mongo_repository.get_by_id(book.id)).description == book.description
+
+        await mongo_repository.save_many([refreshed], overwrite=True)
+        stored = await mongo_repository.get_by_id(book.id)
+        assert stored.description == 'Refreshed'
+        assert stored.fetched_at == datetime(2024, 1, 1)
+
+    @pytest.mark.asyncio
+    async def test_save_many_overwrite_keeps_stored_values_over_empty_ones(
+        self, create_fake_book, mongo_repository
+    ):
+        book = create_fake_book()
+        await mongo_repository.save(book)
+
+        await mongo_repository.save_many([book.model_copy(update={'editor': '', 'title': 'Renamed'})], overwrite=True)
+
+        stored = await mongo_repository.get_by_id(book.id)
+        assert stored.title == 'Renamed'
+        assert stored.editor == book.editor
+
+    @pytest.mark.asyncio
+    async def test_backfill_makes_legacy_books_searchable(self, mongo_repository):
+        # As written before the normalized search fields and schema_version existed
+        legacy = {
+            'id': faker.uuid4(),
+            'title': 'Quokka Almanac',
+            'authors': ['Wilhelmina Quist'],
+            'categories': [],
+            'publication_date': datetime(1970, 1, 1),
+            'editor': 'Puffin',
+            'description': '',
+        }
+        async with mongo_client("books", "test") as collection:
+            await collection.insert_one(legacy)
+        found = await mongo_repository.search({'title': 'quokka almanac'})
+        assert legacy['id'] not in [book.id for book in found]
+
+        assert await mongo_repository.backfill_search_fields() >= 1
+
+        found = await mongo_repository.search({'title': 'quokka almanac', 'author': 'quist'})
+        assert legacy['id'] in [book.id for book in found]
+        found = await mongo_repository.search({'title': 'quokka', 'publication_date': '1970'})
+        assert legacy['id'] in [book.id for book in found]
+
     @pytest.mark.asyncio
     async def test_list(
         self, create_fake_book, mongo_repository
@@ -56,6 +188,29 @@ class TestMongoDBRepository:
         books = await mongo_repository.list(order_by="id", limit=3)
         assert len(books) == 3
 
+    @pytest.mark.asyncio
+    async def test_list_pages_with_cursor(
+        self, create_fake_book, mongo_repository
+    ):
+        for i in range(5):
+            await mongo_repository.save(create_fake_book())
+
+        first = await mongo_repository.list(order_by="-publication_date", limit=3)
+        cursor = encode_cursor("-publication_date", first[-1])
+        second = await mongo_repository.list(order_by="-publication_date", limit=3, after=cursor)
+
+        assert not {book.id for book in first} & {book.id for book in second}
+        assert first[-1].publication_date >= second[0].publication_date
+
+    @pytest.mark.asyncio
+    async def test_stream_projects_fields(
+        self, create_fake_book, mongo_repository
+    ):
+        await mongo_repository.save(create_fake_book())
+
+        async for document in mongo_repository.stream(fields=["title"], limit=1):
+            assert set(document) == {"id", "title"}
+
     @pytest.mark.asyncio
     async def test_delete(
         self, create_fake_book, mongo_repository
@@ -64,5 +219,15 @@ class TestMongoDBRepository:
         await mongo_repository.save(book)
         await mongo_repository.delete(book.id)
 
-        found_books = await mongo_repository.search({"id": book.id})
-        assert len(found_books) == 0
+        assert await mongo_repository.get_by_id(book.id) is None
+
+    @pytest.mark.asyncio
+    async def test_get_by_id(
+        self, create_fake_book, mongo_repository
+    ):
+        book = create_fake_book()
+        await mongo_repository.save(book)
+
+        found_book = await mongo_repository.get_by_id(book.id)
+        assert found_book.id == book.id
+        assert found_book.title == book.title
@@ -0,0 +1,452 @@
+import asyncio
+import json
+from datetime import datetime
+from unittest.mock import AsyncMock, MagicMock
+
+import aiohttp
+import pytest
+
+from apis.connector import UPSTREAM_ATTEMPT_SECONDS, UPSTREAM_REQUEST_SECONDS
+from apis.disk_cache import DiskCache
+from apis.exceptions import ConnectorFails, ConnectorUnavailable
+from apis.google_connector import API_KEY_HEADER, GoogleBooksConnector
+from apis.http_session import HttpSessionRegistry
+from apis.health import CircuitBreaker, HealthController
+from apis.open_library import OpenLibraryConnector
+from apis.quota import BACKGROUND, QuotaScheduler, priority_scope
+from apis.retry import RetryPolicy
+from benchmarks.stubs import StubConfig, UpstreamStubs
+from domain.models import Book
+
+
+class TestIdOwnership:
+
+    def test_google_volume_ids(self):
+        connector = GoogleBooksConnector(api_key='key')
+        assert connector.owns_id('zyTCAlFPjgYC')
+        assert not connector.owns_id('OL45804W')
+
+    def test_open_library_work_ids(self):
+        connector = OpenLibraryConnector()
+        assert connector.owns_id('OL45804W')
+        assert not connector.owns_id('zyTCAlFPjgYC')
+
+
+@pytest.mark.asyncio
+class TestGetById:
+
+    async def test_google_fetches_volume(self):
+        connector = GoogleBooksConnector(api_key='key')
+        connector._make_request = AsyncMock(return_value={
+            'id': 'zyTCAlFPjgYC',
+            'volumeInfo': {
+                'title': 'The Google Story',
+                'authors': ['David A. Vise'],
+                'publishedDate': '2005-11-15',
+                'publisher': 'Random House',
+            },
+        })
+
+        book = await connector.get_by_id('zyTCAlFPjgYC')
+
+        assert book.id == 'zyTCAlFPjgYC'
+        assert book.origin == connector.origin
+        assert connector._make_request.call_args.args[0].endswith('/volumes/zyTCAlFPjgYC')
+
+    async def test_google_unknown_volume(self):
+        connector = GoogleBooksConnector(api_key='key')
+        connector._make_request = AsyncMock(side_effect=ConnectorFails(status=404))
+
+        assert await connector.get_by_id('zyTCAlFPjgYC') is None
+
+    @pytest.mark.parametrize('payload', [
+        {'id': 'zyTCAlFPjgYC', 'volumeInfo': {'title': None}},
+        {'id': 'zyTCAlFPjgYC', 'volumeInfo': {'title': 'Dune', 'authors': 'Frank Herbert'}},
+        {'id': 'zyTCAlFPjgYC', 'volumeInfo': 'Dune'},
+        [],
+    ])
+    async def test_google_malformed_volume(self, payload):
+        connector = GoogleBooksConnector(api_key='key')
+        connector._make_request = AsyncMock(return_value=payload)
+
+        assert await connector.get_by_id('zyTCAlFPjgYC') is None
+
+    async def test_open_library_fetches_work_and_authors(self):
+        connector = OpenLibraryConnector()
+        responses = {
+            'https://openlibrary.org/works/OL45804W.json': {
+                'title': 'Fantastic Mr Fox',
+                'first_publish_date': 'October 1, 1974',
+                'authors': [{'author': {'key': '/authors/OL34184A'}}],
+                'description': {'value': 'A fox.'},
+                'subjects': ['Foxes'],
+                'covers': [6498519],
+            },
+            'https://openlibrary.org/authors/OL34184A.json': {'name': 'Roald Dahl'},
+        }
+        connector._make_request = AsyncMock(side_effect=lambda url, **_: responses[url])
+
+        book = await connector.get_by_id('OL45804W')
+
+        assert book.authors == ['Roald Dahl']
+        assert book.description == 'A fox.'
+        assert book.publication_date.year == 1974
+        assert book.image.endswith('/6498519-L.jpg')
+
+    async def test_open_library_refresh_keeps_stored_date(self):
+        connector = OpenLibraryConnector()
+        stored = Book(
+            id='OL45804W', title='Fantastic Mr Fox', authors=[], categories=[],
+            publication_date='1970-01-01', editor='Puffin', description='', origin=connector.origin,
+        )
+        connector._make_request = AsyncMock(return_value={'title': 'Fantastic Mr. Fox'})
+
+        book = await connector.refresh(stored)
+
+        assert book.title == 'Fantastic Mr. Fox'
+        assert book.publication_date == stored.publication_date
+        assert await connector.get_by_id('OL45804W') is None
+
+        connector._make_request = AsyncMock(return_value={'first_publish_date': '1974'})
+        assert await connector.refresh(stored) is stored
+
+
+def google_item(index: int) -> dict:
+    return {
+        'id': f'volume{index:06d}',
+        'volumeInfo': {'title': f'Book {index}', 'publishedDate': '2001', 'authors': ['A']},
+    }
+
+
+def open_library_doc(index: int) -> dict:
+    return {
+        'key': f'/works/OL{index}W',
+        'title': f'Book {index}',
+        'author_name': ['A'],
+        'publish_date': ['2001'],
+        'publisher': ['P'],
+    }
+
+
+def page(key: str, total: int, items: list) -> dict:
+    return {'numFound' if key == 'docs' else 'totalItems': total, key: items}
+
+
+class FakeContent:
+    def __init__(self, body: bytes, chunk_size: int):
+        self.body = body
+        self.chunk_size = chunk_size
+
+    async def iter_chunked(self, size):
+        for start in range(0, len(self.body), self.chunk_size):
+            yield self.body[start:start + self.chunk_size]
+
+
+class FakeResponse:
+    def __init__(self, payload: dict, chunk_size: int = 7):
+        self.content = FakeContent(json.dumps(payload).encode(), chunk_size)
+
+
+class FakeSession:
+    """
+    Stand-in for an aiohttp session answering every GET with one response.
+    """
+    def __init__(self, response):
+        self.response = response
+        self.calls = 0
+
+    def get(self, url, params=None, headers=None):
+        self.calls += 1
+        return self
+
+    async def __aenter__(self):
+        return self.response
+
+    async def __aexit__(self, *exc_info):
+        return False
+
+
+def serve(connector, *payloads):
+    """
+    Answer each paged request with the next payload, streamed in small chunks.
+    """
+    responses = iter(payloads)
+
+    async def request_once(url, params, headers, read):
+        return await read(FakeResponse(next(responses)))
+
+    connector._request_once = AsyncMock(side_effect=request_once)
+    return connector._request_once
+
+
+@pytest.mark.asyncio
+class TestPagedSearch:
+
+    async def test_google_pages_until_limit(self):
+        connector = GoogleBooksConnector(api_key='key')
+        requests = serve(
+            connector,
+            page('items', 100, [google_item(i) for i in range(40)]),
+            page('items', 100, [google_item(i) for i in range(40, 50)]),
+        )
+
+        books = await connector.search({'title': 'book'}, limit=50)
+
+        assert len(books) == 50
+        params = [call.args[1] for call in requests.call_args_list]
+        assert [(p['startIndex'], p['maxResults']) for p in params] == [(0, 40), (40, 10)]
+        assert params[0]['fields'].startswith('totalItems,items(')
+
+    async def test_google_stops_on_short_page(self):
+        connector = GoogleBooksConnector(api_key='key')
+        requests = serve(connector, page('items', 3, [google_item(i) for i in range(3)]))
+
+        assert len(await connector.search({'title': 'book'})) == 3
+        requests.assert_awaited_once()
+
+    async def test_open_library_pages_and_skips_incomplete_docs(self):
+        connector = OpenLibraryConnector()
+        first_page = [open_library_doc(i) for i in range(20)]
+        first_page[0] = {'key': '/works/OL0W', 'title': 'No date'}
+        requests = serve(
+            connector,
+            page('docs', 25, first_page),
+            page('docs', 25, [open_library_doc(i) for i in range(20, 25)]),
+        )
+
+        books = await connector.search({'title': 'book'})
+
+        assert len(books) == 24
+        params = [call.args[1] for call in requests.call_args_list]
+        assert [(p['page'], p['limit']) for p in params] == [(1, 20), (2, 20)]
+        assert 'author_name' in params[0]['fields']
+
+    async def test_open_library_filters_by_finer_date(self):
+        connector = OpenLibraryConnector()
+        docs = [open_library_doc(i) for i in range(3)]
+        docs[0]['publish_date'] = ['October 1974']
+        docs[1]['publish_date'] = ['1974-10-21']
+        docs[2]['publish_date'] = ['1974-03-02']
+        requests = serve(connector, page('docs', 3, docs))
+
+        books = await connector.search(connector.translate({'publication_date': '1974-10'}))
+
+        assert [book.id for book in books] == ['OL0W', 'OL1W']
+        assert 'publication_date' not in requests.call_args.args[1]
+
+    async def test_truncated_body_fails(self):
+        connector = OpenLibraryConnector()
+        response = FakeResponse(page('docs', 1, [open_library_doc(1)]))
+        response.content.body = response.content.body[:-5]
+
+        with pytest.raises(ConnectorFails) as exc_info:
+            await connector._read_page(response, 'docs')
+        assert exc_info.value.retryable
+
+    async def test_malformed_body_fails(self):
+        connector = OpenLibraryConnector()
+        response = FakeResponse(page('docs', 1, [open_library_doc(1)]))
+        response.content.body = response.content.body.replace(b'[', b'[}', 1)
+
+        with pytest.raises(ConnectorFails) as exc_info:
+            await connector._read_page(response, 'docs')
+        assert not exc_info.value.retryable
+
+
+class TestTranslate:
+
+    def test_google_drops_unsupported_params(self):
+        connector = GoogleBooksConnector(api_key='key')
+        assert connector.translate({'title': 'Fox', 'publication_date': '1974'}) == {'title': 'Fox'}
+        assert connector.translate({'publication_date': '1974'}) is None
+
+    def test_open_library_searches_by_year(self):
+        connector = OpenLibraryConnector()
+        assert connector.translate({'author': 'Dahl', 'publication_date': '1974'}) == {
+            'author': 'Dahl', 'q': 'first_publish_year:1974',
+        }
+        assert connector.translate({'author': 'Dahl', 'publication_date': '1974-10'}) == {
+            'author': 'Dahl', 'q': 'first_publish_year:1974', 'publication_date': '1974-10',
+        }
+
+    def test_open_library_ignores_unparsable_date(self):
+        connector = OpenLibraryConnector()
+        assert connector.translate({'title': 'Fox', 'publication_date': 'soon'}) == {'title': 'Fox'}
+        assert connector.translate({'publication_date': 'soon'}) is None
+
+
+@pytest.mark.asyncio
+class TestHealth:
+
+    async def test_open_circuit_stops_retries(self):
+        connector = OpenLibraryConnector(
+            retry_policy=RetryPolicy(tries=3, base_delay=0),
+            health=HealthController(CircuitBreaker(failure_threshold=1)),
+        )
+        connector._request_once = AsyncMock(side_effect=ConnectorFails(status=503, retryable=True))
+
+        with pytest.raises(ConnectorUnavailable):
+            await connector._make_request('https://openlibrary.org/search.json', {}, {})
+
+        connector._request_once.assert_awaited_once()
+
+    async def test_unreadable_200_is_not_retried(self):
+        response = MagicMock(status=200)
+        response.json = AsyncMock(side_effect=aiohttp.ContentTypeError(
+            None, (), status=200, message='Attempt to decode JSON with unexpected mimetype: text/html'
+        ))
+        session = FakeSession(response)
+        connector = OpenLibraryConnector(
+            sessions=MagicMock(get=MagicMock(return_value=session)),
+            retry_policy=RetryPolicy(tries=3, base_delay=0),
+        )
+
+        with pytest.raises(ConnectorFails) as exc_info:
+            await connector._make_request('https://openlibrary.org/search.json', {}, {})
+
+        assert not exc_info.value.retryable
+        assert session.calls == 1
+
+    async def test_records_attempts_and_outcome(self):
+        connector = OpenLibraryConnector(retry_policy=RetryPolicy(tries=3, base_delay=0))
+        connector._request_once = AsyncMock(
+            side_effect=[ConnectorFails(status=503, retryable=True), {'docs': []}]
+        )
+        attempts = UPSTREAM_ATTEMPT_SECONDS.labels(connector.origin, '503')
+        calls = UPSTREAM_REQUEST_SECONDS.labels(connector.origin, '200', 2)
+        failed_before, calls_before = attempts.count, calls.count
+
+        await connector._make_request('https://openlibrary.org/search.json', {}, {})
+
+        assert attempts.count == failed_before + 1
+        assert calls.count == calls_before + 1
+
+    async def test_disk_cache_serves_repeated_calls(self, tmp_path):
+        cache = DiskCache(str(tmp_path / 'upstream.sqlite3'))
+        connector = OpenLibraryConnector(disk_cache=cache)
+        connector._request_once = AsyncMock(side_effect=[
+            {'title': 'Dune', 'first_publish_date': '1965', 'authors': []},
+            ConnectorFails(status=404),
+        ])
+
+        assert (await connector.get_by_id('OL1W')).title == 'Dune'
+        assert await connector.get_by_id('OL2W') is None
+        await cache.flush()
+        assert (await connector.get_by_id('OL1W')).title == 'Dune'
+        assert await connector.get_by_id('OL2W') is None
+        assert connector._request_once.await_count == 2
+
+        # Refreshes always go upstream
+        connector._request_once = AsyncMock(return_value={'title': 'Dune Messiah', 'first_publish_date': '1969'})
+        with priority_scope(BACKGROUND):
+            assert (await connector.get_by_id('OL1W')).title == 'Dune Messiah'
+        await cache.close()
+
+    async def test_disk_cache_hit_keeps_fetch_time(self, tmp_path, monkeypatch):
+        cache = DiskCache(str(tmp_path / 'upstream.sqlite3'))
+        connector = OpenLibraryConnector(disk_cache=cache)
+        connector._request_once = AsyncMock(return_value={'title': 'Dune', 'first_publish_date': '1965'})
+        monkeypatch.setattr('apis.connector.utcnow', lambda: datetime(2024, 1, 1))
+
+        assert (await connector.get_by_id('OL1W')).fetched_at == datetime(2024, 1, 1)
+        await cache.flush()
+        monkeypatch.setattr('apis.connector.utcnow', lambda: datetime(2024, 2, 1))
+
+        assert (await connector.get_by_id('OL1W')).fetched_at == datetime(2024, 1, 1)
+        connector._request_once.assert_awaited_once()
+        await cache.close()
+
+    async def test_google_rotates_keys_per_attempt(self):
+        connector = GoogleBooksConnector(
+            api_key='key', quota=QuotaScheduler(['k1', 'k2'], per_second=100, per_day=10)
+        )
+        connector._request_once = AsyncMock(return_value={})
+
+        await connector._make_request(connector.url, {}, connector._authenticate_request())
+        await connector._make_request(connector.url, {}, connector._authenticate_request())
+
+        keys = [call.args[2][API_KEY_HEADER] for call in connector._request_once.call_args_list]
+        assert keys == ['k1', 'k2']
+
+    async def test_google_explicit_key_wins_over_rotation(self, monkeypatch):
+        monkeypatch.setattr('apis.google_connector.GOOGLE_API_KEYS', 'k1,k2')
+
+        explicit = GoogleBooksConnector(api_key='key')
+        assert explicit.api_key == 'key'
+        assert [quota.key for quota in explicit.quota.keys] == ['key']
+
+        rotating = GoogleBooksConnector()
+        assert rotating.api_key == 'k1'
+        assert [quota.key for quota in rotating.quota.keys] == ['k1', 'k2']
+
+    async def test_google_cancelled_attempt_returns_quota(self):
+        connector = GoogleBooksConnector(
+            api_key='key', quota=QuotaScheduler(['k1'], per_second=100, per_day=1)
+        )
+
+        async def hang(*args):
+            await asyncio.Event().wait()
+
+        connector._request_once = AsyncMock(side_effect=hang)
+
+        call = asyncio.ensure_future(connector._make_request(connector.url, {}, connector._authenticate_request()))
+        await asyncio.sleep(0.01)
+        call.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await call
+
+        connector._request_once = AsyncMock(return_value={})
+        assert await connector._make_request(connector.url, {}, connector._authenticate_request()) == {}
+
+
+@pytest.mark.asyncio
+class TestAgainstStubs:
+    """
+    Full HTTP round trips, including streaming decoding, against the
+    benchmark stand-ins.
+    """
+
+    async def test_search_and_lookup(self):
+        stubs = UpstreamStubs(StubConfig(latency=0, jitter=0, results=45))
+        sessions = HttpSessionRegistry()
+        await stubs.start()
+        try:
+            google = GoogleBooksConnector(api_key='key', sessions=sessions)
+            google.url = stubs.google_url
+            open_library = OpenLibraryConnector(sessions=sessions)
+            open_library.url = stubs.open_library_url
+
+            assert len(await google.search({'title': 'fox'}, limit=45)) == 45
+            assert len(await open_library.search({'title': 'fox'}, limit=45)) == 45
+            assert (await google.get_by_id('zyTCAlFPjgYC')).id == 'zyTCAlFPjgYC'
+            assert stubs.google_keys == {'key': 3}
+            work = await open_library.get_by_id('OL45804W')
+            assert work.id == 'OL45804W'
+            assert len(work.authors) == 1
+        finally:
+            await sessions.close()
+            await stubs.stop()
+
+        assert stubs.requests['google_search'] == 2
+        assert stubs.requests['open_library_search'] == 3
+
+    async def test_warm_restart_from_disk_cache(self, tmp_path):
+        stubs = UpstreamStubs(StubConfig(latency=0, jitter=0, results=45))
+        path = str(tmp_path / 'upstream.sqlite3')
+        await stubs.start()
+        try:
+            for _ in range(2):
+                # A new cache and connector per round, as after a restart
+                sessions = HttpSessionRegistry()
+                cache = DiskCache(path)
+                google = GoogleBooksConnector(api_key='key', sessions=sessions, disk_cache=cache)
+                google.url = stubs.google_url
+                books = await google.search({'title': 'fox'}, limit=45)
+                await cache.close()
+                await sessions.close()
+                assert len(books) == 45
+                assert books[0].publication_date.year >= 1950
+        finally:
+            await stubs.stop()
+
+        assert stubs.requests['google_search'] == 2
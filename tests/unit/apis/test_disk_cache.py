@@ -0,0 +1,90 @@
+import pytest
+
+from apis.disk_cache import MISSING, NOT_FOUND, DiskCache
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock():
+    return FakeClock()
+
+
+@pytest.fixture
+def make_cache(tmp_path, clock):
+    caches = []
+
+    def make(**kwargs):
+        cache = DiskCache(str(tmp_path / 'cache' / 'upstream.sqlite3'), clock=clock, **kwargs)
+        caches.append(cache)
+        return cache
+
+    yield make
+    for cache in caches:
+        cache._executor.shutdown(wait=True)
+        cache._close()
+
+
+@pytest.mark.asyncio
+class TestDiskCache:
+
+    async def test_round_trip_survives_reopening(self, make_cache):
+        cache = make_cache()
+        cache.put('key', {'title': 'Dune', 'authors': ['Frank Herbert']})
+        await cache.close()
+
+        reopened = make_cache()
+        assert await reopened.get('key') == {'title': 'Dune', 'authors': ['Frank Herbert']}
+        assert await reopened.get('other') is MISSING
+        assert reopened.size > 0
+
+    async def test_entries_expire(self, make_cache, clock):
+        cache = make_cache(ttl=60, negative_ttl=10)
+        cache.put('found', {'id': 1})
+        cache.put_not_found('gone')
+        await cache.flush()
+
+        assert await cache.get('found') == {'id': 1}
+        assert await cache.get('gone') is NOT_FOUND
+
+        clock.now += 30
+        assert await cache.get('gone') is MISSING
+        clock.now += 31
+        assert await cache.get('found') is MISSING
+
+    async def test_evicts_least_recently_read(self, make_cache, clock):
+        payload = {'description': 'x' * 100}
+        cache = make_cache(max_bytes=10 ** 9)
+        for index in range(5):
+            cache.put(f'key{index}', {**payload, 'index': index})
+            clock.now += 1
+        await cache.flush()
+        clock.now += 1
+        assert await cache.get('key0') is not MISSING
+
+        cache.max_bytes = cache.size - 1
+        cache.put('key5', {**payload, 'index': 5})
+        await cache.flush()
+
+        assert cache.size <= cache.max_bytes
+        assert cache.evictions >= 1
+        assert await cache.get('key1') is MISSING
+        assert await cache.get('key0') is not MISSING
+        assert await cache.get('key5') is not MISSING
+
+    async def test_unusable_path_disables_the_cache(self, tmp_path):
+        blocker = tmp_path / 'file'
+        blocker.write_text('not a directory')
+        cache = DiskCache(str(blocker / 'upstream.sqlite3'))
+
+        cache.put('key', {'id': 1})
+        await cache.flush()
+
+        assert await cache.get('key') is MISSING
+        await cache.close()
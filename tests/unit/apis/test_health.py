@@ -0,0 +1,162 @@
+import asyncio
+
+import pytest
+
+from apis.exceptions import ConnectorFails, ConnectorTimeout, ConnectorUnavailable
+from apis.health import CLOSED, HALF_OPEN, OPEN, AdaptiveLimiter, CircuitBreaker, HealthController
+from apis.retry import RetryPolicy, deadline_scope
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+async def ok():
+    return 'ok'
+
+
+async def unavailable():
+    raise ConnectorFails(status=503, retryable=True)
+
+
+async def not_found():
+    raise ConnectorFails(status=404)
+
+
+class TestCircuitBreaker:
+
+    def test_opens_after_consecutive_failures(self):
+        breaker = CircuitBreaker(failure_threshold=3, clock=FakeClock())
+        breaker.record_failure()
+        breaker.record_failure()
+        breaker.record_success()
+        breaker.record_failure()
+        breaker.record_failure()
+        assert breaker.state == CLOSED
+
+        breaker.record_failure()
+        assert breaker.state == OPEN
+        assert not breaker.allow()
+
+    def test_half_open_probe(self):
+        clock = FakeClock()
+        breaker = CircuitBreaker(failure_threshold=1, reset_timeout=10, half_open_probes=1, clock=clock)
+        breaker.record_failure()
+
+        clock.now = 10
+        assert breaker.state == HALF_OPEN
+        assert breaker.allow()
+        assert not breaker.allow()
+
+        breaker.record_failure()
+        assert breaker.state == OPEN
+
+        clock.now = 20
+        assert breaker.allow()
+        breaker.record_success()
+        assert breaker.state == CLOSED
+        assert breaker.opened == 2
+
+
+class TestAdaptiveLimiter:
+
+    def test_additive_increase_multiplicative_decrease(self):
+        limiter = AdaptiveLimiter(initial_limit=4, min_limit=1, max_limit=5, latency_target=1)
+        for _ in range(4):
+            limiter.record(0.1, ok=True)
+        assert limiter.limit == pytest.approx(4.9, abs=0.05)
+
+        limiter.record(0.1, ok=False)
+        assert limiter.limit == pytest.approx(2.45, abs=0.05)
+        limiter.record(3, ok=True)
+        limiter.record(3, ok=True)
+        assert limiter.limit == 1
+
+    def test_rejects_over_limit(self):
+        limiter = AdaptiveLimiter(initial_limit=2)
+        assert limiter.try_acquire()
+        assert limiter.try_acquire()
+        assert not limiter.try_acquire()
+        limiter.release()
+        assert limiter.try_acquire()
+
+
+@pytest.mark.asyncio
+class TestHealthController:
+
+    async def test_sheds_calls_once_open(self):
+        health = HealthController(CircuitBreaker(failure_threshold=2))
+        for _ in range(2):
+            with pytest.raises(ConnectorFails):
+                await health.call(unavailable)
+
+        calls = []
+
+        async def tracked():
+            calls.append(1)
+            return 'ok'
+
+        with pytest.raises(ConnectorUnavailable):
+            await health.call(tracked)
+        assert calls == []
+        assert health.snapshot()['circuit_state'] == OPEN
+        assert health.snapshot()['rejected'] == 1
+
+    async def test_not_found_is_not_a_failure(self):
+        health = HealthController(CircuitBreaker(failure_threshold=1))
+        with pytest.raises(ConnectorFails):
+            await health.call(not_found)
+
+        assert await health.call(ok) == 'ok'
+        assert health.failures == 0
+
+    async def test_concurrency_limit(self):
+        health = HealthController(limiter=AdaptiveLimiter(initial_limit=1))
+        release = asyncio.Event()
+
+        async def slow():
+            await release.wait()
+            return 'ok'
+
+        first = asyncio.ensure_future(health.call(slow))
+        await asyncio.sleep(0)
+        with pytest.raises(ConnectorUnavailable):
+            await health.call(ok)
+
+        release.set()
+        assert await first == 'ok'
+        assert health.limiter.in_flight == 0
+
+    async def test_cancelled_probe_is_released(self):
+        clock = FakeClock()
+        health = HealthController(CircuitBreaker(failure_threshold=1, reset_timeout=1, clock=clock))
+        with pytest.raises(ConnectorFails):
+            await health.call(unavailable)
+        clock.now = 1
+
+        probe = asyncio.ensure_future(health.call(asyncio.Event().wait))
+        await asyncio.sleep(0)
+        probe.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await probe
+
+        assert await health.call(ok) == 'ok'
+        assert health.breaker.state == CLOSED
+
+    async def test_hanging_calls_open_the_circuit(self):
+        health = HealthController(
+            CircuitBreaker(failure_threshold=2),
+            AdaptiveLimiter(latency_target=0.01),
+        )
+        policy = RetryPolicy(tries=1)
+        for _ in range(2):
+            with deadline_scope(0.05), pytest.raises(ConnectorTimeout):
+                await policy.call(lambda: health.call(asyncio.Event().wait))
+
+        assert health.breaker.state == OPEN
+        assert health.failures == 2
+        assert health.limiter.in_flight == 0
@@ -0,0 +1,26 @@
+import pytest
+
+from apis.http_session import HttpSessionRegistry
+
+
+@pytest.mark.asyncio
+class TestHttpSessionRegistry:
+
+    async def test_session_is_reused_per_name(self):
+        registry = HttpSessionRegistry(limit_per_host=5)
+        try:
+            first = registry.get('Google Books API')
+            assert registry.get('Google Books API') is first
+            assert registry.get('Open Library API') is not first
+            assert first.connector.limit_per_host == 5
+        finally:
+            await registry.close()
+
+    async def test_close_releases_sessions(self):
+        registry = HttpSessionRegistry()
+        session = registry.get('Open Library API')
+        await registry.close()
+
+        assert session.closed
+        assert registry.get('Open Library API') is not session
+        await registry.close()
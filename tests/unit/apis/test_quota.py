@@ -0,0 +1,117 @@
+import asyncio
+from datetime import datetime
+
+import pytest
+from dateutil import tz
+
+from apis.exceptions import QuotaExhausted
+from apis.quota import BACKGROUND, INTERACTIVE, DailyBucket, QuotaScheduler, TokenBucket, priority_scope
+
+
+class FakeClock:
+    def __init__(self, now: float = 0.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+class TestTokenBucket:
+
+    def test_burst_then_rate(self):
+        clock = FakeClock()
+        bucket = TokenBucket(rate=2, capacity=3, clock=clock)
+        assert [bucket.take() for _ in range(4)] == [True, True, True, False]
+        assert bucket.wait_time() == pytest.approx(0.5)
+
+        clock.now = 0.5
+        assert bucket.take()
+        assert not bucket.take()
+
+        clock.now = 100
+        assert [bucket.take() for _ in range(4)] == [True, True, True, False]
+
+
+class TestDailyBucket:
+
+    def test_resets_at_midnight(self):
+        pacific = tz.gettz('America/Los_Angeles')
+        clock = FakeClock(datetime(2024, 3, 1, 23, 0, tzinfo=pacific).timestamp())
+        bucket = DailyBucket(2, clock=clock)
+        assert bucket.take() and bucket.take()
+        assert not bucket.take()
+        assert bucket.reset_in() == pytest.approx(3600)
+
+        clock.now += 3600
+        assert bucket.remaining == 2
+
+
+@pytest.mark.asyncio
+class TestQuotaScheduler:
+
+    async def test_rotates_keys(self):
+        scheduler = QuotaScheduler(['a', 'b'], per_second=100, per_day=10, burst=1)
+        assert [await scheduler.acquire() for _ in range(2)] == ['a', 'b']
+        assert [quota['granted'] for quota in scheduler.stats()['keys']] == [1, 1]
+
+    async def test_never_exceeds_rate(self):
+        scheduler = QuotaScheduler(['a'], per_second=50, per_day=100, burst=1)
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+
+        await asyncio.gather(*[scheduler.acquire() for _ in range(6)])
+
+        # One token in the bucket, then one every 20ms
+        assert loop.time() - started >= 0.09
+        assert scheduler.waited == 5
+
+    async def test_interactive_calls_go_first(self):
+        scheduler = QuotaScheduler(['a'], per_second=100, per_day=100, burst=1)
+        await scheduler.acquire()
+        order = []
+
+        async def call(name, priority):
+            with priority_scope(priority):
+                await scheduler.acquire()
+            order.append(name)
+
+        await asyncio.gather(
+            call('refresh-1', BACKGROUND),
+            call('refresh-2', BACKGROUND),
+            call('search', INTERACTIVE),
+        )
+
+        assert order == ['search', 'refresh-1', 'refresh-2']
+
+    async def test_daily_quota_exhausted(self):
+        scheduler = QuotaScheduler(['a'], per_second=100, per_day=1)
+        await scheduler.acquire()
+
+        with pytest.raises(QuotaExhausted) as exc:
+            await scheduler.acquire()
+        assert exc.value.retry_after > 0
+        assert scheduler.stats()['exhausted'] == 1
+
+    async def test_released_token_is_reused(self):
+        scheduler = QuotaScheduler(['a'], per_second=0.001, per_day=1, burst=1)
+        key = await scheduler.acquire()
+        scheduler.release(key)
+
+        assert await scheduler.acquire() == 'a'
+
+    async def test_token_granted_to_cancelled_caller_is_returned(self):
+        scheduler = QuotaScheduler(['a'], per_second=0.001, per_day=2, burst=1)
+        await scheduler.acquire()
+        waiter = asyncio.ensure_future(scheduler.acquire())
+        await asyncio.sleep(0)
+
+        # Granted, as the dispatcher would, but cancelled before the caller resumes
+        quota = scheduler.keys[0]
+        quota.second._tokens = 1
+        assert quota.take()
+        scheduler._queue[0][2].set_result('a')
+        waiter.cancel()
+
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+        assert quota.granted == 1
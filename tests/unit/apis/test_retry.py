@@ -0,0 +1,93 @@
+import asyncio
+import time
+
+import pytest
+
+from apis.exceptions import ConnectorFails, ConnectorTimeout
+from apis.retry import RetryPolicy, deadline_scope, parse_retry_after
+
+
+def failing(errors, result="ok"):
+    calls = []
+
+    async def _call():
+        calls.append(time.monotonic())
+        if len(calls) <= len(errors):
+            raise errors[len(calls) - 1]
+        return result
+    return _call, calls
+
+
+@pytest.mark.asyncio
+class TestRetryPolicy:
+
+    async def test_retries_retryable_failures(self):
+        func, calls = failing([ConnectorFails(status=503, retryable=True)])
+        policy = RetryPolicy(tries=3, base_delay=0.001)
+
+        assert await policy.call(func) == "ok"
+        assert len(calls) == 2
+
+    async def test_does_not_retry_client_errors(self):
+        func, calls = failing([ConnectorFails(status=400)])
+        policy = RetryPolicy(tries=3, base_delay=0.001)
+
+        with pytest.raises(ConnectorFails):
+            await policy.call(func)
+        assert len(calls) == 1
+
+    async def test_gives_up_after_tries(self):
+        errors = [ConnectorFails(status=500, retryable=True)] * 3
+        func, calls = failing(errors)
+        policy = RetryPolicy(tries=3, base_delay=0.001)
+
+        with pytest.raises(ConnectorFails):
+            await policy.call(func)
+        assert len(calls) == 3
+
+    async def test_honours_retry_after(self):
+        func, calls = failing([ConnectorFails(status=429, retryable=True, retry_after=0.05)])
+        policy = RetryPolicy(tries=2, base_delay=0)
+
+        await policy.call(func)
+        assert calls[1] - calls[0] >= 0.05
+
+    async def test_retry_after_is_capped_by_max_delay(self):
+        func, calls = failing([ConnectorFails(status=429, retryable=True, retry_after=3600)])
+        policy = RetryPolicy(tries=2, base_delay=0, max_delay=0.01)
+
+        assert await policy.call(func) == "ok"
+        assert calls[1] - calls[0] < 1
+
+    async def test_attempt_is_cut_by_deadline(self):
+        async def slow():
+            await asyncio.sleep(1)
+
+        policy = RetryPolicy(tries=3, base_delay=0)
+        started = time.monotonic()
+        with deadline_scope(0.05):
+            with pytest.raises(ConnectorTimeout):
+                await policy.call(slow)
+        assert time.monotonic() - started < 0.5
+
+    async def test_backoff_does_not_sleep_past_deadline(self):
+        func, calls = failing([ConnectorFails(status=429, retryable=True, retry_after=5)])
+        policy = RetryPolicy(tries=3)
+
+        with deadline_scope(0.1):
+            with pytest.raises(ConnectorFails):
+                await policy.call(func)
+        assert len(calls) == 1
+
+
+class TestDeadlineScope:
+
+    def test_nested_scope_cannot_extend_deadline(self):
+        with deadline_scope(1) as outer:
+            with deadline_scope(10) as inner:
+                assert inner is outer
+
+    def test_parse_retry_after(self):
+        assert parse_retry_after("3") == 3
+        assert parse_retry_after(None) is None
+        assert parse_retry_after("Wed, 21 Oct 2015 07:28:00 GMT") == 0
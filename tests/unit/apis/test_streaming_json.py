@@ -0,0 +1,69 @@
+import json
+
+import pytest
+
+from apis.streaming_json import ArrayStreamDecoder, TruncatedDocument
+
+DOCUMENT = {
+    'numFound': 12345,
+    'start': 0,
+    'docs': [{'key': '/works/OL1W', 'title': 'Cien años', 'n': 1.5}, {'key': '/works/OL2W'}, [], 7],
+    'q': 'cien',
+    'exact': True,
+}
+
+
+def decode(body: bytes, chunk_size: int):
+    decoder = ArrayStreamDecoder('docs')
+    items = []
+    for start in range(0, len(body), chunk_size):
+        items += decoder.feed(body[start:start + chunk_size])
+    items += decoder.close()
+    return decoder.meta, items
+
+
+class TestArrayStreamDecoder:
+
+    @pytest.mark.parametrize('chunk_size', [1, 2, 3, 7, 64, 10000])
+    def test_any_chunking_gives_the_same_result(self, chunk_size):
+        body = json.dumps(DOCUMENT, ensure_ascii=False, indent=1).encode()
+
+        meta, items = decode(body, chunk_size)
+
+        assert items == DOCUMENT['docs']
+        assert meta == {'numFound': 12345, 'start': 0, 'q': 'cien', 'exact': True}
+
+    def test_items_are_released_as_they_complete(self):
+        decoder = ArrayStreamDecoder('docs')
+        assert decoder.feed(b'{"numFound": 2, "docs": [{"a": 1}, {"b"') == [{'a': 1}]
+        assert decoder.feed(b': 2}]}') == [{'b': 2}]
+        assert decoder.close() == []
+
+    def test_missing_array(self):
+        meta, items = decode(b'{"numFound": 0}', 4)
+        assert items == []
+        assert meta == {'numFound': 0}
+
+    def test_truncated_document(self):
+        decoder = ArrayStreamDecoder('docs')
+        decoder.feed(b'{"docs": [{"a": 1}, ')
+        with pytest.raises(ValueError):
+            decoder.close()
+
+    def test_body_cut_mid_value(self):
+        for body in (b'{"docs": [{"a": 1}, {"b": ', b'{"docs": [{"a": "unfini'):
+            decoder = ArrayStreamDecoder('docs')
+            decoder.feed(body)
+            with pytest.raises(TruncatedDocument):
+                decoder.close()
+
+    def test_malformed_value_is_not_truncation(self):
+        decoder = ArrayStreamDecoder('docs')
+        decoder.feed(b'{"docs": [{"a": tru}]}')
+        with pytest.raises(ValueError) as exc_info:
+            decoder.close()
+        assert not isinstance(exc_info.value, TruncatedDocument)
+
+    def test_not_an_object(self):
+        with pytest.raises(ValueError):
+            ArrayStreamDecoder('docs').feed(b'[1, 2]')
@@ -0,0 +1,53 @@
+from unittest.mock import AsyncMock, MagicMock
+
+import pytest
+
+from data.mongo_connector import MongoConnectionManager
+
+
+@pytest.fixture
+def manager():
+    manager = MongoConnectionManager(uri="mongodb://localhost:27017/test")
+    manager._client = MagicMock()
+    collection = manager._client.__getitem__.return_value.__getitem__.return_value
+    collection.create_indexes = AsyncMock()
+    yield manager
+    manager._client = None
+
+
+class TestMongoConnectionManager:
+
+    @pytest.mark.asyncio
+    async def test_indexes_bootstrapped_once(self, manager):
+        collection = manager.client['test']['books']
+
+        async with manager('books', 'test') as first:
+            pass
+        async with manager('books', 'test') as second:
+            pass
+
+        assert first is second is collection
+        collection.create_indexes.assert_awaited_once()
+
+    @pytest.mark.asyncio
+    async def test_connect_bootstraps_registered_collections(self, manager):
+        await manager.connect('test')
+        async with manager('books', 'test'):
+            pass
+
+        manager.client['test']['books'].create_indexes.assert_awaited_once()
+
+    def test_pool_options(self):
+        manager = MongoConnectionManager(
+            uri="mongodb://localhost:27017/test",
+            min_pool_size=5,
+            max_pool_size=50,
+        )
+        assert manager.pool_options['minPoolSize'] == 5
+        assert manager.pool_options['maxPoolSize'] == 50
+
+    def test_keyset_pagination_indexes(self):
+        manager = MongoConnectionManager(uri="mongodb://localhost:27017/test")
+        keys = [list(index.document['key'].items()) for index in manager.indexes['books']]
+        assert [('title_norm', 1), ('id', 1)] in keys
+        assert [('publication_date', 1), ('id', 1)] in keys
@@ -0,0 +1,113 @@
+import json
+from datetime import datetime
+
+import pytest
+from pydantic import ValidationError
+
+from data.mongo_repository import MongoDBRepository
+from data.normalize import normalize_text, tokenize_all
+from domain.models import Book
+from responses import dumps
+
+
+def repository(search_mode: str) -> MongoDBRepository:
+    return MongoDBRepository(None, db_name="test", collection_name="books", search_mode=search_mode)
+
+
+class TestNormalize:
+
+    def test_accents_case_and_punctuation_are_folded(self):
+        assert normalize_text("  Cien Años de Soledad: ÉDITION ") == "cien anos de soledad edition"
+
+    def test_tokens_are_distinct(self):
+        assert tokenize_all(["Gabriel García Márquez", "Gabriel Marquez"]) == [
+            "gabriel", "garcia", "marquez"
+        ]
+
+
+class TestBuildQuery:
+
+    def test_token_mode(self):
+        query = repository('token').build_query({'title': 'The Hobbit', 'author': 'Tolkien'})
+        assert query == {'$and': [
+            {'title_tokens': {'$all': ['the', 'hobbit']}},
+            {'author_tokens': {'$all': ['tolkien']}},
+        ]}
+
+    def test_prefix_mode_anchors_last_token(self):
+        query = repository('prefix').build_query({'title': 'Cien años de sol'})
+        assert query == {'$and': [
+            {'title_tokens': {'$all': ['cien', 'anos', 'de']}},
+            {'title_tokens': {'$regex': '^sol'}},
+        ]}
+
+    def test_text_mode(self):
+        query = repository('text').build_query({'title': 'The Hobbit', 'author': 'Tolkien'})
+        assert query == {'$text': {'$search': 'the hobbit tolkien'}}
+
+    def test_document_carries_search_fields(self):
+        book = Book(
+            id='1',
+            title='Cien Años de Soledad',
+            authors=['Gabriel García Márquez'],
+            categories=[],
+            publication_date='1967-05-30',
+            editor='Sudamericana',
+            description='',
+        )
+        document = repository('token').to_document(book)
+        assert document['title_tokens'] == normalize_text(book.title).split()
+        assert document['authors_norm'] == [normalize_text(author) for author in book.authors]
+        assert document['publication_year'] == 1967
+        assert document['publication_month'] == 5
+
+
+class TestDateQuery:
+
+    def test_year(self):
+        query = repository('token').build_query({'publication_date': '1999'})
+        assert query == {
+            'publication_year': 1999,
+            'publication_date': {'$gte': datetime(1999, 1, 1), '$lt': datetime(2000, 1, 1)},
+        }
+
+    def test_month(self):
+        query = repository('token').build_query({'publication_date': '1999-12'})
+        assert query['publication_month'] == 12
+        assert query['publication_date'] == {
+            '$gte': datetime(1999, 12, 1), '$lt': datetime(2000, 1, 1)
+        }
+
+    def test_full_date(self):
+        query = repository('token').build_query({'publication_date': '1999-05-30'})
+        assert query['publication_date'] == {
+            '$gte': datetime(1999, 5, 30), '$lt': datetime(1999, 5, 31)
+        }
+
+    def test_invalid_date(self):
+        with pytest.raises(ValueError):
+            repository('token').build_query({'publication_date': 'not a date'})
+
+
+class TestToDomain:
+
+    def test_trusted_document_round_trip(self):
+        book = Book(
+            id='1',
+            title='Cien Años de Soledad',
+            authors=['Gabriel García Márquez'],
+            categories=['Novel'],
+            publication_date='1967-05-30',
+            editor='Sudamericana',
+            description='',
+        )
+        repo = repository('token')
+        document = repo.to_document(book)
+        document['_id'] = 'object-id'
+
+        assert repo.to_domain(document) == book
+        assert json.loads(dumps(repo.to_domain(document))) == json.loads(book.model_dump_json())
+
+    def test_untrusted_document_is_validated(self):
+        with pytest.raises(ValidationError):
+            repository('token').to_domain({'id': '1', 'title': 'No authors'})
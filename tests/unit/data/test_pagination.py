@@ -0,0 +1,33 @@
+from datetime import datetime
+
+import pytest
+
+from data.pagination import after_query, decode_cursor, encode_cursor, parse_order
+
+
+class TestPagination:
+
+    def test_parse_order(self):
+        assert parse_order('-publication_date') == ('publication_date', 'publication_date', -1)
+        assert parse_order(None) == ('id', 'id', 1)
+        with pytest.raises(ValueError):
+            parse_order('description')
+
+    def test_cursor_round_trip(self):
+        document = {'id': 'abc', 'publication_date': datetime(1999, 5, 30)}
+        cursor = encode_cursor('publication_date', document)
+        assert decode_cursor('publication_date', cursor) == (datetime(1999, 5, 30), 'abc')
+
+    def test_cursor_is_bound_to_order(self):
+        cursor = encode_cursor('id', {'id': 'abc'})
+        with pytest.raises(ValueError):
+            decode_cursor('title', cursor)
+        with pytest.raises(ValueError):
+            decode_cursor('id', 'garbage')
+
+    def test_after_query_uses_id_as_tie_breaker(self):
+        cursor = encode_cursor('-title', {'id': 'abc', 'title': 'The Hobbit'})
+        assert after_query('-title', cursor) == {'$or': [
+            {'title_norm': {'$lt': 'the hobbit'}},
+            {'title_norm': 'the hobbit', 'id': {'$lt': 'abc'}},
+        ]}
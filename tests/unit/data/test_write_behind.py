@@ -0,0 +1,108 @@
+import asyncio
+from datetime import datetime
+from unittest.mock import AsyncMock
+
+import pytest
+
+from conftest import FakeRepository
+from data.write_behind import (
+    BOOKS_DROPPED, BOOKS_WRITTEN, WRITE_BEHIND_FLUSH_ERRORS, WRITE_BEHIND_FLUSH_SECONDS, WriteBehindQueue,
+)
+from domain.models import Book
+
+
+def make_book(book_id: str, title: str = 'Title') -> Book:
+    return Book(
+        id=book_id,
+        title=title,
+        authors=['Author'],
+        categories=[],
+        publication_date=datetime(2000, 1, 1),
+        editor='Editor',
+        description='',
+    )
+
+
+@pytest.mark.asyncio
+class TestWriteBehindQueue:
+
+    async def test_books_are_deduplicated_and_flushed_in_one_batch(self):
+        repository = FakeRepository()
+        repository.save_many = AsyncMock(wraps=repository.save_many)
+        queue = WriteBehindQueue(repository, batch_size=10)
+        written, flushes = BOOKS_WRITTEN.get(), WRITE_BEHIND_FLUSH_SECONDS.labels().count
+
+        await queue.put(make_book('1', 'old'))
+        await queue.put(make_book('1', 'new'))
+        await queue.put(make_book('2'))
+        assert queue.depth == 2
+
+        await queue.flush()
+
+        repository.save_many.assert_awaited_once()
+        assert [book.title for book in repository._client] == ['new', 'Title']
+        assert queue.depth == 0
+        assert queue.written == 2
+        assert BOOKS_WRITTEN.get() == written + 2
+        assert WRITE_BEHIND_FLUSH_SECONDS.labels().count == flushes + 1
+
+    async def test_overwrite_is_kept_across_puts(self):
+        repository = FakeRepository()
+        repository.save_many = AsyncMock()
+        queue = WriteBehindQueue(repository, batch_size=10)
+
+        await queue.put(make_book('1'), overwrite=True)
+        await queue.put(make_book('1', 'new'))
+        await queue.put(make_book('2'))
+        await queue.flush()
+
+        inserts, overwrites = repository.save_many.await_args_list
+        assert [book.id for book in inserts.args[0]] == ['2']
+        assert [book.title for book in overwrites.args[0]] == ['new']
+        assert overwrites.kwargs == {'overwrite': True}
+
+    async def test_size_trigger_flushes_in_background(self):
+        repository = FakeRepository()
+        queue = WriteBehindQueue(repository, batch_size=2, flush_interval=60)
+        queue.start()
+        try:
+            await queue.put(make_book('1'))
+            await queue.put(make_book('2'))
+            for _ in range(100):
+                if len(repository._client) == 2:
+                    break
+                await asyncio.sleep(0.01)
+            assert len(repository._client) == 2
+        finally:
+            await queue.stop()
+
+    async def test_stop_flushes_pending_books(self):
+        repository = FakeRepository()
+        queue = WriteBehindQueue(repository, flush_interval=60)
+        queue.start()
+        await queue.put(make_book('1'))
+
+        await queue.stop()
+
+        assert len(repository._client) == 1
+
+    async def test_full_queue_drops_after_max_wait(self):
+        queue = WriteBehindQueue(FakeRepository(), max_pending=1, max_wait=0.01)
+        dropped = BOOKS_DROPPED.get()
+
+        assert await queue.put(make_book('1'))
+        assert not await queue.put(make_book('2'))
+        assert queue.dropped == 1
+        assert BOOKS_DROPPED.get() == dropped + 1
+
+    async def test_failed_flush_keeps_books(self):
+        repository = FakeRepository()
+        repository.save_many = AsyncMock(side_effect=RuntimeError)
+        queue = WriteBehindQueue(repository)
+        await queue.put(make_book('1'))
+        errors = WRITE_BEHIND_FLUSH_ERRORS.labels().get()
+
+        assert not await queue.flush()
+        assert queue.depth == 1
+        assert queue.flush_errors == 1
+        assert WRITE_BEHIND_FLUSH_ERRORS.labels().get() == errors + 1
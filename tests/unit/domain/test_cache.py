@@ -0,0 +1,55 @@
+from domain.cache import MISSING, TTLCache, normalize_search_params
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestNormalizeSearchParams:
+
+    def test_key_ignores_case_whitespace_and_order(self):
+        first = normalize_search_params({'title': ' The  Hobbit', 'author': 'Tolkien'})
+        second = normalize_search_params({'author': 'TOLKIEN', 'title': 'the hobbit '})
+        assert first == second
+
+    def test_none_values_are_dropped(self):
+        assert normalize_search_params({'title': 'a', 'author': None}) == (('title', 'a'),)
+
+
+class TestTTLCache:
+
+    def test_hit_and_miss_counters(self):
+        cache = TTLCache(maxsize=2, ttl=10)
+        assert cache.get('a') is MISSING
+        cache.set('a', 'book')
+        assert cache.get('a') == 'book'
+        assert cache.stats()['hits'] == 1
+        assert cache.stats()['misses'] == 1
+
+    def test_lru_eviction(self):
+        cache = TTLCache(maxsize=2, ttl=10)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        cache.get('a')
+        cache.set('c', 3)
+
+        assert cache.get('b') is MISSING
+        assert cache.get('a') == 1
+        assert cache.evictions == 1
+
+    def test_entries_expire(self):
+        clock = FakeClock()
+        cache = TTLCache(ttl=10, negative_ttl=1, clock=clock)
+        cache.set('found', 'book')
+        cache.set('missing', None)
+
+        clock.now = 5
+        assert cache.get('found') == 'book'
+        assert cache.get('missing') is MISSING
+        clock.now = 11
+        assert cache.get('found') is MISSING
+        assert cache.expirations == 2
@@ -0,0 +1,110 @@
+import asyncio
+
+import pytest
+
+from domain.exception import PartialOutage, SourcesUnavailable
+from domain.fanout import FanOut, LatencyTracker
+
+
+def source(result=None, delay=0.0, error=None):
+    calls = []
+
+    async def _call():
+        calls.append(1)
+        await asyncio.sleep(delay)
+        if error:
+            raise error
+        return result
+    _call.calls = calls
+    return _call
+
+
+@pytest.mark.asyncio
+class TestFanOut:
+
+    async def test_fast_result_does_not_wait_for_slow_source(self):
+        fanout = FanOut(grace=0.01)
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+
+        result = await fanout.first([
+            ('a', source(None, delay=0.01)),
+            ('b', source('fast', delay=0)),
+            ('c', source('slow', delay=5)),
+        ])
+
+        assert result == 'fast'
+        assert loop.time() - started < 1
+
+    async def test_preferred_source_wins_within_grace(self):
+        fanout = FanOut(grace=0.5)
+
+        result = await fanout.first([
+            ('a', source('preferred', delay=0.05)),
+            ('b', source('other', delay=0)),
+        ])
+
+        assert result == 'preferred'
+
+    async def test_grace_window_expires(self):
+        fanout = FanOut(grace=0.01)
+
+        result = await fanout.first([
+            ('a', source('preferred', delay=5)),
+            ('b', source('other', delay=0)),
+        ])
+
+        assert result == 'other'
+
+    async def test_failures_and_empty_results_are_skipped(self):
+        fanout = FanOut()
+
+        assert await fanout.first([
+            ('a', source(error=ValueError())),
+            ('b', source('found')),
+        ]) == 'found'
+        assert await fanout.first([
+            ('a', source(None)),
+            ('b', source([])),
+        ]) is None
+
+    async def test_empty_answer_with_failed_sources_is_a_partial_outage(self):
+        with pytest.raises(PartialOutage):
+            await FanOut().first([
+                ('a', source(error=ValueError())),
+                ('b', source(None)),
+            ])
+
+    async def test_raises_when_every_source_fails(self):
+        with pytest.raises(SourcesUnavailable):
+            await FanOut().first([
+                ('a', source(error=ValueError())),
+                ('b', source(error=RuntimeError())),
+            ])
+
+    async def test_losing_tasks_are_cancelled(self):
+        cancelled = asyncio.Event()
+
+        async def slow():
+            try:
+                await asyncio.sleep(5)
+            except asyncio.CancelledError:
+                cancelled.set()
+                raise
+
+        await FanOut(grace=0).first([('a', source('x')), ('b', slow)])
+        await asyncio.wait_for(cancelled.wait(), 1)
+
+    async def test_hedged_request_after_percentile(self):
+        latencies = LatencyTracker(min_samples=1)
+        latencies.record('a', 0.01)
+        fanout = FanOut(hedge_percentile=50, latencies=latencies)
+        attempts = []
+
+        async def flaky():
+            attempts.append(1)
+            await asyncio.sleep(5 if len(attempts) == 1 else 0)
+            return 'hedged'
+
+        assert await fanout.first([('a', flaky)]) == 'hedged'
+        assert len(attempts) == 2
@@ -0,0 +1,37 @@
+from apis.google_connector import GoogleBooksConnector
+from apis.open_library import OpenLibraryConnector
+from domain.planner import QueryPlanner
+
+
+class TestQueryPlanner:
+
+    def setup_method(self):
+        self.google = GoogleBooksConnector(api_key='key')
+        self.open_library = OpenLibraryConnector()
+        self.clients = [self.google, self.open_library]
+
+    def test_date_only_search_skips_google(self):
+        plan = QueryPlanner().plan_search(self.clients, {'publication_date': '1974-10-01'})
+
+        assert plan == [(self.open_library, {'q': 'first_publish_year:1974', 'publication_date': '1974-10-01'})]
+
+    def test_cheapest_complete_answer_comes_first(self):
+        plan = QueryPlanner().plan_search(self.clients, {'title': 'Fox', 'publication_date': '1974'})
+
+        assert [client for client, _ in plan] == [self.open_library, self.google]
+        assert plan[1][1] == {'title': 'Fox'}
+
+    def test_max_sources(self):
+        plan = QueryPlanner(max_sources=1).plan_search(self.clients, {'title': 'Fox'})
+
+        assert [client for client, _ in plan] == [self.open_library]
+
+    def test_unsupported_params_only(self):
+        assert QueryPlanner().plan_search(self.clients, {'isbn': '9780140328721'}) == []
+
+    def test_lookup_by_id_format(self):
+        planner = QueryPlanner()
+
+        assert planner.plan_lookup(self.clients, 'zyTCAlFPjgYC') == [self.google]
+        assert planner.plan_lookup(self.clients, 'OL45804W') == [self.open_library]
+        assert planner.plan_lookup(self.clients, 'unknown') == []
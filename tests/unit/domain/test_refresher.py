@@ -0,0 +1,134 @@
+from datetime import datetime, timedelta
+from unittest.mock import AsyncMock, create_autospec
+
+import pytest
+
+from apis.connector import RestConnector
+from apis.exceptions import ConnectorFails
+from conftest import FakeRepository
+from domain.models import Book
+from domain.refresher import BackgroundRefresher
+
+NOW = datetime(2024, 6, 1)
+
+
+def make_book(book_id: str, fetched_at=None, origin: str = 'Open Library API', **fields) -> Book:
+    return Book(
+        id=book_id,
+        title=fields.get('title', 'Fantastic Mr Fox'),
+        authors=['Roald Dahl'],
+        categories=[],
+        publication_date='1970-01-01',
+        editor=fields.get('editor', ''),
+        description=fields.get('description', ''),
+        origin=origin,
+        fetched_at=fetched_at,
+    )
+
+
+def make_client(origin: str = 'Open Library API'):
+    client = create_autospec(RestConnector, instance=True)
+    client.origin = origin
+    client.get_by_id = AsyncMock()
+
+    async def refresh(book):
+        return await client.get_by_id(book.id)
+
+    client.refresh = AsyncMock(side_effect=refresh)
+    return client
+
+
+def make_refresher(repository, clients, **kwargs) -> BackgroundRefresher:
+    return BackgroundRefresher(repository, clients, fresh_for=3600, clock=lambda: NOW, **kwargs)
+
+
+@pytest.mark.asyncio
+class TestBackgroundRefresher:
+
+    async def test_schedules_only_stale_books_with_known_origin(self):
+        refresher = make_refresher(FakeRepository(), [make_client()])
+
+        queued = refresher.schedule([
+            make_book('OL1W', fetched_at=NOW - timedelta(minutes=5)),
+            make_book('OL2W', fetched_at=NOW - timedelta(days=2)),
+            make_book('OL3W'),
+            make_book('local', origin='repository'),
+            make_book('OL2W', fetched_at=NOW - timedelta(days=2)),
+        ])
+
+        assert queued == 2
+        assert refresher.depth == 2
+
+    async def test_refresh_overwrites_stored_copy(self):
+        repository = FakeRepository()
+        stale = make_book('OL1W', fetched_at=NOW - timedelta(days=2))
+        await repository.save_many([stale])
+        client = make_client()
+        client.get_by_id.return_value = make_book('OL1W', description='New description')
+        refresher = make_refresher(repository, [client])
+
+        refresher.schedule([stale])
+        assert await refresher.refresh() == 1
+
+        stored = await repository.get_by_id('OL1W')
+        assert stored.description == 'New description'
+        assert stored.fetched_at == NOW
+        client.get_by_id.assert_awaited_once_with('OL1W')
+
+    async def test_refresh_keeps_fields_the_source_lacks(self):
+        repository = FakeRepository()
+        stale = make_book('OL1W', fetched_at=NOW - timedelta(days=2), editor='Puffin')
+        await repository.save_many([stale])
+        client = make_client()
+        client.get_by_id.return_value = make_book('OL1W', description='New description')
+        refresher = make_refresher(repository, [client])
+
+        refresher.schedule([stale])
+        assert await refresher.refresh() == 1
+
+        stored = await repository.get_by_id('OL1W')
+        assert stored.description == 'New description'
+        assert stored.editor == 'Puffin'
+
+    async def test_incomplete_upstream_record_keeps_stored_copy(self):
+        repository = FakeRepository()
+        stale = make_book('OL1W', fetched_at=NOW - timedelta(days=2))
+        await repository.save_many([stale])
+        client = make_client()
+        client.refresh = AsyncMock(side_effect=lambda book: book)
+        refresher = make_refresher(repository, [client])
+
+        refresher.schedule([stale])
+        assert await refresher.refresh() == 0
+
+        assert refresher.kept == 1
+        assert refresher.gone == 0
+        assert (await repository.get_by_id('OL1W')).fetched_at == stale.fetched_at
+
+    async def test_refresh_is_batched(self):
+        client = make_client()
+        client.get_by_id.side_effect = lambda book_id: make_book(book_id)
+        refresher = make_refresher(FakeRepository(), [client], batch_size=2)
+
+        refresher.schedule([make_book(f'OL{i}W') for i in range(5)])
+
+        assert [await refresher.refresh() for _ in range(4)] == [2, 2, 1, 0]
+
+    async def test_failed_refresh_is_not_retried_right_away(self):
+        repository = FakeRepository()
+        client = make_client()
+        client.get_by_id.side_effect = ConnectorFails()
+        refresher = make_refresher(repository, [client])
+        book = make_book('OL1W')
+
+        refresher.schedule([book])
+        assert await refresher.refresh() == 0
+        assert refresher.failed == 1
+
+        assert refresher.schedule([book]) == 0
+
+    async def test_max_stale(self):
+        refresher = make_refresher(FakeRepository(), [], max_stale=86400)
+
+        assert not refresher.is_expired(make_book('OL1W', fetched_at=NOW - timedelta(hours=2)))
+        assert refresher.is_expired(make_book('OL1W', fetched_at=NOW - timedelta(days=2)))
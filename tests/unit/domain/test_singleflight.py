@@ -0,0 +1,62 @@
+import asyncio
+
+import pytest
+
+from domain.singleflight import SingleFlight
+
+
+@pytest.mark.asyncio
+class TestSingleFlight:
+
+    async def test_concurrent_calls_share_one_execution(self):
+        inflight = SingleFlight()
+        calls = []
+
+        async def fetch():
+            calls.append(1)
+            await asyncio.sleep(0.01)
+            return 'book'
+
+        results = await asyncio.gather(*[inflight.do('key', fetch) for _ in range(10)])
+
+        assert results == ['book'] * 10
+        assert len(calls) == 1
+        assert len(inflight) == 0
+
+    async def test_waiters_receive_the_same_exception(self):
+        inflight = SingleFlight()
+
+        async def fetch():
+            await asyncio.sleep(0.01)
+            raise ValueError('boom')
+
+        results = await asyncio.gather(
+            inflight.do('key', fetch), inflight.do('key', fetch), return_exceptions=True
+        )
+
+        assert all(isinstance(result, ValueError) for result in results)
+
+    async def test_sequential_calls_run_again(self):
+        inflight = SingleFlight()
+        calls = []
+
+        async def fetch():
+            calls.append(1)
+            return len(calls)
+
+        assert await inflight.do('key', fetch) == 1
+        assert await inflight.do('key', fetch) == 2
+
+    async def test_cancelled_waiter_does_not_cancel_shared_call(self):
+        inflight = SingleFlight()
+
+        async def fetch():
+            await asyncio.sleep(0.02)
+            return 'book'
+
+        first = asyncio.ensure_future(inflight.do('key', fetch))
+        second = asyncio.ensure_future(inflight.do('key', fetch))
+        await asyncio.sleep(0)
+        first.cancel()
+
+        assert await second == 'book'
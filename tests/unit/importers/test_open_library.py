@@ -0,0 +1,111 @@
+import gzip
+import os
+import shutil
+
+import pytest
+
+from importers.open_library import (
+    Checkpoint, _init_worker, author_index, author_names, build_author_index, import_dump, parse_chunk,
+)
+
+FIXTURES = os.path.join(os.path.dirname(__file__), '..', '..', 'fixtures')
+WORKS = os.path.join(FIXTURES, 'ol_dump_works_sample.txt')
+AUTHORS = os.path.join(FIXTURES, 'ol_dump_authors_sample.txt')
+
+
+@pytest.fixture
+def gzipped_works(tmp_path):
+    path = str(tmp_path / 'works.txt.gz')
+    with open(WORKS, 'rb') as source, gzip.open(path, 'wb') as target:
+        shutil.copyfileobj(source, target)
+    return path
+
+
+@pytest.fixture
+def authors_index(tmp_path):
+    path = str(tmp_path / 'authors.sqlite3')
+    build_author_index(AUTHORS, path)
+    return path
+
+
+class TestAuthorIndex:
+
+    def test_names_in_order_without_unknown_keys(self, authors_index):
+        _init_worker(authors_index)
+
+        assert author_names(['/authors/OL34184A', '/authors/OL0A', None]) == ['Roald Dahl']
+
+    def test_built_next_to_the_dump_once(self, tmp_path):
+        dump = str(tmp_path / 'authors.txt')
+        shutil.copyfile(AUTHORS, dump)
+
+        path = author_index(dump)
+        built = os.path.getmtime(path)
+
+        assert path == f'{dump}.sqlite3'
+        assert author_index(dump) == path
+        assert os.path.getmtime(path) == built
+
+
+class TestParseChunk:
+
+    def test_maps_works_and_search_docs(self, authors_index):
+        _init_worker(authors_index)
+        with open(WORKS, 'rb') as dump:
+            documents, skipped = parse_chunk(dump.readlines())
+
+        assert [document['id'] for document in documents] == ['OL45804W', 'OL45883W', 'OL27448W']
+        # Undated work, redirect and truncated line
+        assert skipped == {'undated': 1, 'other_type': 1, 'invalid_json': 1}
+
+        fox = documents[0]
+        assert fox['authors'] == ['Roald Dahl']
+        assert fox['author_tokens'] == ['roald', 'dahl']
+        assert fox['description'] == 'A fox outwits three farmers.'
+        assert fox['origin'] == 'Open Library API'
+        assert fox['fetched_at'] is not None
+        assert documents[2]['editor'] == 'Allen & Unwin'
+
+    def test_unknown_authors_are_left_out(self):
+        _init_worker(None)
+        with open(WORKS, 'rb') as dump:
+            documents, _ = parse_chunk(dump.readlines()[:1])
+
+        assert documents[0]['authors'] == []
+
+
+@pytest.mark.asyncio
+class TestImportDump:
+
+    async def test_imports_in_batches_with_checkpoints(self, gzipped_works, authors_index, tmp_path):
+        batches, authors = [], []
+
+        async def write(documents):
+            batches.append([document['id'] for document in documents])
+            authors.extend(document['authors'] for document in documents)
+
+        checkpoint = Checkpoint(str(tmp_path / 'checkpoint'))
+        progress = await import_dump(
+            gzipped_works, write, checkpoint=checkpoint, authors_index=authors_index,
+            workers=2, batch_size=1, chunk_lines=2,
+        )
+
+        assert batches == [['OL45804W', 'OL45883W'], ['OL27448W']]
+        assert authors[0] == ['Roald Dahl']
+        assert progress.written == 3
+        assert progress.skipped == 3
+        assert progress.skipped_by_reason == {'undated': 1, 'other_type': 1, 'invalid_json': 1}
+        assert checkpoint.load() == 6
+
+    async def test_resumes_after_checkpoint(self, gzipped_works, tmp_path):
+        written = []
+
+        async def write(documents):
+            written.extend(document['id'] for document in documents)
+
+        checkpoint = Checkpoint(str(tmp_path / 'checkpoint'))
+        checkpoint.save(2)
+        await import_dump(gzipped_works, write, checkpoint=checkpoint, workers=1, chunk_lines=2)
+
+        assert written == ['OL27448W']
+        assert checkpoint.load() == 6
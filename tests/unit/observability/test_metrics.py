@@ -0,0 +1,100 @@
+import asyncio
+
+import pytest
+
+from apis.connector import outcome
+from apis.exceptions import ConnectorFails, ConnectorTimeout, ConnectorUnavailable
+from observability.metrics import Counter, Gauge, Histogram, Registry, timed
+
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+
+class TestMetrics:
+
+    def test_counter_children_are_cached_per_labels(self):
+        registry = Registry()
+        counter = Counter('lookups_total', 'Lookups.', ('result',), registry=registry)
+        counter.labels('hit').inc()
+        counter.labels('hit').inc(2)
+        counter.labels('miss').inc()
+
+        assert counter.labels('hit') is counter.labels('hit')
+        assert registry.render().splitlines() == [
+            '# HELP lookups_total Lookups.',
+            '# TYPE lookups_total counter',
+            'lookups_total{result="hit"} 3',
+            'lookups_total{result="miss"} 1',
+        ]
+
+    def test_labels_must_match_label_names(self):
+        counter = Counter('calls_total', 'Calls.', ('origin', 'status'), registry=Registry())
+        with pytest.raises(ValueError):
+            counter.labels('google')
+
+    def test_duplicate_names_are_rejected(self):
+        registry = Registry()
+        Counter('calls_total', 'Calls.', registry=registry)
+        with pytest.raises(ValueError):
+            Gauge('calls_total', 'Calls.', registry=registry)
+
+    def test_histogram_buckets_are_cumulative(self):
+        registry = Registry()
+        histogram = Histogram('duration_seconds', 'Durations.', ('route',), buckets=(0.1, 1), registry=registry)
+        for value in (0.05, 0.1, 0.5, 3):
+            histogram.labels('/books').observe(value)
+
+        assert registry.render().splitlines()[2:] == [
+            'duration_seconds_bucket{route="/books",le="0.1"} 2',
+            'duration_seconds_bucket{route="/books",le="1"} 3',
+            'duration_seconds_bucket{route="/books",le="+Inf"} 4',
+            'duration_seconds_sum{route="/books"} 3.65',
+            'duration_seconds_count{route="/books"} 4',
+        ]
+
+    def test_gauge_function_is_read_at_render(self):
+        registry = Registry()
+        depth = []
+        Gauge('depth', 'Depth.', registry=registry).set_function(lambda: len(depth))
+        depth.extend([1, 2])
+
+        assert 'depth 2' in registry.render().splitlines()
+
+    def test_label_values_are_escaped(self):
+        registry = Registry()
+        Counter('errors_total', 'Errors.', ('message',), registry=registry).labels('say "hi"\n').inc()
+
+        assert 'errors_total{message="say \\"hi\\"\\n"} 1' in registry.render()
+
+    def test_timed_observes_duration_and_counts_errors(self):
+        registry = Registry()
+        histogram = Histogram('op_seconds', 'Ops.', ('operation',), registry=registry)
+        errors = Counter('op_errors_total', 'Op errors.', ('operation',), registry=registry)
+
+        @timed(histogram, 'save', errors=errors)
+        async def save(fail):
+            if fail:
+                raise RuntimeError('down')
+            return 'saved'
+
+        assert run(save(False)) == 'saved'
+        with pytest.raises(RuntimeError):
+            run(save(True))
+
+        assert histogram.labels('save').count == 2
+        assert errors.labels('save').get() == 1
+
+
+class TestOutcome:
+
+    @pytest.mark.parametrize('error, expected', [
+        (None, '200'),
+        (ConnectorFails(status=503, retryable=True), '503'),
+        (ConnectorFails('reset'), 'error'),
+        (ConnectorTimeout(), 'timeout'),
+        (ConnectorUnavailable(), 'unavailable'),
+        (asyncio.CancelledError(), 'cancelled'),
+    ])
+    def test_labels(self, error, expected):
+        assert outcome(error) == expected
@@ -0,0 +1,208 @@
+import asyncio
+import logging
+import time
+
+import pytest
+from fastapi import Depends, FastAPI
+from fastapi.testclient import TestClient
+
+from observability.tracing import (
+    CLIENT, OTLPExporter, SamplingProfiler, Span, TracedRoute, Tracer, TracingMiddleware, _current,
+    current_span, format_breakdown, span, start_span, traced,
+)
+
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+
+def in_trace(coroutine_function):
+    async def wrapper():
+        root = Span('root')
+        token = _current.set(root)
+        try:
+            await coroutine_function()
+        finally:
+            _current.reset(token)
+            root.finish()
+        return root
+    return run(wrapper())
+
+
+class TestSpans:
+
+    def test_no_trace_is_a_noop(self):
+        with span('work') as current:
+            assert current is None
+        assert start_span('work') is None
+
+    def test_spans_nest_under_the_current_span(self):
+        @traced('lookup')
+        async def lookup():
+            with span('mongo', CLIENT, operation='find') as current:
+                current.set('rows', 2)
+            return current_span().name
+
+        async def handler():
+            assert await lookup() == 'lookup'
+
+        root = in_trace(handler)
+
+        [lookup_span] = root.children
+        [mongo_span] = lookup_span.children
+        assert lookup_span.parent_id == root.span_id
+        assert mongo_span.trace_id == root.trace_id
+        assert mongo_span.kind == CLIENT
+        assert mongo_span.attributes == {'operation': 'find', 'rows': 2}
+        assert mongo_span.end is not None
+
+    def test_concurrent_tasks_get_their_own_children(self):
+        async def fetch(name):
+            with span(name):
+                await asyncio.sleep(0)
+                with span(f'{name} read'):
+                    pass
+
+        async def handler():
+            await asyncio.gather(fetch('google'), fetch('open_library'))
+
+        root = in_trace(handler)
+
+        assert [child.name for child in root.children] == ['google', 'open_library']
+        assert [child.children[0].name for child in root.children] == ['google read', 'open_library read']
+
+    def test_errors_are_recorded(self):
+        async def handler():
+            with pytest.raises(ValueError):
+                with span('parse'):
+                    raise ValueError('bad date')
+
+        root = in_trace(handler)
+
+        assert root.children[0].error == 'ValueError: bad date'
+
+    def test_breakdown(self):
+        root = Span('GET /books/{book_id}')
+        child = root.child('mongo get_by_id', attributes={'rows': 1})
+        child.finish()
+        root.finish()
+
+        lines = format_breakdown(root).splitlines()
+
+        assert lines[0].startswith('GET /books/{book_id} +0.0ms ')
+        assert lines[1].startswith('  mongo get_by_id +')
+        assert lines[1].endswith('rows=1')
+        assert 'outside child spans' in lines[2]
+
+
+class TestSamplingProfiler:
+
+    def test_collects_collapsed_stacks_while_armed(self):
+        profiler = SamplingProfiler(interval=0.001)
+        profiler.arm(1)
+
+        def busy():
+            deadline = time.perf_counter() + 0.1
+            while time.perf_counter() < deadline:
+                pass
+
+        assert profiler.begin()
+        assert not profiler.begin()
+        busy()
+        profiler.end()
+
+        dump = profiler.dump()
+        assert dump
+        assert all(int(line.rsplit(' ', 1)[1]) >= 1 for line in dump.splitlines())
+        assert any('busy' in line for line in dump.splitlines())
+        assert profiler.remaining == 0 and profiler.active == 0
+
+
+class TestOTLPExporter:
+
+    def test_encode(self):
+        exporter = OTLPExporter('http://localhost:4318/v1/traces', service_name='books')
+        root = Span('GET /books')
+        child = root.child('attempt', attributes={'attempts': 2, 'origin': 'Google Books API'})
+        child.finish(TimeoutError())
+        root.finish()
+
+        payload = exporter.encode(list(root.walk()))
+
+        resource_spans = payload['resourceSpans'][0]
+        assert resource_spans['resource']['attributes'] == [
+            {'key': 'service.name', 'value': {'stringValue': 'books'}}
+        ]
+        encoded_root, encoded_child = resource_spans['scopeSpans'][0]['spans']
+        assert 'parentSpanId' not in encoded_root
+        assert encoded_child['parentSpanId'] == encoded_root['spanId']
+        assert len(encoded_child['traceId']) == 32 and len(encoded_child['spanId']) == 16
+        assert int(encoded_child['endTimeUnixNano']) >= int(encoded_child['startTimeUnixNano'])
+        assert {'key': 'attempts', 'value': {'intValue': '2'}} in encoded_child['attributes']
+        assert encoded_child['status'] == {'code': 2, 'message': 'TimeoutError'}
+
+    def test_drops_traces_beyond_max_pending(self):
+        exporter = OTLPExporter('http://localhost:4318/v1/traces', max_pending=2)
+        root = Span('GET /books')
+        root.child('mongo list')
+
+        exporter.submit(root)
+        exporter.submit(root)
+
+        assert len(exporter._pending) == 2
+        assert exporter.dropped == 2
+
+
+class TestTracingMiddleware:
+
+    @staticmethod
+    def make_app(tracer):
+        app = FastAPI()
+        app.router.route_class = TracedRoute
+        app.add_middleware(TracingMiddleware, tracer=tracer)
+
+        def dependency():
+            with span('dependency'):
+                return 'value'
+
+        @app.get('/items/{item_id}')
+        async def get_item(item_id: str, value: str = Depends(dependency)):
+            return {'id': item_id}
+
+        return app
+
+    def test_logs_slow_requests_with_their_breakdown(self, caplog):
+        tracer = Tracer(slow_seconds=0)
+        client = TestClient(self.make_app(tracer))
+
+        with caplog.at_level(logging.WARNING, logger='observability.tracing'):
+            assert client.get('/items/42').status_code == 200
+
+        [record] = caplog.records
+        message = record.getMessage()
+        assert 'GET /items/{item_id}' in message
+        assert '  dependency +' in message
+        assert '  endpoint get_item +' in message
+
+    def test_untraced_when_disabled(self):
+        tracer = Tracer()
+        seen = []
+        tracer.finish = seen.append
+        client = TestClient(self.make_app(tracer))
+
+        assert client.get('/items/42').status_code == 200
+        assert seen == []
+
+    def test_profiles_armed_requests_only(self):
+        tracer = Tracer()
+        finished = []
+        tracer.finish = finished.append
+        tracer.profiler.arm(1)
+        client = TestClient(self.make_app(tracer))
+
+        client.get('/items/1')
+        client.get('/items/2')
+
+        assert [root.attributes['http.status_code'] for root in finished] == [200]
+        assert finished[0].name == 'GET /items/{item_id}'
+        assert tracer.profiler.remaining == 0
@@ -0,0 +1,128 @@
+import asyncio
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from admission import AdmissionController, AdmissionMiddleware, Overloaded, RouteClass
+
+
+def controller(read_limit=1, search_limit=1, max_in_flight=10, max_queue=10, queue_timeout=1.0):
+    return AdmissionController(
+        [
+            RouteClass('read', read_limit, priority=0, max_queue=max_queue, queue_timeout=queue_timeout),
+            RouteClass('search', search_limit, priority=10, max_queue=max_queue, queue_timeout=queue_timeout),
+        ],
+        max_in_flight=max_in_flight,
+        retry_after=2,
+    )
+
+
+@pytest.mark.asyncio
+class TestAdmissionController:
+
+    async def test_admits_up_to_the_class_limit(self):
+        admission = controller(read_limit=2)
+        await admission.acquire('read')
+        await admission.acquire('read')
+        waiter = asyncio.ensure_future(admission.acquire('read'))
+        await asyncio.sleep(0)
+
+        assert not waiter.done()
+        assert admission.classes['read'].queued == 1
+
+        admission.release('read')
+        await waiter
+        assert admission.classes['read'].in_flight == 2
+        assert admission.classes['read'].queued == 0
+
+    async def test_classes_do_not_share_their_limits(self):
+        admission = controller()
+        await admission.acquire('search')
+        await asyncio.wait_for(admission.acquire('read'), 0.1)
+
+    async def test_rejects_when_the_queue_is_full(self):
+        admission = controller(max_queue=1)
+        await admission.acquire('search')
+        waiter = asyncio.ensure_future(admission.acquire('search'))
+        await asyncio.sleep(0)
+
+        with pytest.raises(Overloaded) as error:
+            await admission.acquire('search')
+
+        assert error.value.reason == 'queue_full'
+        assert error.value.retry_after == 2
+        waiter.cancel()
+
+    async def test_rejects_after_the_queue_timeout(self):
+        admission = controller(queue_timeout=0.01)
+        await admission.acquire('search')
+
+        with pytest.raises(Overloaded) as error:
+            await admission.acquire('search')
+
+        assert error.value.reason == 'timeout'
+        assert admission.classes['search'].queued == 0
+        assert admission.classes['search'].rejected == 1
+
+    async def test_reads_are_admitted_before_searches(self):
+        admission = controller(read_limit=5, search_limit=5, max_in_flight=1)
+        await admission.acquire('search')
+        order = []
+
+        async def request(name):
+            await admission.acquire(name)
+            order.append(name)
+
+        search = asyncio.ensure_future(request('search'))
+        await asyncio.sleep(0)
+        read = asyncio.ensure_future(request('read'))
+        await asyncio.sleep(0)
+
+        admission.release('search')
+        await read
+        assert order == ['read']
+        assert not search.done()
+
+        admission.release('read')
+        await search
+        assert order == ['read', 'search']
+
+    async def test_cancelled_waiters_leave_the_queue(self):
+        admission = controller()
+        await admission.acquire('read')
+        waiter = asyncio.ensure_future(admission.acquire('read'))
+        await asyncio.sleep(0)
+
+        waiter.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+        admission.release('read')
+
+        assert admission.classes['read'].queued == 0
+        assert admission.classes['read'].in_flight == 0
+        assert admission.in_flight == 0
+
+
+class TestAdmissionMiddleware:
+
+    def test_sheds_with_503_and_retry_after(self):
+        admission = controller(queue_timeout=0.01)
+        app = FastAPI()
+        app.add_middleware(
+            AdmissionMiddleware, controller=admission, classify=lambda method, path: 'search'
+        )
+
+        @app.get('/books/search')
+        async def search():
+            return []
+
+        client = TestClient(app)
+        assert client.get('/books/search').status_code == 200
+        assert admission.in_flight == 0
+
+        asyncio.run(admission.acquire('search'))
+        response = client.get('/books/search')
+
+        assert response.status_code == 503
+        assert response.headers['retry-after'] == '2'